@@ -4,45 +4,172 @@
 Process a mix of verbatim and processed content.
 """
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
 import json
 import logging
 import os
+import pickle
 import re
-import shutil
 import sys
 
 import frontmatter  # python-frontmatter
+import liquid
 from liquid import CachingFileSystemLoader, Environment, Mode
 import markdown
-from markdown.extensions.tables import TableExtension
 
+from eggcyc.build_graph import BuildGraph
+from eggcyc.cache import ResponseCache
+from eggcyc.dev_server import DevServer
+from eggcyc.files import atomic_write, atomic_write_bytes, copy_file, file_sha256, write_if_changed
 from eggcyc.trees import Trees
+from eggcyc.watch import FileWatcher
+
+
+_include_cache = {}  # include filename -> ((size, mtime_ns), content)
+
+
+class CachingEnvironment(Environment):
+    """Liquid environment that keeps parsed templates in an on-disk cache.
+
+    Parse trees are pickled to cache_dir in files named by a hash of the
+    template source, the Liquid version, the Python version and the
+    environment settings that affect parsing (see config_digest()), so a
+    new process does not parse templates again unless they have changed.
+
+    Loading a cached parse tree unpickles it, which can run arbitrary code,
+    so cache_dir must be writable only by the user running the build. The
+    default template_cache/ in the working tree is excluded from git and
+    must never be filled from elsewhere, e.g. copied from another checkout.
+    """
+
+    def __init__(self, cache_dir=None, **kwargs):
+        """Initialize CachingEnvironment object.
+
+        Arguments:
+            cache_dir (str) - directory for cached parse trees, created if
+                necessary, None to not cache.
+            **kwargs - passed to liquid.Environment.
+        """
+        self.cache_dir = cache_dir
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        super().__init__(**kwargs)
+
+    def config_digest(self):
+        """SHA-256 hex digest of the environment settings that affect parsing.
+
+        Covers delimiters, whitespace and comment options, tolerance mode,
+        undefined type, the registered tags and filters, and the loader
+        settings, so a change to any of them doesn't reuse parse trees made
+        with the old settings.
+        """
+        def qualname(obj):
+            if not hasattr(obj, "__qualname__"):
+                obj = type(obj)
+            return "%s.%s" % (obj.__module__, obj.__qualname__)
+
+        config = {
+            "delimiters": [self.tag_start_string, self.tag_end_string, self.statement_start_string,
+                           self.statement_end_string, self.comment_start_string, self.comment_end_string],
+            "strip_tags": self.strip_tags,
+            "template_comments": self.template_comments,
+            "mode": int(self.mode),
+            "undefined": qualname(self.undefined),
+            "strict_filters": self.strict_filters,
+            "autoescape": self.autoescape,
+            "tags": {name: qualname(tag) for name, tag in self.tags.items()},
+            "filters": {name: qualname(fn) for name, fn in self.filters.items()},
+            "loader": None if self.loader is None else {
+                "type": qualname(self.loader),
+                "search_path": [str(path) for path in getattr(self.loader, "search_path", [])],
+                "encoding": getattr(self.loader, "encoding", None),
+                "ext": getattr(self.loader, "ext", None),
+            },
+        }
+        data = json.dumps(config, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def parse(self, source):
+        """Parse template source, using the on-disk cache if possible."""
+        if self.cache_dir is None:
+            return super().parse(source)
+        key = "liquid %s python %s config %s\n%s" % (liquid.__version__, sys.version, self.config_digest(), source)
+        filename = os.path.join(self.cache_dir, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".pickle")
+        try:
+            with open(filename, "rb") as fh:
+                return pickle.load(fh)
+        except FileNotFoundError:
+            pass
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            logging.warning("Ignoring bad cached template %s (%s)", filename, str(e))
+        tree = super().parse(source)
+        try:
+            atomic_write_bytes(filename, pickle.dumps(tree))
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            logging.debug("Cannot cache parsed template (%s)", str(e))
+        return tree
 
 
 class FileProcessor():
     """Class to process a single file, whether it be render or copy.
 
     Keeps track of Liquid rendering environment (including cache) and
-    also counts the number and types of updates made.
+    also counts the number and types of updates made. If a BuildGraph is
+    given then pages are rendered only when their inputs have changed.
+
+    If self.pending is set to a list then pages to be rendered are added to
+    it instead of being rendered, so that they can be rendered in parallel
+    by SiteProcessor.render_pending().
     """
 
-    def __init__(self, src_dir, config):
+    INCLUDE_REGEX = re.compile(r"""\{%\s*include\s+"(\S+)"\s*%\}""")
+    # Might be nice to use newline-to-break 'nl2br' extension for new
+    # material but I have a whole bunc of old stuff that expects
+    # newlines not to be significant.
+    MARKDOWN_EXTENSIONS = ["toc", "smarty", "attr_list", "tables"]
+    MARKDOWN_EXTENSION_CONFIGS = {"smarty": {
+        "substitutions": {
+            "left-single-quote": "‘",
+            "right-single-quote": "’",
+            "left-double-quote": "“",
+            "right-double-quote": "”",
+            "ellipsis": "…",
+            "ndash": "–"
+        }
+    }}
+
+    def __init__(self, src_dir, config, build_graph=None, markdown_cache=None, template_cache_dir=None):
         """Initialize FileProcessor object.
 
         src_dir - Source directory for root of directory structure.
+        build_graph - BuildGraph used to skip rendering of pages that are
+            up to date, None to always render.
+        markdown_cache - ResponseCache used to keep HTML rendered from
+            Markdown between builds, None to not cache.
+        template_cache_dir - directory to keep parsed templates in between
+            builds, None to not cache.
         """
         self.src_dir = src_dir
+        self.build_graph = build_graph
+        self.markdown_cache = markdown_cache if markdown_cache is not None else ResponseCache(filename=None)
+        self._markdown = None  # Markdown converter, created on first use
         # Extract what we need from config
         self.files_to_ignore = config["files_to_ignore"]
         self.files_to_ignore_regex = re.compile(config["files_to_ignore_regex"])
         self.site_variables = config["site_variables"]
         self.templates_dir = os.path.join(src_dir, "_templates")
         self.includes_dir = os.path.join(src_dir, "_includes")
+        self.template_cache_dir = template_cache_dir
         self.exts_to_scan = [".md", ".html"]
         self.copied = 0
         self.processed = 0
         self.unchanged = 0
         self.new_dst_files = set()  # All files wanted under dst_dir
+        self.changed_dst_files = set()  # Files written under dst_dir
+        self.produced_dst_files = set()  # Files rendered or copied, whether changed or not
+        self.pending = None  # List of ((dst_filename, md, template), inputs, source) to render later
+        self._template_files = {}  # template name -> list of template files used
         self.setup_liquid()
 
     def setup_liquid(self):
@@ -50,9 +177,67 @@ class FileProcessor():
 
         Call this again if the site variables are updated.
         """
-        # Set up liquid template engie
-        loader = CachingFileSystemLoader(self.templates_dir, ext=".html", cache_size=100)
-        self.liquid_env = Environment(loader=loader, tolerance=Mode.STRICT, globals={"site": self.site_variables})
+        # Set up liquid template engie, with an in-memory cache big enough
+        # for all the templates
+        num_templates = len(os.listdir(self.templates_dir)) if os.path.isdir(self.templates_dir) else 0
+        loader = CachingFileSystemLoader(self.templates_dir, ext=".html", cache_size=max(100, num_templates))
+        self.liquid_env = CachingEnvironment(cache_dir=self.template_cache_dir, loader=loader, tolerance=Mode.STRICT,
+                                             globals={"site": self.site_variables})
+        self._template_files = {}
+
+    def reset(self):
+        """Reset counts and cached dependency data before another build."""
+        self.copied = 0
+        self.processed = 0
+        self.unchanged = 0
+        self.new_dst_files = set()
+        self.changed_dst_files = set()
+        self.produced_dst_files = set()
+        self._template_files = {}
+        if self.build_graph is not None:
+            self.build_graph.reset()
+
+    def template_files(self, name):
+        """List of template files used to render with template name.
+
+        The template file itself and, recursively, any templates it includes.
+
+        Arguments:
+            name (str) - template name, e.g. "page".
+        """
+        if name not in self._template_files:
+            filenames = []
+            names = [name]
+            while names:
+                filename = os.path.join(self.templates_dir, names.pop() + ".html")
+                if filename in filenames:
+                    continue
+                filenames.append(filename)
+                if os.path.exists(filename):
+                    with open(filename, "r", encoding="utf-8") as fh:
+                        names.extend(re.findall(r"""\{%-?\s*include\s+["'](\S+?)["']""", fh.read()))
+            self._template_files[name] = filenames
+        return self._template_files[name]
+
+    def is_up_to_date(self, dst_filename, inputs, md, template):
+        """True if dst_filename need not be rendered again.
+
+        Arguments:
+            dst_filename (str) - output file.
+            inputs (list) - input files other than templates.
+            md (dict) - metadata context for this page.
+            template (str) - template name.
+        """
+        if self.build_graph is None:
+            return False
+        inputs = inputs + self.template_files(template)
+        return self.build_graph.is_current(dst_filename, inputs, [md, self.site_variables, template])
+
+    def record_build(self, dst_filename, inputs, md, template, source=None):
+        """Record inputs of dst_filename in the build graph, see is_up_to_date()."""
+        if self.build_graph is not None:
+            inputs = inputs + self.template_files(template)
+            self.build_graph.record(dst_filename, inputs, [md, self.site_variables, template], source=source)
 
     def ignore_file(self, filename):
         """File should be ignored if True.
@@ -68,7 +253,7 @@ class FileProcessor():
             return True
         return False
 
-    def extract_frontmatter_and_content(self, filename, md):
+    def extract_frontmatter_and_content(self, filename, md, includes=None):
         """Extract frontmatter and content.
 
         Frontmatter is Jeklyll styles, see https://jekyllrb.com/docs/front-matter/.
@@ -77,7 +262,8 @@ class FileProcessor():
 
         The main content (after the frontmatter) is returned in md["content"].
         This content will be parsed to support {%include "file_to_include" %} where
-        _includes/file_to_include must exist with the source directory.
+        _includes/file_to_include must exist with the source directory. If
+        includes is a list then the names of included files are appended.
 
         Will return True if there is frontmatter (or it is empty), else False.
         """
@@ -91,10 +277,8 @@ class FileProcessor():
         except Exception as e:  # pylint: disable=broad-exception-caught
             logging.warning("Error - problem reading frontmatter from %s, will treat as if file had none (%s)", filename, e)
             return False
-        # Look for includes in content
-        subs = {}
-        for match in re.finditer(r"""\{%\s*include\s+"(\S+)"\s*%\}""", content):
-            full_match = match.group(0)
+
+        def expand_include(match):
             filename = match.group(1)
             print("Found %s %s" % (match.group(0), match.group(1)))
             # Do a bit of a sanity check on filename
@@ -105,45 +289,68 @@ class FileProcessor():
             if not os.path.exists(filename):
                 logging.error("Cannot include %s - file doesn't exist", filename)
                 sys.exit(1)
-            if full_match not in subs:
-                with open(filename, "r", encoding="utf-8") as fh:
-                    subs[full_match] = fh.read()
-            # Now make the substitutions
-            #
-            # Warning - this has an error mode of making an additional sub into
-            # already substituted content. The number of occurrances is limited to
-            # the number of substitutions so it doesn't seem dangerous.
-            for full_match, substitition in subs.items():
-                content = content.replace(full_match, substitition)
+            if includes is not None and filename not in includes:
+                includes.append(filename)
+            return self.read_include(filename)
+
+        # Expand includes in content in one pass so that included text is
+        # not itself scanned for includes
+        content = self.INCLUDE_REGEX.sub(expand_include, content)
         md["content"] = content
         return len(fm.metadata) > 0
 
+    def read_include(self, filename):
+        """Content of include file, cached.
+
+        The cache is shared by all FileProcessor objects in the process and
+        an entry is used only while the file size and modification time are
+        unchanged, so large includes are read once per build rather than
+        once for each page that uses them.
+
+        Arguments:
+            filename (str) - path of file in includes directory.
+
+        Returns:
+            str - file content.
+        """
+        stat = os.stat(filename)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        cached = _include_cache.get(filename)
+        if cached is None or cached[0] != signature:
+            with open(filename, "r", encoding="utf-8") as fh:
+                cached = (signature, fh.read())
+            _include_cache[filename] = cached
+        return cached[1]
+
     def md_to_html(self, content):
         """Render the input markdown to HTML.
 
+        The HTML is cached in self.markdown_cache keyed by the content and
+        the Markdown version and configuration, so unchanged Markdown is
+        not converted again.
+
         Aguments:
             content (str) - string of markdown input content.
 
         Returns:
             str - HTML content created from rendering markdown.
         """
-        # Might be nice to use newline-to-break 'nl2br' extension for new
-        # material but I have a whole bunc of old stuff that expects
-        # newlines not to be significant.
-        html = markdown.markdown(
-            content,
-            extensions=["toc", "smarty", "attr_list", TableExtension(), ],
-            extension_configs={"smarty": {
-                "substitutions": {
-                    "left-single-quote": "‘",
-                    "right-single-quote": "’",
-                    "left-double-quote": "“",
-                    "right-double-quote": "”",
-                    "ellipsis": "…",
-                    "ndash": "–"
-                }
-            }})
-        return html
+        return self.markdown_cache.fetch(
+            "markdown:" + markdown.__version__,
+            {"extensions": self.MARKDOWN_EXTENSIONS, "extension_configs": self.MARKDOWN_EXTENSION_CONFIGS,
+             "content": content},
+            lambda: self.convert_markdown(content))
+
+    def convert_markdown(self, content):
+        """Convert markdown to HTML with a reused converter.
+
+        Setting up the extensions is much of the work of a conversion so
+        one converter is kept and reset between documents.
+        """
+        if self._markdown is None:
+            self._markdown = markdown.Markdown(extensions=self.MARKDOWN_EXTENSIONS,
+                                               extension_configs=self.MARKDOWN_EXTENSION_CONFIGS)
+        return self._markdown.reset().convert(content)
 
     def process_file(self, filename, dst_root, dst_name, md=None):
         """Check one file and process, copy or ignore as necessary.
@@ -166,31 +373,56 @@ class FileProcessor():
                 md["page"] = {}
             md["page"]["layout"] = "page"
             md["page"]["source_format"] = ext
-            if self.extract_frontmatter_and_content(filename, md):
+            includes = []
+            if self.extract_frontmatter_and_content(filename, md, includes):
                 # If there is frontmatter then render
-                self.render(filename, dst_root, dst_name, md)
+                self.render(filename, dst_root, dst_name, md, inputs=[filename] + includes)
                 return
         # We didn't ignore or render, so copy
         self.copy(filename, dst_root, dst_name)
 
+    def file_hash(self, filename):
+        """SHA-256 hex digest of the content of filename."""
+        if self.build_graph is not None:
+            return self.build_graph.file_hash(filename)
+        return file_sha256(filename)
+
     def copy(self, src_filename, dst_root, dst_name):
-        """Copy one file from the source to destination tree."""
+        """Copy one file from the source to destination tree.
+
+        The file is copied only if the content differs, which is checked
+        with the content hash of the source. With a build graph the source
+        is hashed only if its size or modification time changed, and the
+        destination is not hashed if the graph shows it is the same file
+        copied last time. Copies are reflinks where supported.
+        """
         dst_filename = os.path.normpath(os.path.join(dst_root, dst_name))
         if not os.path.exists(dst_root):
             os.makedirs(dst_root)
         # Keep a record that we want this file under dst_dir
         self.new_dst_files.add(dst_filename)
-        if (os.path.exists(dst_filename)
-                and os.path.getsize(src_filename) == os.path.getsize(dst_filename)
-                and os.path.getmtime(src_filename) <= os.path.getmtime(dst_filename)):
+        src_hash = self.file_hash(src_filename)
+        entry = self.build_graph.outputs.get(dst_filename) if self.build_graph is not None else None
+        if (entry is not None and entry["inputs"].get(src_filename) == src_hash
+                and self.build_graph.is_unmodified(dst_filename)):
+            logging.info("Unchanged %s -> %s", src_filename, dst_filename)
+            self.unchanged += 1
+            return
+        if (os.path.exists(dst_filename) and os.path.getsize(src_filename) == os.path.getsize(dst_filename)
+                and file_sha256(dst_filename) == src_hash):
             logging.info("Unchanged %s -> %s", src_filename, dst_filename)
             self.unchanged += 1
         else:
             logging.info("Copying %s -> %s", src_filename, dst_filename)
-            shutil.copy2(src_filename, dst_filename)
+            copy_file(src_filename, dst_filename)
+            self.changed_dst_files.add(dst_filename)
             self.copied += 1
+        # Record the copy, size and modification time are recorded after the build
+        self.produced_dst_files.add(dst_filename)
+        if self.build_graph is not None:
+            self.build_graph.record(dst_filename, [src_filename], None, source=src_filename)
 
-    def render(self, src_filename, dst_root, dst_name, md):
+    def render(self, src_filename, dst_root, dst_name, md, inputs=None):
         """Render source to HTML in dst_root.
 
         Parameters:
@@ -199,6 +431,8 @@ class FileProcessor():
         * dst_name - file name of output, will be adjusted to have .html extension
         * md - metadata context for this page
             md["page"]["source_format"] either ".md" or ".html"
+        * inputs - files the page is built from (source and includes), the
+            layout templates are added to these for the build graph
         """
         dst_name = os.path.splitext(dst_name)[0] + ".html"  # Replace ext with .html
         dst_filename = os.path.normpath(os.path.join(dst_root, dst_name))
@@ -206,21 +440,16 @@ class FileProcessor():
         self.new_dst_files.add(dst_filename)
         if not os.path.exists(dst_root):
             os.makedirs(dst_root)
+        inputs = inputs if inputs is not None else [src_filename]
+        layout = md["page"]["layout"]
+        if self.is_up_to_date(dst_filename, inputs, md, layout):
+            logging.info("Unchanged %s -> %s", src_filename, dst_filename)
+            self.unchanged += 1
+            return
         logging.warning("Rendering %s -> %s", src_filename, dst_filename)
-        # FIXME - Would need to check template dates in order to safely do this
-        # if (os.path.exists(dst_filename)
-        #        and os.path.getmtime(src_filename) < os.path.getmtime(dst_filename)):
-        #    logging.info("Unchanged %s -> %s", src_filename, dst_filename)
-        #    self.unchanged += 1
-        #    return
-        if md["page"]["source_format"] == ".md":
-            md["content"] = self.md_to_html(md["content"])
-        template = self.liquid_env.get_template(md["page"]["layout"])
-        with open(dst_filename, "w", encoding="utf-8") as fh:
-            fh.write(template.render(**md))
-        self.processed += 1
+        self.queue_or_render_page(dst_filename, inputs, md, layout, source=src_filename)
 
-    def render_md_page(self, dst_root, dst_name, md, template="gallery"):
+    def render_md_page(self, dst_root, dst_name, md, template="gallery", inputs=None):
         """Render content in md to HTML in dst_root.
 
         Arguments:
@@ -229,6 +458,8 @@ class FileProcessor():
             md - metadata context for this page
                md["page"]["source_format"] either ".md" or ".html"
             template - template to render with
+            inputs - data files used for the page (e.g. photos), for the
+               build graph
         """
         dst_name = os.path.splitext(dst_name)[0] + ".html"  # Replace ext with .html
         dst_filename = os.path.normpath(os.path.join(dst_root, dst_name))
@@ -237,13 +468,63 @@ class FileProcessor():
         self.new_dst_files.add(dst_filename)
         if not os.path.exists(dst_path):
             os.makedirs(dst_path)
+        inputs = inputs if inputs is not None else []
+        if self.is_up_to_date(dst_filename, inputs, md, template):
+            logging.info("Unchanged %s", dst_filename)
+            self.unchanged += 1
+            return
         logging.warning("Rendering %s", dst_filename)
+        self.queue_or_render_page(dst_filename, inputs, md, template)
+
+    def queue_or_render_page(self, dst_filename, inputs, md, template, source=None):
+        """Render page now, or add it to self.pending if that is a list.
+
+        The page is recorded in the build graph only once it has been
+        written, see page_written().
+        """
+        if self.pending is not None:
+            self.pending.append(((dst_filename, md, template), inputs, source))
+        else:
+            written = self.render_page(dst_filename, md, template)
+            self.page_written(dst_filename, inputs, md, template, source, written)
+        self.processed += 1
+
+    def page_written(self, dst_filename, inputs, md, template, source, written):
+        """Record page dst_filename after it has been successfully rendered.
+
+        Arguments:
+            dst_filename (str) - output file.
+            inputs (list) - input files other than templates.
+            md (dict) - metadata context for this page.
+            template (str) - template name.
+            source (str) - source file name, None for generated pages.
+            written (bool) - True if the content of dst_filename changed.
+        """
+        self.record_build(dst_filename, inputs, md, template, source=source)
+        self.produced_dst_files.add(dst_filename)
+        if written:
+            self.changed_dst_files.add(dst_filename)
+
+    def render_page(self, dst_filename, md, template):
+        """Render md with template and write dst_filename.
+
+        Arguments:
+            dst_filename - output file, its directory must exist
+            md - metadata context for this page, md["content"] is converted
+               from Markdown if md["page"]["source_format"] is ".md"
+            template - template to render with
+
+        Returns:
+            bool - True if dst_filename was written, False if it already had
+                the rendered content and so was left alone.
+        """
         if md["page"]["source_format"] == ".md" and "content" in md:
-            md["content"] = self.md_to_html(md["content"])
+            md = dict(md, content=self.md_to_html(md["content"]))  # Leave md as recorded in build graph
         template = self.liquid_env.get_template(template)
-        with open(dst_filename, "w", encoding="utf-8") as fh:
-            fh.write(template.render(**md))
-        self.processed += 1
+        if not write_if_changed(dst_filename, template.render(**md).encode("utf-8")):
+            logging.info("Unchanged content %s", dst_filename)
+            return False
+        return True
 
     def stats(self):
         """Statistics about files copied, processed, etc..
@@ -254,14 +535,73 @@ class FileProcessor():
         return "%d copied, %d processed, %d unchanged" % (self.copied, self.processed, self.unchanged)
 
 
+class WorkerMarkdownCache(ResponseCache):
+    """Markdown cache for render worker processes that never writes.
+
+    Workers read the cache but new entries are kept in self.new_entries and
+    returned to the parent process, which does all the writes, so that
+    workers don't contend to write to the same SQLite file.
+    """
+
+    def __init__(self, filename):
+        """Initialize WorkerMarkdownCache reading from filename."""
+        super().__init__(filename=filename, ttl=None)
+        self.new_entries = []  # (endpoint, params, value) not yet written
+
+    def put(self, endpoint, params, value, fetched=None):
+        """Keep new entry for the parent process to write."""
+        self.new_entries.append((endpoint, params, value))
+
+    def take_new_entries(self):
+        """Return and clear new entries."""
+        entries, self.new_entries = self.new_entries, []
+        return entries
+
+
+_worker_fp = None  # FileProcessor in each render worker process
+
+
+def _init_render_worker(src_dir, config, markdown_cache_filename, template_cache_dir):
+    """Set up FileProcessor in a render worker process.
+
+    Workers only read the markdown cache, see WorkerMarkdownCache.
+    """
+    global _worker_fp  # pylint: disable=global-statement
+    markdown_cache = WorkerMarkdownCache(markdown_cache_filename) if markdown_cache_filename else None
+    _worker_fp = FileProcessor(src_dir=src_dir, config=config, markdown_cache=markdown_cache,
+                               template_cache_dir=template_cache_dir)
+
+
+def _render_page_in_worker(page):
+    """Render one (dst_filename, md, template) page in a worker process.
+
+    Returns:
+        tuple - (written, new_entries) where written is the result of
+            render_page() and new_entries are new markdown cache entries.
+    """
+    written = _worker_fp.render_page(*page)
+    cache = _worker_fp.markdown_cache
+    return written, cache.take_new_entries() if isinstance(cache, WorkerMarkdownCache) else []
+
+
 class SiteProcessor():
     """Class to handle processing of an entire site.
 
     Keeps counts etc. as it goes through.
     """
 
-    def __init__(self, src_dir, dst_dir, config):
-        """Initialize SiteProcessor object."""
+    def __init__(self, src_dir, dst_dir, config, build_graph=None, jobs=1, markdown_cache=None,
+                 template_cache_dir=None, changes_filename=None):
+        """Initialize SiteProcessor object.
+
+        If build_graph is given then only pages with changed inputs are
+        rendered, see FileProcessor, and it is used as the manifest of files
+        owned by the build. If jobs is more than 1 then pages are rendered
+        in parallel by that many processes. The markdown_cache and
+        template_cache_dir are passed to FileProcessor. If changes_filename
+        is given then a list of changed and removed files is written to it
+        after each build.
+        """
         self.src_dir = src_dir
         self.dst_dir = dst_dir
         self.config = config
@@ -269,44 +609,83 @@ class SiteProcessor():
         self.dirs_to_ignore_regex = re.compile(config["dirs_to_ignore_regex"])
         self.root_dirs_to_ignore = config["root_dirs_to_ignore"]
         self.site_variables = config["site_variables"]
-        self.fp = FileProcessor(src_dir=self.src_dir, config=config)
+        self.build_graph = build_graph
+        self.jobs = jobs
+        self.fp = FileProcessor(src_dir=self.src_dir, config=config, build_graph=build_graph,
+                                markdown_cache=markdown_cache, template_cache_dir=template_cache_dir)
+        self.changes_filename = changes_filename
         self.old_dst_files = set()
+        self.removed_dst_files = set()
         self.removed = 0
 
     def scan_dst(self):
-        """Scan destination directory returning all relevant file names.
+        """Get the names of all files under dst_dir from previous builds.
 
-        Store a list of all files under self.dst_dir so that we can later
-        check against was added or didn't need to be updated using the
-        cleanup_dst() method.
+        Store the set of files in the build graph manifest so that we can
+        later check against was added or didn't need to be updated using
+        the cleanup_dst() method. Files not written by the build (e.g.
+        photos) are not in the manifest, so are never considered.
         """
-        filenames = set()
-        for root, dirs, files in os.walk(self.dst_dir):
-            for file in files:
-                if not self.fp.ignore_file(file):
-                    logging.debug("scan_dst: Adding %s", file)
-                    filenames.add(os.path.join(root, file))
-            for dir in dirs.copy():  # copy() so loop not messed up by removes
-                if root == self.dst_dir and dir in self.root_dirs_to_ignore:
-                    logging.debug("scan_dst: Ignoring root dir %s", os.path.join(root, dir))
-                    dirs.remove(dir)
-                if dir in self.dirs_to_ignore or self.dirs_to_ignore_regex.search(dir):
-                    logging.debug("scan_dst: Ignoring dir %s", os.path.join(root, dir))
-                    dirs.remove(dir)
-        logging.info("Scanned %d files in dst dir", len(filenames))
-        self.old_dst_files = filenames
+        self.old_dst_files = set() if self.build_graph is None else set(self.build_graph.outputs)
+        logging.info("Have %d files in dst dir from previous builds", len(self.old_dst_files))
 
     def cleanup_dst(self):
         """Clean outdated file from the destination tree.
 
-        Compare the sets of filenames that were present in the dst_dir
-        before the build, with those that were either written or would have
-        been written if not already up-to-date.
+        Compare the sets of filenames that were written by previous builds,
+        with those that were either written or would have been written if
+        not already up-to-date. Old files are deleted only if they are
+        under dst_dir and have not been modified since they were written.
+        Files not deleted are kept in the manifest so that they are
+        considered again by the next build.
+        """
+        dst_dir = os.path.abspath(self.dst_dir)
+        self.removed_dst_files = set()
+        for dst_filename in sorted(self.old_dst_files - self.fp.new_dst_files):
+            if os.path.commonpath([dst_dir, os.path.abspath(dst_filename)]) != dst_dir:
+                logging.warning("Not deleting old file %s outside %s", dst_filename, self.dst_dir)
+                continue
+            elif not os.path.exists(dst_filename):
+                logging.info("Old file %s already gone", dst_filename)
+            elif not self.build_graph.is_unmodified(dst_filename):
+                logging.warning("Not deleting old file %s as modified since built", dst_filename)
+                continue
+            else:
+                logging.warning("Deleting old file %s", dst_filename)
+                os.remove(dst_filename)
+                self.removed_dst_files.add(dst_filename)
+                self.removed += 1
+            self.build_graph.remove(dst_filename)
+
+    def update_manifest(self):
+        """Record produced files in the manifest, write it and the changes file.
+
+        The size and modification time are recorded for every file rendered
+        or copied, including those left alone because the content was the
+        same, so that they can be safely deleted when no longer produced.
+        self.fp.changed_dst_files is used only for the list of changes.
+        """
+        if self.build_graph is not None:
+            for dst_filename in self.fp.produced_dst_files:
+                self.build_graph.update_stat(dst_filename)
+            self.build_graph.write()
+        if self.changes_filename is not None:
+            self.write_changes(self.changes_filename)
+
+    def write_changes(self, filename):
+        """Write JSON list of files changed and removed by the build.
+
+        Paths are relative to dst_dir, for use by deploy tools that upload
+        only changes.
+
+        Arguments:
+            filename (str) - file to write.
         """
-        for dst_filename in self.old_dst_files - self.fp.new_dst_files:
-            logging.info("Would delete old file %s", dst_filename)
-            # os.remove(dst_filename)
-            # self.removed += 1
+        changes = {"changed": sorted(os.path.relpath(f, self.dst_dir) for f in self.fp.changed_dst_files),
+                   "removed": sorted(os.path.relpath(f, self.dst_dir) for f in self.removed_dst_files)}
+        atomic_write(filename, json.dumps(changes, indent=2))
+        logging.info("Wrote %d changed and %d removed files to %s",
+                     len(changes["changed"]), len(changes["removed"]), filename)
 
     def process_file(self, file):
         """Scan one source file in given directory under src_dir.
@@ -377,7 +756,7 @@ class SiteProcessor():
                 corresponding egg page for that species
         """
         logging.warning("\n\n############# build_species_pages...")
-        trees = Trees().load_tree_list()
+        trees = Trees().load_tree_list(snapshot=True)
         species_pages = {}   # species -> species_page
         for species in trees:
             page = self.species_page(trees, species)
@@ -395,7 +774,7 @@ class SiteProcessor():
             logging.debug(">>> got %s eggs", eggs)
             # Now build page
             common_name = trees[species]["common_name"]
-            md = {"page": trees[species]}
+            md = {"page": dict(trees[species])}  # Don't modify the shared snapshot entry
             md["page"]["source_format"] = ".md"
             md["page"]["title"] = common_name
             md["page"]["path_to_root"] = "../"  # so that we can keep relative links
@@ -406,7 +785,8 @@ class SiteProcessor():
                 figures += '  <figcaption>%s %s</figcaption>\n' % (common_name, egg)
                 figures += "</figure>\n"
             md["figures"] = figures
-            self.fp.render_md_page(self.dst_dir, page, md)
+            self.fp.render_md_page(self.dst_dir, page, md,
+                                   inputs=[os.path.join(self.dst_dir, egg) for egg in eggs])
             species_pages[species] = page
         #
         # And now write the species.html page
@@ -423,14 +803,76 @@ class SiteProcessor():
         self.fp.render_md_page(self.dst_dir, "species.html", md, template="species")
         return species_pages
 
+    def render_pending(self):
+        """Render pages queued in self.fp.pending using a process pool.
+
+        The pages were already counted by self.fp, each worker process has
+        its own FileProcessor that does just the rendering. Each page is
+        recorded in the build graph as its result comes back, so a page
+        that fails to render is not recorded as built.
+        """
+        pending, self.fp.pending = self.fp.pending, None
+        if not pending:
+            return
+        logging.warning("Rendering %d pages with %d jobs", len(pending), self.jobs)
+        chunksize = max(1, len(pending) // (4 * self.jobs))
+        with ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_render_worker,
+                                 initargs=(self.src_dir, self.config, self.fp.markdown_cache.filename,
+                                           self.fp.template_cache_dir)) as executor:
+            pages = [page for (page, _, _) in pending]
+            results = executor.map(_render_page_in_worker, pages, chunksize=chunksize)
+            for ((dst_filename, md, template), inputs, source), (written, new_entries) in zip(pending, results):
+                for entry in new_entries:
+                    self.fp.markdown_cache.put(*entry)
+                self.fp.page_written(dst_filename, inputs, md, template, source, written)
+
     def build_site(self):
         """Build site."""
         self.scan_dst()
+        if self.jobs > 1:
+            self.fp.pending = []
         self.build_species_pages()
         self.process_source()
+        if self.jobs > 1:
+            self.render_pending()
         self.cleanup_dst()
+        self.update_manifest()
         logging.warning("Done: %s, %d old files removed", self.fp.stats(), self.removed)
 
+    def watch(self, paths, server=None):
+        """Build site, then rebuild whenever any of paths change.
+
+        Only pages with changed inputs are rendered if there is a build
+        graph. Runs until interrupted.
+
+        Arguments:
+            paths (list) - files and directories to watch.
+            server (DevServer) - server to start and tell to reload after
+                each build, optional.
+        """
+        watcher = FileWatcher(paths)
+        self.build_site()
+        if server is not None:
+            server.start()
+        logging.warning("Watching %s for changes, ^C to stop", ", ".join(paths))
+        try:
+            while True:
+                watcher.wait()
+                self.fp.reset()
+                self.removed = 0
+                try:
+                    self.build_site()
+                except (Exception, SystemExit) as e:  # pylint: disable=broad-exception-caught
+                    logging.error("Build failed (%s), waiting for changes", str(e))
+                    continue
+                if server is not None:
+                    server.reload()
+        except KeyboardInterrupt:
+            logging.warning("Stopped watching")
+        finally:
+            if server is not None:
+                server.stop()
+
 
 def command_line_script():
     """Run from command line."""
@@ -449,6 +891,27 @@ def command_line_script():
                    help="Process just specified file in source directory")
     p.add_argument("--config", action="store", default="build_website_config.json",
                    help="JSON configuration file.")
+    p.add_argument("--build-graph", action="store", default="build_graph.json",
+                   help="JSON manifest of files written by the build and the inputs of each page, "
+                        "so that only pages with changed inputs are rendered and old files can be "
+                        "removed safely")
+    p.add_argument("--changes", action="store",
+                   help="JSON file to write lists of changed and removed files in dst to")
+    p.add_argument("--force", action="store_true",
+                   help="Render all pages even if their inputs are unchanged")
+    p.add_argument("--jobs", "-j", type=int, default=1,
+                   help="Number of processes to render pages in parallel")
+    p.add_argument("--markdown-cache", action="store", default="markdown_cache.sqlite",
+                   help="File to cache HTML rendered from Markdown in, empty to not cache")
+    p.add_argument("--template-cache", action="store", default="template_cache",
+                   help="Directory to cache parsed Liquid templates in, empty to not cache. Cached templates "
+                        "are loaded with pickle so the directory must be writable only by you")
+    p.add_argument("--watch", action="store_true",
+                   help="Keep running and rebuild whenever source, templates or processed data change")
+    p.add_argument("--serve", action="store_true",
+                   help="Serve the site with live reload while watching (implies --watch)")
+    p.add_argument("--port", type=int, default=8000,
+                   help="Port for --serve")
     args = p.parse_args()
 
     # Logging
@@ -464,7 +927,11 @@ def command_line_script():
         logging.error("Destination directory %s must already exist", args.dst)
         sys.exit()
 
-    processor = SiteProcessor(src_dir=args.src, dst_dir=args.dst, config=config)
+    build_graph = BuildGraph(args.build_graph, force=args.force)
+    markdown_cache = ResponseCache(filename=args.markdown_cache or None, ttl=None)
+    processor = SiteProcessor(src_dir=args.src, dst_dir=args.dst, config=config, build_graph=build_graph,
+                              jobs=args.jobs, markdown_cache=markdown_cache,
+                              template_cache_dir=args.template_cache or None, changes_filename=args.changes)
     if args.file:
         # Is the src_dir prepended? If so, stip it before passing in
         file = args.file
@@ -472,8 +939,14 @@ def command_line_script():
             file = os.path.relpath(file, start=args.src)
         logging.warning("Examining source file/dir %s", file)
         processor.process_file(file=file)
+        processor.update_manifest()
+    elif args.watch or args.serve:
+        server = DevServer(args.dst, port=args.port) if args.serve else None
+        processor.watch([args.src, "trees_processed.json", os.path.join(args.dst, "photos")], server=server)
     else:
         processor.build_site()
+    logging.info("Markdown cache: %s", markdown_cache.stats())
+    markdown_cache.close()
 
 
 if __name__ == "__main__":
@@ -1,3 +1,16 @@
 """Eggcyclopedia of Wood Helper Package."""
+from .species import Species
 from .trees import Trees
 from .classifications import Classifications
+from .usda import UsdaIndex
+from .lookup import LookupEngine, RateLimiter
+from .cache import CacheMissError, ResponseCache
+from .gbif_backbone import GbifBackbone
+from .taxon_tree import TaxonNode, TaxonTree
+from .phylogeny import Phylogeny
+from .tree_render import TreeRenderer
+from .induced_tree import InducedTreeCache
+from .dated_tree import DatedTree, DatedTreeError, DatedTreeTable
+from .species_store import SpeciesStore
+from .snapshot import JsonSnapshot
+from .build_graph import BuildGraph
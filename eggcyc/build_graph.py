@@ -0,0 +1,188 @@
+"""Eggcyclopedia of Wood website build dependency graph."""
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+from .files import atomic_write, file_sha256
+
+
+class BuildGraph():
+    """Record of the inputs used to render each output page.
+
+    For each output file the graph holds the content hash of every input
+    file (source, layout template and the templates it includes, _includes
+    files, data files such as photos) and a hash of the render context
+    (page metadata, species data, site variables). A page is up to date if
+    the output exists and none of these have changed, so it need not be
+    rendered again.
+
+    The graph is also the manifest of files written by the build: each
+    entry records the source file and the size and modification time of
+    the output when it was written. That is how the build knows which
+    files it owns, and so which it may safely delete once they are no
+    longer produced.
+
+    So that unchanged inputs such as photos need not be read on every
+    build, the graph also keeps the size, modification time and hash of
+    each input file, and a file is hashed again only if its size or
+    modification time change. As with make, an edit that keeps both is
+    not noticed, except that files modified in the last few seconds are
+    always hashed.
+
+    Example:
+    >>> graph = BuildGraph("build_graph.json")
+    >>> if not graph.is_current("docs/about.html", inputs, context):
+    ...     render()
+    ...     graph.record("docs/about.html", inputs, context)
+    >>> graph.write()
+    """
+
+    VERSION = 2
+    RACY_NS = 2 * 10**9  # Don't trust stat of files modified more recently
+
+    def __init__(self, filename="build_graph.json", force=False):
+        """Initialize BuildGraph object, loading filename if it exists.
+
+        Arguments:
+            filename (str) - JSON file used to persist the graph.
+            force (bool) - True to treat every output as out of date.
+        """
+        self.filename = filename
+        self.force = force
+        self.outputs = {}  # dst_filename -> {"source", "inputs", "context", "size", "mtime_ns"}
+        self.file_stats = {}  # input filename -> [size, mtime_ns, hash]
+        self.modified = False
+        self._hashes = {}  # filename -> hash, valid until reset()
+        if os.path.exists(filename):
+            try:
+                with open(filename, "r", encoding="utf-8") as fh:
+                    data = json.load(fh)
+                if data.get("version") == self.VERSION:
+                    self.outputs = data["outputs"]
+                    self.file_stats = data.get("file_stats", {})
+                else:
+                    logging.info("Ignoring build graph %s from different version", filename)
+            except (ValueError, KeyError) as e:
+                logging.warning("Ignoring bad build graph %s (%s)", filename, str(e))
+
+    def reset(self):
+        """Forget file hashes so that file stats are checked again.
+
+        Hashes are remembered for the duration of a build, call this before
+        each build in a long running process.
+        """
+        self._hashes = {}
+
+    def file_hash(self, filename):
+        """SHA-256 hex digest of the content of filename, None if missing.
+
+        The hash recorded in self.file_stats is used if the size and
+        modification time of the file are unchanged.
+        """
+        if filename not in self._hashes:
+            self._hashes[filename] = self.stat_hash(filename)
+        return self._hashes[filename]
+
+    def stat_hash(self, filename):
+        """Hash of filename from self.file_stats or by reading it, see file_hash()."""
+        try:
+            stat = os.stat(filename)
+            record = self.file_stats.get(filename)
+            if record is not None and record[0] == stat.st_size and record[1] == stat.st_mtime_ns:
+                return record[2]
+            digest = file_sha256(filename)
+        except FileNotFoundError:
+            if self.file_stats.pop(filename, None) is not None:
+                self.modified = True
+            return None
+        if time.time_ns() - stat.st_mtime_ns > self.RACY_NS:
+            self.file_stats[filename] = [stat.st_size, stat.st_mtime_ns, digest]
+            self.modified = True
+        else:
+            # Could be modified again within the mtime resolution
+            self.file_stats.pop(filename, None)
+        return digest
+
+    @staticmethod
+    def context_hash(context):
+        """SHA-256 hex digest of the JSON form of context."""
+        data = json.dumps(context, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def is_current(self, dst_filename, inputs, context):
+        """True if dst_filename was built from the same inputs and context.
+
+        Arguments:
+            dst_filename (str) - output file.
+            inputs (list) - input file names.
+            context (object) - JSON serializable render context.
+        """
+        entry = self.outputs.get(dst_filename)
+        if self.force or entry is None or not os.path.exists(dst_filename):
+            return False
+        if entry["context"] != self.context_hash(context):
+            return False
+        if set(entry["inputs"]) != set(inputs):
+            return False
+        return all(self.file_hash(filename) == digest for filename, digest in entry["inputs"].items())
+
+    def record(self, dst_filename, inputs, context, source=None):
+        """Record the inputs and context used to build dst_filename.
+
+        Call update_stat() once the file has been written, until then the
+        size and modification time of any earlier build are kept.
+
+        Arguments:
+            dst_filename (str) - output file.
+            inputs (list) - input file names.
+            context (object) - JSON serializable render context.
+            source (str) - source file name, None for generated pages.
+        """
+        entry = self.outputs.setdefault(dst_filename, {})
+        entry.update(source=source,
+                     inputs={filename: self.file_hash(filename) for filename in inputs},
+                     context=self.context_hash(context))
+        self.modified = True
+
+    def update_stat(self, dst_filename):
+        """Record the size and modification time of output dst_filename."""
+        stat = os.stat(dst_filename)
+        self.outputs[dst_filename].update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        self.modified = True
+
+    def is_unmodified(self, dst_filename):
+        """True if dst_filename has the size and modification time recorded.
+
+        Used to check that an output has not been changed by something
+        other than the build before deleting it.
+        """
+        entry = self.outputs.get(dst_filename, {})
+        try:
+            stat = os.stat(dst_filename)
+        except FileNotFoundError:
+            return False
+        return entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns
+
+    def remove(self, dst_filename):
+        """Remove entry for output dst_filename."""
+        if self.outputs.pop(dst_filename, None) is not None:
+            self.modified = True
+
+    def write(self):
+        """Write the graph file if anything was recorded.
+
+        Stats of files that are no longer inputs of any output are dropped.
+        """
+        if not self.modified:
+            return
+        inputs = set()
+        for entry in self.outputs.values():
+            inputs.update(entry.get("inputs", ()))
+        self.file_stats = {filename: record for filename, record in self.file_stats.items() if filename in inputs}
+        atomic_write(self.filename, json.dumps({"version": self.VERSION, "outputs": self.outputs,
+                                                "file_stats": self.file_stats},
+                                               indent=1, sort_keys=True))
+        self.modified = False
@@ -0,0 +1,217 @@
+"""Eggcyclopedia of Wood on-disk web service response cache."""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+
+class CacheMissError(Exception):
+    """Response not in cache when running offline."""
+
+
+class ResponseCache():
+    """Persistent cache of web service responses.
+
+    Responses must be JSON serializable and are stored in an SQLite file
+    keyed by a hash of the endpoint name and call parameters. Entries
+    older than ttl are fetched again, and the least recently used entries
+    are evicted once the cache grows beyond max_bytes. A caller may also
+    ask for a shorter max_age, or force a new call, for a single fetch.
+    Access times of cache hits are kept in memory and written with the
+    next put() or on close(), so hits don't write to the database. In
+    offline mode all responses are served from the cache, regardless of
+    age, and a miss raises CacheMissError instead of making a call.
+
+    Example:
+    >>> cache = ResponseCache("lookup_cache.sqlite")
+    >>> cache.fetch("gbif:name_usage", {"key": 3189834}, lambda: pygbif.species.name_usage(key=3189834))
+    {'key': 3189834, ...}
+    """
+
+    def __init__(self, filename="lookup_cache.sqlite", ttl=30 * 86400, max_bytes=100 * 1024 * 1024, offline=False):
+        """Initialize ResponseCache object.
+
+        Arguments:
+            filename (str) - SQLite cache file, None to not cache.
+            ttl (float) - time to live of entries in seconds, None for no
+                expiry.
+            max_bytes (int) - maximum total size of cached responses.
+            offline (bool) - True to serve only from the cache.
+        """
+        self.filename = filename
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._accessed = {}  # key -> access time not yet written
+        self.db = None
+        if filename is not None:
+            self.db = sqlite3.connect(filename, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, endpoint TEXT, "
+                            "value TEXT, size INTEGER, fetched REAL, accessed REAL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self.db.commit()
+        elif offline:
+            logging.warning("Offline mode without a cache file, all lookups will fail")
+
+    @staticmethod
+    def make_key(endpoint, params):
+        """Cache key for endpoint and params.
+
+        Arguments:
+            endpoint (str) - name of service endpoint, e.g. "gbif:name_backbone".
+            params (dict) - JSON serializable call parameters.
+
+        Returns:
+            str - hex digest key.
+        """
+        data = json.dumps([endpoint, params], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def get(self, endpoint, params, max_age=None):
+        """Get cached response.
+
+        Arguments:
+            endpoint (str) - name of service endpoint.
+            params (dict) - JSON serializable call parameters.
+            max_age (float) - maximum age in seconds of a usable entry if
+                less than self.ttl, None to use self.ttl. Ignored if offline.
+
+        Returns:
+            tuple - (found, value, fetched) where found is False if there is
+                no usable cached value, and fetched is the time the value was
+                fetched in seconds since the epoch.
+        """
+        if self.db is None:
+            return False, None, None
+        key = self.make_key(endpoint, params)
+        now = time.time()
+        if self.ttl is not None and (max_age is None or self.ttl < max_age):
+            max_age = self.ttl
+        with self._lock:
+            row = self.db.execute("SELECT value, fetched FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return False, None, None
+            value, fetched = row
+            if not self.offline and max_age is not None and now - fetched > max_age:
+                return False, None, None
+            self._accessed[key] = now
+        return True, json.loads(value), fetched
+
+    def put(self, endpoint, params, value, fetched=None):
+        """Store response in cache, evicting old entries if necessary.
+
+        Arguments:
+            endpoint (str) - name of service endpoint.
+            params (dict) - JSON serializable call parameters.
+            value - JSON serializable response.
+            fetched (float) - time the value was fetched in seconds since the
+                epoch, None for now.
+        """
+        if self.db is None:
+            return
+        key = self.make_key(endpoint, params)
+        data = json.dumps(value, sort_keys=True)
+        now = time.time()
+        if fetched is None:
+            fetched = now
+        with self._lock:
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                            (key, endpoint, data, len(data), fetched, now))
+            self.write_accessed()
+            self.evict()
+            self.db.commit()
+
+    def write_accessed(self):
+        """Write access times of cache hits so that eviction sees them.
+
+        Must be called with self._lock held, the caller commits.
+        """
+        if self._accessed:
+            self.db.executemany("UPDATE responses SET accessed = ? WHERE key = ?",
+                                [(accessed, key) for key, accessed in self._accessed.items()])
+            self._accessed = {}
+
+    def evict(self):
+        """Evict least recently used entries until within max_bytes.
+
+        Must be called with self._lock held.
+        """
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if self.max_bytes is None or total <= self.max_bytes:
+            return
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+        logging.info("Evicted cache entries to reduce size to %d bytes", total)
+
+    def fetch(self, endpoint, params, fn, max_age=None, force=False):
+        """Get response from cache or by calling fn.
+
+        Arguments:
+            endpoint (str) - name of service endpoint.
+            params (dict) - JSON serializable call parameters.
+            fn (callable) - function with no arguments that makes the call
+                and returns a JSON serializable response.
+            max_age (float) - maximum age in seconds of a usable cached
+                response, see get().
+            force (bool) - True to call fn even if there is a cached
+                response. Ignored if offline.
+
+        Returns:
+            the response.
+
+        Raises:
+            CacheMissError - if offline and the response is not cached.
+        """
+        return self.fetch_with_time(endpoint, params, fn, max_age=max_age, force=force)[0]
+
+    def fetch_with_time(self, endpoint, params, fn, max_age=None, force=False):
+        """Get response and the time it was fetched from cache or by calling fn.
+
+        Arguments are as for fetch().
+
+        Returns:
+            tuple - (value, fetched) where fetched is the time the response
+                was fetched in seconds since the epoch, which is the time of
+                the original call for a cached response.
+
+        Raises:
+            CacheMissError - if offline and the response is not cached.
+        """
+        if not force or self.offline:
+            found, value, fetched = self.get(endpoint, params, max_age=max_age)
+            if found:
+                self.hits += 1
+                return value, fetched
+        self.misses += 1
+        if self.offline:
+            raise CacheMissError("No cached response for %s %s" % (endpoint, json.dumps(params, sort_keys=True)))
+        fetched = time.time()
+        value = fn()
+        self.put(endpoint, params, value, fetched=fetched)
+        return value, fetched
+
+    def stats(self):
+        """Statistics about cache use.
+
+        Returns:
+            str: description string
+        """
+        return "%d cache hits, %d cache misses" % (self.hits, self.misses)
+
+    def close(self):
+        """Write access times and close the cache database."""
+        if self.db is not None:
+            with self._lock:
+                self.write_accessed()
+                self.db.commit()
+            self.db.close()
+            self.db = None
@@ -1,19 +1,38 @@
 """Eggcyclopedia of Wood classification data handling class."""
 
+import hashlib
 import json
 import logging
-import requests
+import os
 
 import pygbif
 
+from .cache import ResponseCache
+from .files import atomic_write, file_sha256, write_if_changed
+from .lookup import LookupEngine
+from .taxon_tree import TaxonTree
+
 
 class Classifications():
     """Classifications handling class."""
 
-    def __init__(self):
-        """Initialize Classficiations object."""
+    def __init__(self, response_cache=None, gbif_backbone=None, lookup_engine=None):
+        """Initialize Classficiations object.
+
+        Arguments:
+            response_cache (ResponseCache) - cache for web service responses,
+                None to not cache.
+            gbif_backbone (GbifBackbone) - local GBIF backbone index to look
+                up vernacular names in before using the GBIF API, optional.
+            lookup_engine (LookupEngine) - engine used to run web service
+                lookups, a default one is created if None.
+        """
+        self.TABLE_VERSION = 1  # Change if table format changes
         self.RANKS = ["KINGDOM", "PHYLUM", "CLASS", "ORDER", "FAMILY", "GENUS", "SPECIES"]
         self.higher_taxa = None
+        self.response_cache = response_cache if response_cache is not None else ResponseCache(filename=None)
+        self.gbif_backbone = gbif_backbone
+        self.lookup_engine = lookup_engine if lookup_engine is not None else LookupEngine()
 
     def html_label(self, name, trees=None):
         """HTML label with common and scientific names."""
@@ -54,147 +73,162 @@ class Classifications():
         with open(filename, "w", encoding="utf-8") as fh:
             json.dump(self.higher_taxa, fh, indent=2, sort_keys=True)
 
-    def get_higher_taxa_common_names(self, trees):
+    def get_higher_taxa_common_names(self, trees, retry_missing=False):
         """Get common names for GENUS and higher rank taxa in the tree from GBIF.
 
+        Each missing taxon key is looked up once, concurrently using
+        self.lookup_engine. Taxa that GBIF has no vernacular name for are
+        recorded with "no_common_name" so that they are not looked up again
+        unless retry_missing is set, in which case cached GBIF responses for
+        them are not used. Names found before any failure are kept and
+        higher_taxa_processed.json is written once at the end.
+
         Arguments:
             trees (Trees) - a Trees object with data about all tree species to
                 be considered.
+            retry_missing (bool) - look up again taxa previously found to have
+                no common name.
         """
         self.load_higher_taxa()
         to_look_up = {}
+        retry_keys = set()
         for species in trees.trees:
-            if "gbif_classification" in trees.trees[species]:
-                for r in trees.trees[species]["gbif_classification"]:
-                    if r["rank"] == "SPECIES":
-                        continue
-                    name = r["name"]
-                    key = r["key"]
-                    if name in self.higher_taxa and "common_name" in self.higher_taxa[name]:
-                        print("Have data for %s" % (name))
-                    else:
-                        to_look_up[name] = key
+            for (rank, name, key) in (trees.classification(species) or ()):
+                if rank == "SPECIES" or name in to_look_up:
+                    continue
+                data = self.higher_taxa.get(name, {})
+                if "common_name" in data or ("no_common_name" in data and not retry_missing):
+                    logging.debug("Have data for %s", name)
+                else:
+                    to_look_up[name] = int(key)
+                    if "no_common_name" in data:
+                        retry_keys.add(int(key))
         # Do lookups where data missing
         print("Need to lookup " + str(to_look_up))
-        try:
-            num_added = 0
-            for name in to_look_up:
-                key = to_look_up[name]
-                gbif = pygbif.species.name_usage(key=key, language="en")
-                if ("key" not in gbif) or (int(gbif["key"]) != int(key)) or ("vernacularName" not in gbif):
-                    logging.warning("GBIF lookup for %s (key=%s) failed: %s", name, key, gbif)
-                    continue
-                if name not in self.higher_taxa:
-                    self.higher_taxa[name] = {}
-                self.higher_taxa[name]["gbif_id"] = int(key)
+        results = {}
+        if self.gbif_backbone is not None:
+            for name, key in to_look_up.items():
+                vernacular_name = self.gbif_backbone.vernacular_name(key)
+                if vernacular_name is not None:
+                    results[key] = {"key": key, "vernacularName": vernacular_name}
+
+        def lookup(key):
+            return self.response_cache.fetch(
+                "gbif:name_usage", {"key": key, "language": "en"},
+                lambda: pygbif.species.name_usage(key=key, language="en"),
+                force=key in retry_keys)
+
+        keys = [key for key in dict.fromkeys(to_look_up.values()) if key not in results]
+        results.update(self.lookup_engine.run(keys, lookup, host="api.gbif.org"))
+        num_added = 0
+        for name, key in to_look_up.items():
+            gbif = results[key]
+            if isinstance(gbif, Exception):
+                # Don't record failures that may be transient
+                logging.warning("GBIF lookup for %s (key=%s) failed: %s", name, key, gbif)
+                continue
+            if name not in self.higher_taxa:
+                self.higher_taxa[name] = {}
+            self.higher_taxa[name]["gbif_id"] = key
+            if ("key" not in gbif) or (int(gbif["key"]) != key) or ("vernacularName" not in gbif):
+                logging.warning("GBIF lookup for %s (key=%s) has no common name: %s", name, key, gbif)
+                self.higher_taxa[name]["no_common_name"] = True
+            else:
+                self.higher_taxa[name].pop("no_common_name", None)
                 self.higher_taxa[name]["common_name"] = gbif["vernacularName"]
-                num_added += 1
-        except requests.exceptions.ConnectionError as e:
-            logging.warning("GBIF lookup failed: %s", e)
+            num_added += 1
         # Write out if updated
         if num_added > 0:
             self.write_higher_taxa()
 
-    def write_classifications_table(self, trees, class_table_filename="src/_includes/class_table.html"):
-        """Write an HTML table that represents the tree of classifications from GBIF species data.
+    def classifications_table_html(self, trees, taxon_tree):
+        """HTML table that represents the tree of classifications.
+
+        Each species is one row and each taxon is one cell spanning the rows
+        of all the species in it, so the table is written in a single
+        depth-first walk of the taxon tree.
+
+        Arguments:
+            trees (Trees) - a Trees object used for species common names.
+            taxon_tree (TaxonTree) - tree of taxa to write.
+
+        Returns:
+            str - HTML table.
+        """
+        html = ["""<div class="classification">\n<table>\n""", "<tr>\n"]
+        for rank in self.RANKS:
+            html.append("""<th><div class="rotated">""" + rank + """</div></th>\n""")
+        html.append("</tr>\n")
+        cells = []  # cells to go in the next row
+        for node in taxon_tree.walk():
+            if node.rank in ("KINGDOM", "PHYLUM", "CLASS"):
+                # rotated
+                cells.append("""<td rowspan="%d"><div class="rotated">%s</div></td>\n""" % (node.count, self.html_label(node.name, trees)))
+            else:
+                cells.append("""<td rowspan="%d">%s</td>\n""" % (node.count, self.html_label(node.name, trees)))
+            if not node.children:
+                html.append("<tr>\n")
+                html.extend(cells)
+                html.append("</tr>\n")
+                cells = []
+        html.append("</table>\n</div>\n")
+        return "".join(html)
+
+    def classifications_table_fingerprint(self, trees):
+        """Fingerprint of all inputs to the classifications table.
+
+        Covers the ranks, each species' classification and common name, and
+        the common names of higher taxa.
 
         Arguments:
             trees (Trees) - a Trees object with data about all tree species to
                 be considered.
+
+        Returns:
+            str - hex digest.
         """
-        self.get_higher_taxa_common_names(trees)
-        last_rank = "KINGDOM"
-        rank_to_lower = {}
-        rank_to_higher = {}
-        for rank in self.RANKS:
-            if rank == "KINGDOM":
-                continue
-            rank_to_lower[last_rank] = rank
-            rank_to_higher[rank] = last_rank
-            # print("## %s -> %s" % (last_rank, rank))
-            last_rank = rank
-        # A each rank, build a map of names to names at the next
-        # lower rank
-        rank_name_to_lower_set = {}
-        name_counts = {}  # Num species for each name (assume all names unique)
-        for rank in self.RANKS:
-            if rank == "SPECIES":
-                continue
-            rank_name_to_lower_set[rank] = {}
-        # Now look at data for each species
-        entries = 0
+        species_data = {}
         for species in trees.trees:
-            if "gbif_classification" in trees.trees[species]:
-                entries += 1
-                # Build map of rank -> name for this species
-                names = {}
-                for r in trees.trees[species]["gbif_classification"]:
-                    if r["rank"] == "SPECIES":
-                        name = species  # use our species name in pref to GBIF
-                    else:
-                        name = r["name"]
-                    names[r["rank"]] = name
-                    if name not in name_counts:
-                        name_counts[name] = 0
-                    name_counts[name] += 1
-                # Now look up tha map from name to name at next rank
-                for rank in self.RANKS:
-                    if rank == "SPECIES":
-                        continue
-                    name = names[rank]
-                    lower_name = names[rank_to_lower[rank]]
-                    if name not in rank_name_to_lower_set[rank]:
-                        rank_name_to_lower_set[rank][name] = set()
-                    rank_name_to_lower_set[rank][name].add(lower_name)
-        # Find the complete set of table entries indexed by [rank][row_num]
-        # where row_num starts at zero. Entries are either a name or None. The
-        # rows must align so that they describe he correct classification for
-        # the species at the end.
-        table = {}
-        last_rank = []
-        next_rank = []
-        for rank in self.RANKS:
-            table[rank] = [None for i in range(entries)]
-            count = 0
-            if rank == "KINGDOM":
-                for name in rank_name_to_lower_set[rank]:
-                    table[rank][count] = name
-                    next_rank += [name for i in range(name_counts[name])]
-                    count += name_counts[name]
-            else:
-                next_rank = []
-                # print(rank)
-                count = 0
-                while count < entries:
-                    # print(str(count) + " < " + str(entries))
-                    higher_name = last_rank[count]
-                    higher_rank = rank_to_higher[rank]
-                    for name in sorted(rank_name_to_lower_set[higher_rank][higher_name]):
-                        # print("%s (%d)" % (higher_name, name_counts[higher_name]))
-                        # print(" --> " + name)
-                        table[rank][count] = name
-                        next_rank += [name for i in range(name_counts[name])]
-                        # print("table[%s][%d] = %s" % (rank,count,name))
-                        count += name_counts[name]
-            last_rank = next_rank
-        #
-        # Write table
-        logging.info("Writing %s..." % class_table_filename)
-        with open(class_table_filename, "w", encoding="utf-8") as fh:
-            fh.write("""<div class="classification">\n<table>\n""")
-            fh.write("<tr>\n")
-            for rank in self.RANKS:
-                fh.write("""<th><div class="rotated">""" + rank + """</div></th>\n""")
-            fh.write("</tr>\n")
-            for row in range(entries):
-                fh.write("<tr>\n")
-                for rank in self.RANKS:
-                    if table[rank][row] is not None:
-                        name = table[rank][row]
-                        if rank in ("KINGDOM", "PHYLUM", "CLASS"):
-                            # rotated
-                            fh.write("""<td rowspan="%d"><div class="rotated">%s</div></td>\n""" % (name_counts[name], self.html_label(name, trees)))
-                        else:
-                            fh.write("""<td rowspan="%d">%s</td>\n""" % (name_counts[name], self.html_label(name, trees)))
-                fh.write("</tr>\n")
-            fh.write("</table>\n</div>\n")
+            classification = trees.classification(species)
+            if classification is not None:
+                species_data[species] = [classification, trees.trees[species].get("common_name")]
+        # Only taxa with common names affect the table, so recording that a
+        # taxon has none doesn't change the fingerprint
+        taxa_data = {name: data["common_name"] for name, data in self.higher_taxa.items() if "common_name" in data}
+        data = json.dumps([self.TABLE_VERSION, self.RANKS, species_data, taxa_data], sort_keys=True)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def write_classifications_table(self, trees, class_table_filename="src/_includes/class_table.html",
+                                    fingerprint_filename="class_table.fingerprint", retry_missing=False):
+        """Write an HTML table that represents the tree of classifications from GBIF species data.
+
+        A fingerprint of the inputs and a hash of the table written are kept
+        in fingerprint_filename. If the inputs are unchanged and the table
+        has the same hash then the table is not regenerated. Otherwise it is
+        generated but written, atomically, only if different so that an
+        unchanged file keeps its mtime even without a fingerprint (e.g. in a
+        fresh clone). Checking the hash means a table that was edited or
+        restored from elsewhere is regenerated.
+
+        Arguments:
+            trees (Trees) - a Trees object with data about all tree species to
+                be considered.
+            class_table_filename (str) - HTML file to write.
+            fingerprint_filename (str) - file to keep the fingerprint in.
+            retry_missing (bool) - look up again taxa previously found to have
+                no common name, see get_higher_taxa_common_names().
+        """
+        self.get_higher_taxa_common_names(trees, retry_missing=retry_missing)
+        fingerprint = self.classifications_table_fingerprint(trees)
+        if os.path.exists(class_table_filename) and os.path.exists(fingerprint_filename):
+            with open(fingerprint_filename, "r", encoding="utf-8") as fh:
+                if fh.read().split() == [fingerprint, file_sha256(class_table_filename)]:
+                    logging.info("Inputs unchanged, not writing %s", class_table_filename)
+                    return
+        taxon_tree = TaxonTree(self.RANKS)
+        taxon_tree.add_trees(trees)
+        logging.info("Generating %s..." % class_table_filename)
+        html = self.classifications_table_html(trees, taxon_tree).encode("utf-8")
+        if not write_if_changed(class_table_filename, html):
+            logging.info("Table unchanged, not writing %s", class_table_filename)
+        atomic_write(fingerprint_filename, fingerprint + " " + hashlib.sha256(html).hexdigest() + "\n")
@@ -0,0 +1,186 @@
+"""Eggcyclopedia of Wood client for OpenTree Chronosynth dated trees."""
+
+import json
+import logging
+
+import requests
+
+from .cache import ResponseCache
+from .phylogeny import Phylogeny
+
+
+class DatedTreeError(Exception):
+    """Error getting a dated tree from the Chronosynth API."""
+
+
+class DatedTreeTable(Phylogeny):
+    """Dated tree stored as a compact Phylogeny with node ages.
+
+    In addition to the Phylogeny arrays, ages[i] is the age of node i (time
+    before present, the greatest distance to any tip below it).
+
+    Example:
+    >>> table = DatedTreeTable.from_newick("((ott1:2,ott2:2)mrcaott1ott2:3)root;")
+    >>> table.age(table.find("mrcaott1ott2"))
+    2.0
+    """
+
+    def __init__(self):
+        """Initialize empty DatedTreeTable object."""
+        super().__init__()
+        self._ages = None
+
+    @property
+    def ages(self):
+        """Ages of nodes, computed on first use."""
+        if self._ages is None or len(self._ages) != len(self):
+            self._ages = self.heights()
+        return self._ages
+
+    def age(self, node):
+        """Age of node."""
+        return self.ages[node]
+
+    def divergence_age(self, label1, label2):
+        """Age at which the taxa with two labels diverged.
+
+        Arguments:
+            label1 (str) - label of first taxon, e.g. "ott791115".
+            label2 (str) - label of second taxon.
+
+        Returns:
+            float or None - age of most recent common ancestor, None if
+                either label is not in the tree.
+        """
+        node1 = self.find(label1)
+        node2 = self.find(label2)
+        if node1 is None or node2 is None:
+            return None
+        return self.ages[self.mrca([node1, node2])]
+
+
+class DatedTree():
+    """Client for the OpenTree Chronosynth dated tree API.
+
+    Uses the API as described at
+    <https://github.com/OpenTreeOfLife/chronosynth/wiki/Draft-API-docs>.
+    A single HTTP session is reused for all calls, large lists of node ids
+    are sent in chunks that give separate trees, and responses may be
+    cached in a ResponseCache.
+
+    Example call from command line:
+    >>> curl -X POST https://dates.opentreeoflife.org/v4/dates/dated_tree -d '{"node_ids":["ott791115", "ott403375"], "max_age":"180"}' | jsonpp
+    {
+        "dated_trees_newick_list": [
+            "((((((ott791115:9.834022)mrcaott316110ott791115:2.744552)mrcaott316110ott494536:2.744552)mrcaott137331ott316110:3.721832)mrcaott137331ott3930379:2.971260)mrcaott137331ott538292:157.983780,(ott403375:21.858711)mrcaott403375ott470257:158.141296)mrcaott137331ott403375:1.000000;"
+        ],
+        ...
+    }
+
+    and from Python:
+    >>> tables = DatedTree().dated_tree_tables(ott_ids=["ott791115", "ott403375"])
+    >>> tables[0].divergence_age("ott791115", "ott403375")
+    180.0
+    """
+
+    def __init__(self, api_endpoint="dates.opentreeoflife.org", api_version="v4", scheme="https",
+                 timeout=60, chunk_size=500, response_cache=None):
+        """Initialize DatedTree.
+
+        Arguments:
+            api_endpoint (str) - host (and optional port) of the API.
+            api_version (str) - API version.
+            scheme (str) - "https", or "http" for a local test server.
+            timeout (float) - request timeout in seconds.
+            chunk_size (int) - maximum number of node ids in one request.
+            response_cache (ResponseCache) - cache for responses, e.g.
+                ResponseCache("lookup_cache.sqlite"), None to not cache.
+        """
+        self._api_endpoint = api_endpoint
+        self._api_version = api_version
+        self._api_service = "dates"
+        self._scheme = scheme
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.response_cache = response_cache if response_cache is not None else ResponseCache(filename=None)
+        self.session = requests.Session()
+
+    def _make_url(self, method):
+        """URL for this method."""
+        return ("%s://%s/%s/%s/%s" % (self._scheme, self._api_endpoint, self._api_version, self._api_service, method))
+
+    def _post(self, method, data):
+        """POST JSON data to method and return the parsed JSON response.
+
+        Raises:
+            DatedTreeError - on any request or response error.
+        """
+        data_str = json.dumps(data)
+        logging.debug("%s call data: %s", method, data_str)
+        try:
+            ret = self.session.post(self._make_url(method=method), data=data_str, timeout=self.timeout)
+            ret.raise_for_status()
+            return ret.json()
+        except requests.exceptions.Timeout as e:
+            raise DatedTreeError("Request to %s timed out" % method) from e
+        except requests.exceptions.RequestException as e:
+            raise DatedTreeError("Call to %s failed: %s" % (method, str(e))) from e
+        except ValueError as e:
+            raise DatedTreeError("Bad JSON response from %s: %s" % (method, str(e))) from e
+
+    def dated_trees(self, ott_ids, max_age=180):
+        """Dated trees for the given ids.
+
+        Each chunk of ids is dated separately and the trees are not joined,
+        so divergence ages are available only between taxa in the same
+        chunk. The trees can't simply be grafted under a common root as the
+        age of that root is not known. Use dated_tree() where all the ids
+        must be in one tree.
+
+        Arguments:
+            ott_ids (list) - node ids such as "ott791115".
+            max_age (float) - maximum age of the root.
+
+        Returns:
+            list - of Newick strings, the first dated tree for each chunk of
+                at most self.chunk_size ids.
+
+        Raises:
+            DatedTreeError - if a call fails.
+        """
+        newicks = []
+        for i in range(0, len(ott_ids), self.chunk_size):
+            chunk = ott_ids[i:i + self.chunk_size]
+            data = {"node_ids": chunk, "max_age": str(max_age)}
+            dret = self.response_cache.fetch("chronosynth:dated_tree", data,
+                                             lambda: self._post("dated_tree", data))
+            if not dret.get("dated_trees_newick_list"):
+                raise DatedTreeError("No dated tree in response: %s" % str(dret))
+            newicks.append(dret["dated_trees_newick_list"][0])
+        return newicks
+
+    def dated_tree(self, ott_ids, max_age=180):
+        """Dated tree for the given ids, which must fit in one chunk.
+
+        Returns:
+            str - Newick string.
+        """
+        if len(ott_ids) > self.chunk_size:
+            raise DatedTreeError("Too many ids (%d) for one dated tree, use dated_trees()" % len(ott_ids))
+        return self.dated_trees(ott_ids=ott_ids, max_age=max_age)[0]
+
+    def dated_tree_tables(self, ott_ids, max_age=180):
+        """Dated trees for the given ids parsed into DatedTreeTable objects.
+
+        As for dated_trees(), divergence_age() on one table works only for
+        taxa in its chunk, it returns None for a taxon in another chunk.
+
+        Returns:
+            list - of DatedTreeTable, one per chunk.
+        """
+        return [DatedTreeTable.from_newick(newick) for newick in self.dated_trees(ott_ids=ott_ids, max_age=max_age)]
+
+    def close(self):
+        """Close the HTTP session and the response cache."""
+        self.session.close()
+        self.response_cache.close()
@@ -0,0 +1,111 @@
+"""Eggcyclopedia of Wood local development web server with live reload."""
+
+import functools
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import os
+import threading
+
+
+LIVE_RELOAD_SCRIPT = b"""<script>
+(function () {
+  var buildId = null;
+  setInterval(function () {
+    fetch("/__build_id").then(function (r) { return r.text(); }).then(function (id) {
+      if (buildId !== null && id !== buildId) { location.reload(); }
+      buildId = id;
+    }).catch(function () {});
+  }, 500);
+})();
+</script>
+"""
+
+
+class LiveReloadHandler(SimpleHTTPRequestHandler):
+    """Static file handler that adds a live reload script to HTML pages.
+
+    Pages poll /__build_id and reload themselves when it changes.
+    """
+
+    def __init__(self, *args, dev_server=None, **kwargs):
+        """Initialize LiveReloadHandler, dev_server provides the build id."""
+        self.dev_server = dev_server
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        """Serve build id, HTML page with script added, or other file."""
+        if self.path == "/__build_id":
+            self.send_content(str(self.dev_server.build_id).encode("utf-8"), "text/plain")
+            return
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and self.path.split("?", 1)[0].endswith("/"):
+            path = os.path.join(path, "index.html")
+        if self.dev_server.live_reload and path.endswith(".html") and os.path.isfile(path):
+            with open(path, "rb") as fh:
+                content = fh.read()
+            pos = content.rfind(b"</body>")
+            if pos < 0:
+                pos = len(content)
+            self.send_content(content[:pos] + LIVE_RELOAD_SCRIPT + content[pos:], "text/html; charset=utf-8")
+            return
+        super().do_GET()
+
+    def send_content(self, content, content_type):
+        """Send content as an uncached 200 response."""
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Log requests at debug level rather than to stderr."""
+        logging.debug("%s - %s", self.address_string(), format % args)
+
+
+class DevServer():
+    """Local web server for the built site, run in a background thread.
+
+    A replacement for test_server.sh when using build_website.py --watch.
+    Call reload() after each rebuild and open pages reload themselves.
+
+    Example:
+    >>> server = DevServer("docs", port=8000)
+    >>> server.start()
+    >>> server.reload()
+    """
+
+    def __init__(self, directory, bind="127.0.0.1", port=8000, live_reload=True):
+        """Initialize DevServer object.
+
+        Arguments:
+            directory (str) - directory to serve.
+            bind (str) - address to listen on.
+            port (int) - port to listen on.
+            live_reload (bool) - True to add the live reload script to pages.
+        """
+        self.directory = directory
+        self.bind = bind
+        self.port = port
+        self.live_reload = live_reload
+        self.build_id = 0
+        self.httpd = None
+
+    def start(self):
+        """Start serving in a daemon thread."""
+        handler = functools.partial(LiveReloadHandler, directory=self.directory, dev_server=self)
+        self.httpd = ThreadingHTTPServer((self.bind, self.port), handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        logging.warning("Serving %s at http://%s:%d/", self.directory, self.bind, self.port)
+
+    def reload(self):
+        """Tell open pages to reload."""
+        self.build_id += 1
+
+    def stop(self):
+        """Stop serving."""
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
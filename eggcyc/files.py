@@ -0,0 +1,154 @@
+"""Eggcyclopedia of Wood file writing helpers."""
+
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+FICLONE = 0x40049409  # Linux ioctl to make a reflink copy of a file
+
+
+def atomic_write_bytes(filename, content):
+    """Write bytes content to filename atomically.
+
+    The content is written to a temporary file in the same directory which
+    is then renamed over filename, so readers never see a partial file.
+    The permissions of an existing file are kept, new files are 0o644.
+
+    Arguments:
+        filename (str) - file to write.
+        content (bytes) - data to write.
+    """
+    dirname = os.path.dirname(filename) or "."
+    fd, tmp_filename = tempfile.mkstemp(dir=dirname, prefix="." + os.path.basename(filename) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(content)
+        mode = os.stat(filename).st_mode & 0o777 if os.path.exists(filename) else 0o644
+        os.chmod(tmp_filename, mode)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        os.remove(tmp_filename)
+        raise
+
+
+def atomic_write(filename, content):
+    """Write text content to filename atomically, encoded as UTF-8.
+
+    See atomic_write_bytes().
+
+    Arguments:
+        filename (str) - file to write.
+        content (str) - text to write.
+    """
+    atomic_write_bytes(filename, content.encode("utf-8"))
+
+
+def write_if_changed(filename, content):
+    """Write bytes content to filename atomically unless already the same.
+
+    An unchanged file is not written, so keeps its modification time and
+    doesn't show up as a change to tools like rsync.
+
+    Arguments:
+        filename (str) - file to write.
+        content (bytes) - data to write.
+
+    Returns:
+        bool - True if the file was written.
+    """
+    try:
+        if os.path.getsize(filename) == len(content):
+            with open(filename, "rb") as fh:
+                if fh.read() == content:
+                    return False
+    except FileNotFoundError:
+        pass
+    atomic_write_bytes(filename, content)
+    return True
+
+
+def file_sha256(filename):
+    """SHA-256 hex digest of the content of filename."""
+    digest = hashlib.sha256()
+    with open(filename, "rb") as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def copy_file(src_filename, dst_filename):
+    """Copy src_filename to dst_filename atomically, keeping the mtime.
+
+    Where the filesystem supports it the copy is a reflink that shares data
+    blocks with the source, otherwise it is an ordinary copy.
+
+    Arguments:
+        src_filename (str) - file to copy.
+        dst_filename (str) - destination, replaced if it exists.
+    """
+    dirname = os.path.dirname(dst_filename) or "."
+    prefix = "." + os.path.basename(dst_filename) + "."
+    fd, tmp_filename = tempfile.mkstemp(dir=dirname, prefix=prefix, suffix=".tmp")
+    try:
+        with open(src_filename, "rb") as src, os.fdopen(fd, "wb") as dst:
+            try:
+                if fcntl is None:
+                    raise OSError("no reflink support")
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            except OSError:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        shutil.copystat(src_filename, tmp_filename)
+        os.replace(tmp_filename, dst_filename)
+    except BaseException:
+        os.remove(tmp_filename)
+        raise
+
+
+def open_sqlite_index(index_filename, fingerprint, build, description="index"):
+    """Open an SQLite index of source data, building it if necessary.
+
+    The index records a fingerprint of the source data in a meta table and
+    is rebuilt if that is different. The index is built in a temporary file
+    which is then renamed into place so that an interrupted build never
+    leaves a partial index.
+
+    Arguments:
+        index_filename (str) - SQLite index file.
+        fingerprint (str) - fingerprint of the source data and index schema.
+        build (callable) - function taking an sqlite3 connection that
+            creates and fills the index tables, the caller commits.
+        description (str) - description of the index for log messages.
+
+    Returns:
+        sqlite3.Connection - connection to the index.
+    """
+    if os.path.exists(index_filename):
+        db = sqlite3.connect(index_filename)
+        try:
+            meta = dict(db.execute("SELECT key, value FROM meta"))
+        except sqlite3.DatabaseError:
+            meta = {}
+        if meta.get("fingerprint") == fingerprint:
+            logging.info("Using %s in %s", description, index_filename)
+            return db
+        db.close()
+    logging.warning("Building %s in %s", description, index_filename)
+    tmp_filename = index_filename + ".tmp"
+    if os.path.exists(tmp_filename):
+        os.remove(tmp_filename)
+    db = sqlite3.connect(tmp_filename)
+    db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    build(db)
+    db.execute("INSERT INTO meta VALUES (?, ?)", ("fingerprint", fingerprint))
+    db.commit()
+    db.close()
+    os.replace(tmp_filename, index_filename)
+    return sqlite3.connect(index_filename)
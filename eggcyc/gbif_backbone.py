@@ -0,0 +1,192 @@
+"""Eggcyclopedia of Wood local GBIF backbone taxonomy index."""
+
+import csv
+import os
+import sys
+
+from .files import open_sqlite_index
+
+
+class GbifBackbone():
+    """Local index of the GBIF backbone taxonomy.
+
+    Imports the Taxon.tsv and VernacularName.tsv files of the GBIF backbone
+    taxonomy dump (https://hosted-datasets.gbif.org/datasets/backbone/) into
+    an SQLite file so that names can be matched and classifications and
+    vernacular names resolved without calls to the GBIF API. The index is
+    rebuilt if the size or modification time of the dump files change.
+
+    Example:
+    >>> backbone = GbifBackbone("backbone")
+    >>> backbone.match("Acer negundo")["usage"]["key"]
+    '3189866'
+    """
+
+    SCHEMA_VERSION = "1"
+    RANKS = ["KINGDOM", "PHYLUM", "CLASS", "ORDER", "FAMILY", "GENUS", "SPECIES"]
+
+    def __init__(self, dump_dir, index_filename=None):
+        """Initialize GbifBackbone object, importing the dump if necessary.
+
+        Arguments:
+            dump_dir (str) - directory with the unpacked backbone dump, must
+                contain Taxon.tsv and may contain VernacularName.tsv.
+            index_filename (str) - SQLite index file, defaults to
+                backbone.sqlite in dump_dir.
+        """
+        self.taxon_filename = os.path.join(dump_dir, "Taxon.tsv")
+        self.vernacular_filename = os.path.join(dump_dir, "VernacularName.tsv")
+        self.index_filename = index_filename if index_filename is not None else os.path.join(dump_dir, "backbone.sqlite")
+        self.db = None
+        self.open()
+
+    def source_fingerprint(self):
+        """Fingerprint of the dump files from their sizes and modification times.
+
+        The dump files are several GB so are not hashed.
+        """
+        parts = [self.SCHEMA_VERSION]
+        for filename in (self.taxon_filename, self.vernacular_filename):
+            if os.path.exists(filename):
+                st = os.stat(filename)
+                parts.append("%s:%d:%d" % (os.path.basename(filename), st.st_size, st.st_mtime_ns))
+        return " ".join(parts)
+
+    def open(self):
+        """Open the index, importing the dump if missing or out of date."""
+        self.db = open_sqlite_index(self.index_filename, self.source_fingerprint(), self.import_dump,
+                                    description="GBIF backbone index of " + self.taxon_filename)
+
+    @staticmethod
+    def read_tsv(filename):
+        """Iterate over rows of a dump TSV file as dicts keyed by header names.
+
+        Arguments:
+            filename (str) - TSV file name.
+        """
+        csv.field_size_limit(sys.maxsize)
+        with open(filename, "r", encoding="utf-8", newline="") as fh:
+            yield from csv.DictReader(fh, delimiter="\t", quoting=csv.QUOTE_NONE)
+
+    def import_dump(self, db):
+        """Import the dump files into the index tables.
+
+        Arguments:
+            db (sqlite3.Connection) - new index database, see
+                open_sqlite_index().
+        """
+        db.execute("CREATE TABLE taxa (id INTEGER PRIMARY KEY, parent_id INTEGER, accepted_id INTEGER, "
+                   "scientific_name TEXT, canonical_name TEXT, rank TEXT, status TEXT)")
+        db.execute("CREATE TABLE vernacular (id INTEGER, name TEXT, language TEXT)")
+        db.executemany("INSERT INTO taxa VALUES (?, ?, ?, ?, ?, ?, ?)", (
+            (int(row["taxonID"]),
+             int(row["parentNameUsageID"]) if row["parentNameUsageID"] else None,
+             int(row["acceptedNameUsageID"]) if row["acceptedNameUsageID"] else None,
+             row["scientificName"],
+             row["canonicalName"],
+             row["taxonRank"].upper(),
+             row["taxonomicStatus"].upper())
+            for row in self.read_tsv(self.taxon_filename)))
+        if os.path.exists(self.vernacular_filename):
+            db.executemany("INSERT INTO vernacular VALUES (?, ?, ?)", (
+                (int(row["taxonID"]), row["vernacularName"], row["language"])
+                for row in self.read_tsv(self.vernacular_filename)))
+        db.execute("CREATE INDEX taxa_canonical_name ON taxa (canonical_name)")
+        db.execute("CREATE INDEX taxa_scientific_name ON taxa (scientific_name)")
+        db.execute("CREATE INDEX vernacular_id ON vernacular (id)")
+
+    def taxon(self, key):
+        """Taxon row for key.
+
+        Arguments:
+            key (int) - GBIF taxon key.
+
+        Returns:
+            tuple or None - (id, parent_id, accepted_id, scientific_name,
+                canonical_name, rank, status)
+        """
+        return self.db.execute("SELECT * FROM taxa WHERE id = ?", (int(key),)).fetchone()
+
+    def classification(self, key):
+        """Classification of the taxon with key.
+
+        Arguments:
+            key (int) - GBIF taxon key of an accepted taxon.
+
+        Returns:
+            list - of {"key": str, "name": str, "rank": str} dicts for the
+                ranks in RANKS, from KINGDOM down, in the same shape as the
+                GBIF name_backbone classification.
+        """
+        classification = []
+        taxon = self.taxon(key)
+        while taxon is not None:
+            (id, parent_id, _, _, canonical_name, rank, _) = taxon
+            if rank in self.RANKS:
+                classification.append({"key": str(id), "name": canonical_name, "rank": rank})
+            taxon = self.taxon(parent_id) if parent_id is not None else None
+        classification.reverse()
+        return classification
+
+    def match(self, name, rank="SPECIES"):
+        """Match a name against the backbone.
+
+        The name is matched exactly against scientific names (with
+        authorship) and then canonical names. Accepted taxa are preferred to
+        doubtful ones and synonyms, and synonyms are resolved to the accepted
+        taxon.
+
+        Arguments:
+            name (str) - scientific or canonical name.
+            rank (str) - rank to restrict the match to, None for any.
+
+        Returns:
+            dict - in the same shape as the GBIF name_backbone response with
+                "usage", "classification" and "diagnostics" keys, or with just
+                "diagnostics" with "matchType" of "NONE" if there is no match.
+        """
+        rows = []
+        for column in ("scientific_name", "canonical_name"):
+            rows = self.db.execute("SELECT * FROM taxa WHERE %s = ?" % column, (name,)).fetchall()
+            if rank is not None:
+                rows = [row for row in rows if row[5] == rank]
+            if len(rows) > 0:
+                break
+        if len(rows) == 0:
+            return {"diagnostics": {"matchType": "NONE"}}
+        status_order = {"ACCEPTED": 0, "DOUBTFUL": 1}
+        rows.sort(key=lambda row: (status_order.get(row[6], 2), row[0]))
+        best = rows[0]
+        diagnostics = {"matchType": "EXACT", "status": best[6]}
+        if len(rows) > 1 and status_order.get(rows[1][6], 2) == status_order.get(best[6], 2):
+            diagnostics["note"] = "%d equal matches" % len(rows)
+        if best[2] is not None and best[6] != "ACCEPTED":
+            accepted = self.taxon(best[2])
+            if accepted is not None:
+                diagnostics["matchedSynonym"] = best[4]
+                best = accepted
+        usage = {"key": str(best[0]), "name": best[3], "canonicalName": best[4], "rank": best[5]}
+        return {"usage": usage, "classification": self.classification(best[0]), "diagnostics": diagnostics}
+
+    def vernacular_name(self, key, language="en"):
+        """Vernacular name for taxon with key.
+
+        Arguments:
+            key (int) - GBIF taxon key.
+            language (str) - language code as used in the dump, "en" matches
+                "en" and "eng".
+
+        Returns:
+            str or None - the first vernacular name in the language, None if
+                there isn't one.
+        """
+        languages = ("en", "eng") if language in ("en", "eng") else (language,)
+        row = self.db.execute("SELECT name FROM vernacular WHERE id = ? AND language IN (%s) ORDER BY rowid LIMIT 1"
+                              % ", ".join("?" * len(languages)), (int(key),) + languages).fetchone()
+        return None if row is None else row[0]
+
+    def close(self):
+        """Close the index database."""
+        if self.db is not None:
+            self.db.close()
+            self.db = None
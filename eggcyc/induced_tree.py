@@ -0,0 +1,98 @@
+"""Eggcyclopedia of Wood cache of Open Tree induced subtrees."""
+
+import json
+import logging
+import os
+import re
+
+from .files import atomic_write
+from .phylogeny import Phylogeny
+
+
+class InducedTreeCache():
+    """On-disk cache of synth_induced_tree results.
+
+    Entries are keyed by the synthesis version (synth_id) and the sorted set
+    of OTT ids. A request for a set of ids that is a subset of a cached
+    entry for the same synthesis version is answered by pruning the cached
+    tree locally, so removing species never needs a new call.
+
+    Example:
+    >>> cache = InducedTreeCache()
+    >>> newick = cache.get(synth_id, ott_ids)
+    >>> if newick is None:
+    ...     newick = OT.synth_induced_tree(ott_ids=ott_ids, label_format="name_and_id").response_dict["newick"]
+    ...     cache.put(synth_id, ott_ids, newick)
+    """
+
+    def __init__(self, filename="induced_tree_cache.json", max_entries=5):
+        """Initialize InducedTreeCache object.
+
+        Arguments:
+            filename (str) - JSON cache file.
+            max_entries (int) - maximum number of trees to keep, the oldest
+                are dropped.
+        """
+        self.filename = filename
+        self.max_entries = max_entries
+        self.entries = []  # most recently added first
+        if os.path.exists(filename):
+            with open(filename, "r", encoding="utf-8") as fh:
+                self.entries = json.load(fh)
+
+    def write(self):
+        """Write the cache file."""
+        atomic_write(self.filename, json.dumps(self.entries, sort_keys=True))
+
+    @staticmethod
+    def ott_id_of(label):
+        """OTT id at end of a name_and_id label, None if there isn't one."""
+        if label is None or label.startswith("mrcaott"):
+            return None
+        m = re.search(r"""\bott(\d+)$""", label)
+        return int(m.group(1)) if m else None
+
+    def get(self, synth_id, ott_ids):
+        """Newick induced tree for ott_ids, or None if not cached.
+
+        Arguments:
+            synth_id (str) - synthesis version.
+            ott_ids (list) - OTT ids of the tips wanted.
+
+        Returns:
+            str or None - Newick tree.
+        """
+        wanted = set(int(id) for id in ott_ids)
+        best = None
+        for entry in self.entries:
+            if entry["synth_id"] != synth_id:
+                continue
+            cached = set(entry["ott_ids"])
+            if cached == wanted:
+                best = entry
+                break
+            if wanted <= cached and (best is None or len(cached) < len(best["ott_ids"])):
+                best = entry
+        if best is None:
+            return None
+        if len(best["ott_ids"]) == len(wanted):
+            logging.info("Using cached induced tree for %d ott_ids", len(wanted))
+            return best["newick"]
+        logging.info("Pruning cached induced tree of %d ott_ids to %d", len(best["ott_ids"]), len(wanted))
+        tree = Phylogeny.from_newick(best["newick"])
+        keep = set(node for node in range(len(tree)) if self.ott_id_of(tree.label(node)) in wanted)
+        return tree.prune(keep).to_newick()
+
+    def put(self, synth_id, ott_ids, newick):
+        """Add induced tree to the cache and write it.
+
+        Arguments:
+            synth_id (str) - synthesis version.
+            ott_ids (list) - OTT ids of the tips.
+            newick (str) - Newick tree.
+        """
+        ott_ids = sorted(set(int(id) for id in ott_ids))
+        self.entries = [e for e in self.entries if not (e["synth_id"] == synth_id and e["ott_ids"] == ott_ids)]
+        self.entries.insert(0, {"synth_id": synth_id, "ott_ids": ott_ids, "newick": newick})
+        del self.entries[self.max_entries:]
+        self.write()
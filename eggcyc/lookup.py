@@ -0,0 +1,138 @@
+"""Eggcyclopedia of Wood concurrent web service lookup engine."""
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import time
+
+import requests
+
+
+class RateLimiter():
+    """Thread-safe limiter of the rate of calls to each host.
+
+    Calls to the same host are spaced by at least 1/rate seconds, calls
+    to different hosts are independent.
+    """
+
+    def __init__(self, rates=None, default_rate=10.0):
+        """Initialize RateLimiter object.
+
+        Arguments:
+            rates (dict) - maximum calls per second indexed by host name.
+            default_rate (float) - maximum calls per second for hosts not in
+                rates, None or 0 for no limit.
+        """
+        self.rates = rates if rates is not None else {}
+        self.default_rate = default_rate
+        self._next_time = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host):
+        """Block until a call to host is allowed.
+
+        Arguments:
+            host (str) - host name the call will be made to.
+        """
+        rate = self.rates.get(host, self.default_rate)
+        if not rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_time.get(host, now))
+            self._next_time[host] = slot + 1.0 / rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class LookupEngine():
+    """Run lookups concurrently with rate limiting and retries.
+
+    Example:
+    >>> engine = LookupEngine(max_workers=4)
+    >>> engine.run(["Quercus rubra", "Acer negundo"], lookup_fn, host="api.gbif.org")
+    {'Quercus rubra': ..., 'Acer negundo': ...}
+    """
+
+    def __init__(self, max_workers=8, rate_limiter=None, retries=3, backoff=1.0):
+        """Initialize LookupEngine object.
+
+        Arguments:
+            max_workers (int) - maximum number of concurrent lookups, 1 to
+                run serially.
+            rate_limiter (RateLimiter) - per-host rate limiter, a default one
+                is created if None.
+            retries (int) - number of retries after the first attempt for
+                transient errors.
+            backoff (float) - initial delay in seconds before a retry, doubled
+                for each subsequent retry.
+        """
+        self.max_workers = max(1, max_workers)
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.retries = retries
+        self.backoff = backoff
+
+    @staticmethod
+    def is_transient(e):
+        """True if exception e is worth retrying.
+
+        Arguments:
+            e (Exception) - exception raised by a lookup.
+        """
+        if isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            return True
+        if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+            return e.response.status_code == 429 or e.response.status_code >= 500
+        return False
+
+    def call(self, fn, item, host):
+        """Call fn(item) with rate limiting and retries.
+
+        Arguments:
+            fn (callable) - lookup function taking a single item.
+            item - the item to look up.
+            host (str) - host name used for rate limiting.
+
+        Returns:
+            result of fn(item).
+
+        Raises:
+            Exception - the last exception if all attempts fail, or the
+                first non-transient exception.
+        """
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            self.rate_limiter.wait(host)
+            try:
+                return fn(item)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                if attempt >= self.retries or not self.is_transient(e):
+                    raise
+                logging.info("Retrying lookup for %s in %.1fs (%s)", item, delay, str(e))
+                time.sleep(delay)
+                delay *= 2
+
+    def run(self, items, fn, host):
+        """Run fn for each of items concurrently.
+
+        Arguments:
+            items (iterable) - items to look up, must be hashable.
+            fn (callable) - lookup function taking a single item.
+            host (str) - host name used for rate limiting.
+
+        Returns:
+            dict - indexed by item in the same order as items, values are
+                either the result of fn(item) or the Exception raised.
+        """
+        items = list(items)
+        results = {}
+        if len(items) == 0:
+            return results
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as executor:
+            futures = [executor.submit(self.call, fn, item, host) for item in items]
+            for item, future in zip(items, futures):
+                try:
+                    results[item] = future.result()
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    results[item] = e
+        return results
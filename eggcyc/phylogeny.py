@@ -0,0 +1,379 @@
+"""Eggcyclopedia of Wood compact array-backed phylogeny."""
+
+from array import array
+import math
+import re
+
+
+class Phylogeny():
+    """Phylogenetic tree stored as parallel arrays.
+
+    For node i the arrays hold parent[i] (-1 for the root), first_child[i]
+    and next_sibling[i] (-1 if none), length[i] (branch length to the parent,
+    NaN if not given) and label_id[i] (index into labels, -1 if unlabelled).
+    Labels are interned so repeated labels are stored once.
+
+    Nodes are always in pre-order: node 0 is the root, every parent comes
+    before its children, and each subtree is a contiguous range of nodes.
+    That makes depth, age and subtree operations single passes over the
+    arrays with no recursion or per-node objects.
+
+    Example:
+    >>> tree = Phylogeny.from_newick("((A:1,B:2)C:3,D:4)E;")
+    >>> [tree.label(node) for node in range(len(tree))]
+    ['E', 'C', 'A', 'B', 'D']
+    >>> list(tree.depths())
+    [0.0, 3.0, 4.0, 5.0, 4.0]
+    """
+
+    def __init__(self):
+        """Initialize empty Phylogeny object."""
+        self.parent = array("i")
+        self.first_child = array("i")
+        self.next_sibling = array("i")
+        self.length = array("d")
+        self.label_id = array("i")
+        self.labels = []
+        self._label_ids = {}
+        self._last_child = array("i")
+        self._nodes_by_label_id = None
+
+    def __len__(self):
+        """Number of nodes."""
+        return len(self.parent)
+
+    def add_node(self, parent, label=None, length=None):
+        """Add a node as the last child of parent.
+
+        Nodes must be added in pre-order, i.e. each subtree completely
+        before the next sibling.
+
+        Arguments:
+            parent (int) - parent node index, -1 for the root.
+            label (str) - node label, optional.
+            length (float) - branch length, optional.
+
+        Returns:
+            int - the new node index.
+        """
+        node = len(self.parent)
+        self.parent.append(parent)
+        self.first_child.append(-1)
+        self.next_sibling.append(-1)
+        self._last_child.append(-1)
+        self.length.append(math.nan if length is None else length)
+        self.label_id.append(-1)
+        if parent >= 0:
+            last = self._last_child[parent]
+            if last < 0:
+                self.first_child[parent] = node
+            else:
+                self.next_sibling[last] = node
+            self._last_child[parent] = node
+        if label is not None:
+            self.set_label(node, label)
+        return node
+
+    def set_label(self, node, label):
+        """Set label of node."""
+        label_id = self._label_ids.get(label)
+        if label_id is None:
+            label_id = len(self.labels)
+            self.labels.append(label)
+            self._label_ids[label] = label_id
+        self.label_id[node] = label_id
+        self._nodes_by_label_id = None
+
+    def label(self, node):
+        """Label of node, None if unlabelled."""
+        label_id = self.label_id[node]
+        return None if label_id < 0 else self.labels[label_id]
+
+    def branch_length(self, node):
+        """Branch length of node, None if not given."""
+        length = self.length[node]
+        return None if math.isnan(length) else length
+
+    def children(self, node):
+        """Iterate over children of node in order."""
+        child = self.first_child[node]
+        while child >= 0:
+            yield child
+            child = self.next_sibling[child]
+
+    def is_tip(self, node):
+        """True if node has no children."""
+        return self.first_child[node] < 0
+
+    def tips(self):
+        """List of tip nodes in order."""
+        return [node for node in range(len(self)) if self.first_child[node] < 0]
+
+    def find(self, label):
+        """First node with label, None if not found."""
+        if self._nodes_by_label_id is None:
+            self._nodes_by_label_id = {}
+            for node in range(len(self) - 1, -1, -1):
+                self._nodes_by_label_id[self.label_id[node]] = node
+        label_id = self._label_ids.get(label)
+        return None if label_id is None else self._nodes_by_label_id.get(label_id)
+
+    def levels(self):
+        """Number of edges from the root to each node.
+
+        Returns:
+            array - of int indexed by node.
+        """
+        levels = array("i", bytes(4 * len(self)))
+        for node in range(1, len(self)):
+            levels[node] = levels[self.parent[node]] + 1
+        return levels
+
+    def depths(self):
+        """Distance from the root to each node, missing lengths count as 0.
+
+        Returns:
+            array - of float indexed by node.
+        """
+        depths = array("d", bytes(8 * len(self)))
+        for node in range(1, len(self)):
+            length = self.length[node]
+            depths[node] = depths[self.parent[node]] + (0.0 if math.isnan(length) else length)
+        return depths
+
+    def heights(self):
+        """Greatest distance from each node to a tip below it.
+
+        For a dated (ultrametric) tree this is the age of each node.
+
+        Returns:
+            array - of float indexed by node.
+        """
+        heights = array("d", bytes(8 * len(self)))
+        # Children always follow their parents so a reverse pass sees every
+        # child before its parent
+        for node in range(len(self) - 1, 0, -1):
+            length = self.length[node]
+            height = heights[node] + (0.0 if math.isnan(length) else length)
+            parent = self.parent[node]
+            if height > heights[parent]:
+                heights[parent] = height
+        return heights
+
+    def ancestors(self, node):
+        """List of node and its ancestors up to the root."""
+        path = []
+        while node >= 0:
+            path.append(node)
+            node = self.parent[node]
+        return path
+
+    def mrca(self, nodes, levels=None):
+        """Most recent common ancestor of nodes.
+
+        Arguments:
+            nodes (iterable) - node indexes, at least one.
+            levels (array) - result of levels(), pass it in when making many
+                queries to avoid recomputing it.
+
+        Returns:
+            int - node index of the most recent common ancestor.
+        """
+        if levels is None:
+            levels = self.levels()
+        nodes = iter(nodes)
+        a = next(nodes)
+        for b in nodes:
+            while levels[a] > levels[b]:
+                a = self.parent[a]
+            while levels[b] > levels[a]:
+                b = self.parent[b]
+            while a != b:
+                a = self.parent[a]
+                b = self.parent[b]
+        return a
+
+    def subtree_end(self, node):
+        """Index one past the last node in the subtree of node."""
+        while node >= 0:
+            sibling = self.next_sibling[node]
+            if sibling >= 0:
+                return sibling
+            node = self.parent[node]
+        return len(self)
+
+    def subtree(self, node):
+        """Copy of the subtree rooted at node.
+
+        Arguments:
+            node (int) - root of the subtree.
+
+        Returns:
+            Phylogeny - new tree with node as the root.
+        """
+        tree = Phylogeny()
+        offset = node
+        for old in range(node, self.subtree_end(node)):
+            parent = self.parent[old] - offset if old != node else -1
+            tree.add_node(parent, label=self.label(old), length=self.branch_length(old))
+        return tree
+
+    def prune(self, keep):
+        """Tree induced by the nodes in keep.
+
+        The new tree has the nodes in keep, their ancestors, and nothing
+        below them. Ancestors that are left with a single child because of
+        the pruning are removed and their branch lengths added to the child,
+        nodes that had a single child in the original tree are kept.
+
+        Arguments:
+            keep (iterable) - node indexes to keep.
+
+        Returns:
+            Phylogeny - the pruned tree.
+        """
+        keep = set(keep)
+        n = len(self)
+        marked = bytearray(n)
+        for node in keep:
+            while node >= 0 and not marked[node]:
+                marked[node] = 1
+                node = self.parent[node]
+        num_children = array("i", bytes(4 * n))
+        num_kept_children = array("i", bytes(4 * n))
+        for node in range(1, n):
+            num_children[self.parent[node]] += 1
+            if marked[node]:
+                num_kept_children[self.parent[node]] += 1
+        tree = Phylogeny()
+        new_index = array("i", [-1]) * n
+        carried = [None] * n  # branch length carried down from removed nodes
+        for node in range(n):
+            if not marked[node]:
+                continue
+            parent = self.parent[node]
+            new_parent = new_index[parent] if parent >= 0 else -1
+            length = self.branch_length(node)
+            if parent >= 0 and carried[parent] is not None:
+                length = carried[parent] + (length or 0.0)
+            if node not in keep and num_kept_children[node] == 1 and num_children[node] > 1:
+                new_index[node] = new_parent
+                carried[node] = length
+                continue
+            new_index[node] = tree.add_node(new_parent, label=self.label(node), length=length)
+        return tree
+
+    @classmethod
+    def from_newick(cls, text):
+        """Parse a Newick string.
+
+        Single pass over the string without recursion, so very large and
+        deep trees can be parsed. Unquoted labels have underscores replaced
+        by spaces as the Newick format specifies.
+
+        Arguments:
+            text (str) - Newick tree, the trailing ";" is optional.
+
+        Returns:
+            Phylogeny - the parsed tree.
+
+        Raises:
+            ValueError - if the string is not valid Newick.
+        """
+        tree = cls()
+        current = tree.add_node(-1)
+        stack = []  # open ancestors
+        i = 0
+        n = len(text)
+        while i < n:
+            c = text[i]
+            if c == "(":
+                stack.append(current)
+                current = tree.add_node(current)
+                i += 1
+            elif c == ",":
+                if not stack:
+                    raise ValueError("Unexpected , at position %d" % i)
+                current = tree.add_node(stack[-1])
+                i += 1
+            elif c == ")":
+                if not stack:
+                    raise ValueError("Unbalanced ) at position %d" % i)
+                current = stack.pop()
+                i += 1
+            elif c == ":":
+                j = i + 1
+                while j < n and text[j] not in "(),:;[" and not text[j].isspace():
+                    j += 1
+                try:
+                    tree.length[current] = float(text[i + 1:j])
+                except ValueError as e:
+                    raise ValueError("Bad branch length at position %d" % i) from e
+                i = j
+            elif c == ";":
+                break
+            elif c.isspace():
+                i += 1
+            elif c == "[":
+                j = text.find("]", i)
+                if j < 0:
+                    raise ValueError("Unterminated comment at position %d" % i)
+                i = j + 1
+            elif c == "'":
+                label = []
+                j = i + 1
+                while True:
+                    k = text.find("'", j)
+                    if k < 0:
+                        raise ValueError("Unterminated quoted label at position %d" % i)
+                    label.append(text[j:k])
+                    if k + 1 < n and text[k + 1] == "'":
+                        label.append("'")
+                        j = k + 2
+                    else:
+                        break
+                tree.set_label(current, "".join(label))
+                i = k + 1
+            else:
+                j = i
+                while j < n and text[j] not in "(),:;[" and not text[j].isspace():
+                    j += 1
+                tree.set_label(current, text[i:j].replace("_", " "))
+                i = j
+        if stack:
+            raise ValueError("Unbalanced ( in Newick string")
+        return tree
+
+    @staticmethod
+    def format_label(label):
+        """Format label for Newick output.
+
+        Spaces become underscores, labels that would not then read back
+        unchanged are quoted.
+        """
+        if re.search(r"""[(),:;\[\]'_]""", label) or re.search(r"""\s""", label.replace(" ", "")):
+            return "'" + label.replace("'", "''") + "'"
+        return label.replace(" ", "_")
+
+    def to_newick(self):
+        """Newick string for this tree.
+
+        Returns:
+            str - Newick tree with trailing ";".
+        """
+        strings = [None] * len(self)
+        # Going backwards every child is done before its parent
+        for node in range(len(self) - 1, -1, -1):
+            s = ""
+            if self.first_child[node] >= 0:
+                kids = list(self.children(node))
+                s = "(" + ",".join(strings[child] for child in kids) + ")"
+                for child in kids:
+                    strings[child] = None
+            label = self.label(node)
+            if label is not None:
+                s += self.format_label(label)
+            if not math.isnan(self.length[node]):
+                s += ":" + repr(self.length[node])
+            strings[node] = s
+        return strings[0] + ";"
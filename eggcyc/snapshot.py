@@ -0,0 +1,169 @@
+"""Eggcyclopedia of Wood fast-loading snapshots of processed JSON data."""
+
+from collections.abc import Mapping
+import hashlib
+import json
+import logging
+import marshal
+import mmap
+import os
+import struct
+import sys
+import time
+
+from .files import atomic_write_bytes, file_sha256
+
+
+class JsonSnapshot(Mapping):
+    """Read-only mapping loaded from a compiled snapshot of a JSON object file.
+
+    The JSON file (e.g. trees_processed.json) is a dict of entries. The
+    snapshot stores each entry separately serialized with marshal, after an
+    index of entry offsets, so opening it reads only the index and each
+    entry is decoded on first access.
+
+    The snapshot records the size and mtime_ns of the JSON file, so while
+    those are unchanged the JSON file isn't read at all. If they differ
+    the SHA-256 hash of the JSON file, also recorded, is compared and the
+    snapshot is regenerated only if the content has changed. As in
+    BuildGraph, the stat of a JSON file modified in the last few seconds
+    isn't recorded because it could change again within the mtime
+    resolution.
+
+    The mapping can't be changed but decoded entries are cached and the
+    same object is returned for each access to a key, so callers must copy
+    an entry rather than modify it.
+
+    Example:
+    >>> trees = JsonSnapshot("trees_processed.json")
+    >>> trees["Quercus rubra"]["common_name"]
+    'Northern red oak'
+    """
+
+    MAGIC = b"EGGSNAP2"
+    RACY_NS = 2 * 10**9  # Don't trust stat of files modified more recently
+
+    def __init__(self, json_filename, snapshot_filename=None):
+        """Initialize JsonSnapshot, compiling the snapshot if necessary.
+
+        Arguments:
+            json_filename (str) - JSON file with an object at the top level.
+            snapshot_filename (str) - snapshot file, defaults to json_filename
+                with extension ".snapshot".
+        """
+        self.json_filename = json_filename
+        if snapshot_filename is None:
+            snapshot_filename = os.path.splitext(json_filename)[0] + ".snapshot"
+        self.snapshot_filename = snapshot_filename
+        self._decoded = {}
+        stat = os.stat(json_filename)
+        self.source_stat = [stat.st_size, stat.st_mtime_ns]
+        self.source_hash = None  # computed only if needed
+        if not self.open():
+            with open(json_filename, "rb") as fh:
+                json_bytes = fh.read()
+            self.source_hash = hashlib.sha256(json_bytes).hexdigest()
+            self.compile(json.loads(json_bytes))
+            if not self.open():
+                raise ValueError("Failed to open snapshot %s" % snapshot_filename)
+
+    def version(self):
+        """Version string that must match for a snapshot to be used.
+
+        The marshal format depends on the Python version.
+        """
+        return "marshal%d py%d.%d" % (marshal.version, sys.version_info[0], sys.version_info[1])
+
+    def recorded_stat(self):
+        """JSON file [size, mtime_ns] to record, None if modified too recently to trust."""
+        if time.time_ns() - self.source_stat[1] > self.RACY_NS:
+            return self.source_stat
+        return None
+
+    def open(self):
+        """Open the snapshot if it exists and is up to date.
+
+        Returns:
+            bool - True if opened.
+        """
+        if not os.path.exists(self.snapshot_filename):
+            return False
+        with open(self.snapshot_filename, "rb") as fh:
+            if os.fstat(fh.fileno()).st_size < len(self.MAGIC) + 8:
+                return False
+            self._map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if self._map[:len(self.MAGIC)] != self.MAGIC:
+                raise ValueError("bad magic")
+            (header_len,) = struct.unpack_from("<Q", self._map, len(self.MAGIC))
+            self._data_start = len(self.MAGIC) + 8 + header_len
+            version, source_stat, source_hash, self._index = marshal.loads(
+                self._map[len(self.MAGIC) + 8:self._data_start])
+        except (ValueError, EOFError, TypeError, struct.error) as e:
+            logging.warning("Ignoring bad snapshot %s (%s)", self.snapshot_filename, str(e))
+            version = None
+        if version == self.version() and source_stat != self.source_stat:
+            if self.source_hash is None:
+                self.source_hash = file_sha256(self.json_filename)
+            if source_hash != self.source_hash:
+                version = None
+            elif self.recorded_stat() is not None:
+                # Content unchanged, record the new stat to skip hashing next time
+                logging.info("Updating snapshot %s for unchanged %s", self.snapshot_filename, self.json_filename)
+                data = self._map[self._data_start:]
+                self._map.close()
+                self.write(self._index, data)
+                return self.open()
+        if version != self.version():
+            logging.info("Snapshot %s is out of date", self.snapshot_filename)
+            self._map.close()
+            return False
+        logging.info("Using snapshot %s with %d entries", self.snapshot_filename, len(self._index))
+        return True
+
+    def compile(self, data):
+        """Write snapshot of data.
+
+        Arguments:
+            data (dict) - the parsed JSON data.
+        """
+        logging.warning("Compiling snapshot %s from %s", self.snapshot_filename, self.json_filename)
+        blobs = []
+        index = {}
+        offset = 0
+        for key, value in data.items():
+            blob = marshal.dumps(value)
+            index[key] = (offset, len(blob))
+            blobs.append(blob)
+            offset += len(blob)
+        self.write(index, b"".join(blobs))
+
+    def write(self, index, data):
+        """Write snapshot file.
+
+        Arguments:
+            index (dict) - (offset, length) in data of each entry by key.
+            data (bytes) - the marshalled entries.
+        """
+        header = marshal.dumps((self.version(), self.recorded_stat(), self.source_hash, index))
+        atomic_write_bytes(self.snapshot_filename, b"".join([self.MAGIC, struct.pack("<Q", len(header)), header, data]))
+
+    def __getitem__(self, key):
+        """Entry for key, decoded on first access."""
+        if key not in self._decoded:
+            offset, length = self._index[key]
+            start = self._data_start + offset
+            self._decoded[key] = marshal.loads(self._map[start:start + length])
+        return self._decoded[key]
+
+    def __iter__(self):
+        """Iterate over keys in the order of the JSON file."""
+        return iter(self._index)
+
+    def __len__(self):
+        """Number of entries."""
+        return len(self._index)
+
+    def __contains__(self, key):
+        """True if key is an entry, without decoding it."""
+        return key in self._index
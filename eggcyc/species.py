@@ -0,0 +1,178 @@
+"""Eggcyclopedia of Wood species record type."""
+
+from collections.abc import MutableMapping
+import copy
+import sys
+
+
+class Species(MutableMapping):
+    """Data for one species, a slotted record with a dict-like interface.
+
+    The known fields are stored in slots rather than a per-species dict.
+    The GBIF classification is stored as a tuple of interned (rank, name,
+    key) tuples rather than a list of dicts per species. Given an intern
+    table, as Trees does for its species, the tuples are shared between all
+    species with the same taxon. Any other keys are kept in a small extra
+    dict.
+
+    Species behaves as a mapping with the same keys and values as the JSON
+    shape of trees_processed.json, so existing code and templates can use
+    species["common_name"], species["gbif_classification"] etc. Use
+    classification directly in loops over many species to avoid building
+    the list of dicts.
+
+    The dirty flag is set by any change through the mapping interface so
+    that a SpeciesStore need only write changed species. Nested values such
+    as the provenance dict must be assigned again after modification to set
+    it.
+
+    Example:
+    >>> sp = Species.from_json({"common_name": "Boxelder", "ott_id": 948925})
+    >>> sp["common_name"]
+    'Boxelder'
+    >>> sp.to_json()
+    {'common_name': 'Boxelder', 'ott_id': 948925}
+    """
+
+    FIELDS = ("common_name", "ott_id", "gbif_id", "cross_between", "skip", "provenance")
+    __slots__ = FIELDS + ("classification", "extra", "dirty")
+
+    def __init__(self):
+        """Initialize empty Species object."""
+        self.extra = None
+        self.dirty = True
+
+    @staticmethod
+    def intern_taxon(rank, name, key, taxa=None):
+        """(rank, name, key) tuple for a taxon, shared via taxa if given.
+
+        Arguments:
+            rank, name, key - the taxon.
+            taxa (dict) - intern table of taxon tuples, None to not share.
+        """
+        taxon = (rank, name, key)
+        interned = taxa.get(taxon) if taxa is not None else None
+        if interned is None:
+            interned = (sys.intern(rank), sys.intern(name), sys.intern(key) if isinstance(key, str) else key)
+            if taxa is not None:
+                taxa[interned] = interned
+        return interned
+
+    def set_classification(self, value, taxa=None):
+        """Set gbif_classification from its JSON shape.
+
+        Arguments:
+            value (list) - GBIF classification as a list of dicts.
+            taxa (dict) - intern table of taxon tuples, None to not share.
+        """
+        self.dirty = True
+        self.classification = tuple(self.intern_taxon(r["rank"], r["name"], r["key"], taxa) for r in value)
+
+    @classmethod
+    def from_json(cls, data, dirty=True, taxa=None):
+        """Create Species from its JSON shape.
+
+        Arguments:
+            data (dict) - species data as in trees_processed.json.
+            dirty (bool) - False if the data is already in the store.
+            taxa (dict) - intern table of taxon tuples, None to not share.
+
+        Returns:
+            Species - new record.
+        """
+        species = cls()
+        for key, value in data.items():
+            if key == "gbif_classification":
+                species.set_classification(value, taxa)
+            else:
+                species[key] = value
+        species.dirty = dirty
+        return species
+
+    def to_json(self):
+        """JSON shape of this species, as in trees_processed.json.
+
+        Returns:
+            dict - new dict of species data.
+        """
+        return dict(self.items())
+
+    def __getitem__(self, key):
+        """Value for key in JSON shape."""
+        try:
+            if key == "gbif_classification":
+                return [{"key": k, "name": name, "rank": rank} for (rank, name, k) in self.classification]
+            if key in self.FIELDS:
+                return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+        if self.extra is None:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        """Set value for key from JSON shape."""
+        self.dirty = True
+        if key == "gbif_classification":
+            self.set_classification(value)
+        elif key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        """Remove key."""
+        self.dirty = True
+        try:
+            if key == "gbif_classification":
+                del self.classification
+                return
+            if key in self.FIELDS:
+                delattr(self, key)
+                return
+        except AttributeError:
+            raise KeyError(key) from None
+        if self.extra is None:
+            raise KeyError(key)
+        del self.extra[key]
+
+    def __iter__(self):
+        """Iterate over keys that are set."""
+        for key in self.FIELDS:
+            if hasattr(self, key):
+                yield key
+        if hasattr(self, "classification"):
+            yield "gbif_classification"
+        if self.extra is not None:
+            yield from self.extra
+
+    def __len__(self):
+        """Number of keys that are set."""
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        """True if key is set, without building its value."""
+        if key == "gbif_classification":
+            return hasattr(self, "classification")
+        if key in self.FIELDS:
+            return hasattr(self, key)
+        return self.extra is not None and key in self.extra
+
+    def __deepcopy__(self, memo):
+        """Deep copy, classification tuples are immutable so are shared."""
+        species = Species()
+        for key in self.FIELDS:
+            if hasattr(self, key):
+                setattr(species, key, copy.deepcopy(getattr(self, key), memo))
+        if hasattr(self, "classification"):
+            species.classification = self.classification
+        if self.extra is not None:
+            species.extra = copy.deepcopy(self.extra, memo)
+        species.dirty = self.dirty
+        return species
+
+    def __repr__(self):
+        """Representation showing JSON shape."""
+        return "Species(%r)" % self.to_json()
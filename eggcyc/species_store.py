@@ -0,0 +1,108 @@
+"""Eggcyclopedia of Wood incremental species data store."""
+
+import json
+import logging
+import sqlite3
+
+from .files import atomic_write
+
+
+class SpeciesStore():
+    """SQLite backed store of per-species data.
+
+    An alternative to rewriting the whole of trees_processed.json on every
+    change. Each species is one row holding its data as canonical JSON, so
+    single records can be read without loading the catalog, and commit()
+    writes only the species given as changed or removed, in one
+    transaction. Trees.write_store() uses the Species dirty flags so that
+    unchanged species are not serialized or compared.
+
+    Example:
+    >>> store = SpeciesStore("trees_processed.sqlite")
+    >>> store.get("Quercus rubra")["common_name"]
+    'Northern red oak'
+    >>> store.commit({"Quercus rubra": trees.trees["Quercus rubra"]})
+    >>> store.export_json("trees_processed.json")
+    """
+
+    def __init__(self, filename="trees_processed.sqlite"):
+        """Initialize SpeciesStore object.
+
+        Arguments:
+            filename (str) - SQLite file, created if it doesn't exist.
+        """
+        self.filename = filename
+        self.db = sqlite3.connect(filename)
+        self.db.execute("CREATE TABLE IF NOT EXISTS species (name TEXT PRIMARY KEY, data TEXT)")
+        self.db.commit()
+
+    @staticmethod
+    def serialize(data):
+        """Canonical JSON for the data of one species."""
+        return json.dumps(data, sort_keys=True, separators=(",", ":"))
+
+    def __len__(self):
+        """Number of species in store."""
+        return self.db.execute("SELECT COUNT(*) FROM species").fetchone()[0]
+
+    def names(self):
+        """List of species names in store, sorted."""
+        return [row[0] for row in self.db.execute("SELECT name FROM species ORDER BY name")]
+
+    def get(self, name):
+        """Data for one species, None if not in store.
+
+        Arguments:
+            name (str) - species name.
+        """
+        row = self.db.execute("SELECT data FROM species WHERE name = ?", (name,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def load_all(self):
+        """Data for all species.
+
+        Returns:
+            dict - indexed by species name, in name order.
+        """
+        return {name: json.loads(data) for name, data in self.db.execute("SELECT name, data FROM species ORDER BY name")}
+
+    def commit(self, changed, removed=()):
+        """Write changed and removed species.
+
+        All changes are made in one transaction so the store is never left
+        partly updated.
+
+        Arguments:
+            changed (dict) - data for species added or changed, indexed by
+                species name.
+            removed (iterable) - names of species to remove.
+
+        Returns:
+            int - number of species added, changed or removed.
+        """
+        upserts = [(name, self.serialize(data)) for name, data in changed.items()]
+        removed = [(name,) for name in removed]
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO species VALUES (?, ?)", upserts)
+            self.db.executemany("DELETE FROM species WHERE name = ?", removed)
+        num_changed = len(upserts) + len(removed)
+        logging.info("Committed %d changed species to %s", num_changed, self.filename)
+        return num_changed
+
+    def export_json(self, filename="trees_processed.json"):
+        """Write deterministic JSON export of the store.
+
+        Same pretty-print format as Trees.write_tree_list() so that diffs
+        show up nicely between git copies of the file.
+
+        Arguments:
+            filename (str): name of file to write
+        """
+        print(f"Exporting tree data to {filename}")
+        atomic_write(filename, json.dumps(self.load_all(), indent=2, sort_keys=True))
+
+    def close(self):
+        """Close the store database."""
+        if self.db is not None:
+            self.db.close()
+            self.db = None
@@ -0,0 +1,121 @@
+"""Eggcyclopedia of Wood taxonomy tree built from GBIF classifications."""
+
+import logging
+
+
+class TaxonNode():
+    """One taxon in a TaxonTree.
+
+    Children are indexed by name so that the same name may be used at
+    different places in the tree, e.g. a genus and family with the same
+    name.
+    """
+
+    __slots__ = ("name", "rank", "key", "parent", "children", "count")
+
+    def __init__(self, name, rank, key=None, parent=None):
+        """Initialize TaxonNode object.
+
+        Arguments:
+            name (str) - taxon name.
+            rank (str) - taxon rank, e.g. "GENUS".
+            key (str) - GBIF key for the taxon, optional.
+            parent (TaxonNode) - parent node, None for the root.
+        """
+        self.name = name
+        self.rank = rank
+        self.key = key
+        self.parent = parent
+        self.children = {}
+        self.count = 0  # Number of species in subtree
+
+    def sorted_children(self):
+        """List of child nodes sorted by name."""
+        return [self.children[name] for name in sorted(self.children)]
+
+
+class TaxonTree():
+    """Rank-aware tree of taxa built from gbif_classification data.
+
+    The tree has an unnamed root node with children at the first rank
+    (KINGDOM) and leaves at the last rank (SPECIES). Each node holds the
+    number of species in its subtree, computed as species are added.
+
+    Example:
+    >>> tree = TaxonTree(["KINGDOM", "PHYLUM", "CLASS", "ORDER", "FAMILY", "GENUS", "SPECIES"])
+    >>> tree.add_trees(trees)
+    >>> tree.root.count
+    31
+    """
+
+    def __init__(self, ranks):
+        """Initialize TaxonTree object.
+
+        Arguments:
+            ranks (list) - rank names from highest to lowest, every species
+                must have a classification at each rank.
+        """
+        self.ranks = ranks
+        self.root = TaxonNode(None, None)
+
+    def add_species(self, species, classification):
+        """Add a species to the tree.
+
+        Arguments:
+            species (str) - species name, used for the SPECIES rank in
+                preference to the GBIF name.
+            classification (tuple) - GBIF classification as (rank, name, key)
+                tuples, see Trees.classification().
+
+        Returns:
+            bool - True if added, False if the classification is missing a
+                rank.
+        """
+        by_rank = {rank: (name, key) for (rank, name, key) in classification}
+        missing = [rank for rank in self.ranks if rank not in by_rank]
+        if missing:
+            logging.warning("Classification of %s is missing %s, ignoring", species, ", ".join(missing))
+            return False
+        node = self.root
+        node.count += 1
+        for rank in self.ranks:
+            (name, key) = by_rank[rank]
+            if rank == "SPECIES":
+                name = species
+            child = node.children.get(name)
+            if child is None:
+                child = TaxonNode(name, rank, key=key, parent=node)
+                node.children[name] = child
+            child.count += 1
+            node = child
+        return True
+
+    def add_trees(self, trees):
+        """Add all species in trees that have gbif_classification data.
+
+        Arguments:
+            trees (Trees) - a Trees object with data about all tree species to
+                be considered.
+        """
+        for species in trees.trees:
+            classification = trees.classification(species)
+            if classification is not None:
+                self.add_species(species, classification)
+
+    def walk(self):
+        """Iterate over all nodes except the root in depth-first order.
+
+        Children are visited in name order. Iterative so that deep trees do
+        not hit the recursion limit.
+        """
+        stack = list(reversed(self.root.sorted_children()))
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.sorted_children()))
+
+    def leaves(self):
+        """Iterate over species (leaf) nodes in depth-first order."""
+        for node in self.walk():
+            if not node.children:
+                yield node
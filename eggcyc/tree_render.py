@@ -0,0 +1,86 @@
+"""Eggcyclopedia of Wood phylogenetic tree renderer."""
+
+from .induced_tree import InducedTreeCache
+
+
+class TreeRenderer():
+    """Render a tree with OTT labels as ASCII text.
+
+    Labels in the tree are expected to be in the Open Tree "name_and_id"
+    format, e.g. "Quercus rubra ott791115" or "mrcaott2ott10" for unnamed
+    internal nodes. Nodes with an ott_id of one of our species are labelled
+    with the species and common name via a lookup table, so rendering is a
+    single pass over the tree.
+
+    The output is drawn with "|--" and "`--" connectors, one node per line
+    including named internal nodes, and so differs from the DendroPy
+    print_plot() diagram that trees_tree.txt was previously made with.
+
+    Example:
+    >>> renderer = TreeRenderer(trees)
+    >>> print(renderer.ascii(Phylogeny.from_newick(newick)))
+    """
+
+    def __init__(self, trees=None):
+        """Initialize TreeRenderer object.
+
+        Arguments:
+            trees (Trees) - Trees object used to build the ott_id to
+                species lookup table, optional.
+        """
+        self.species_by_ott_id = {}
+        self.trees = trees
+        if trees is not None:
+            for species in trees.trees:
+                if "ott_id" in trees.trees[species]:
+                    self.species_by_ott_id[int(trees.trees[species]["ott_id"])] = species
+
+    def split_label(self, label):
+        """Split a name_and_id label into name and ott_id.
+
+        Arguments:
+            label (str) - node label, may be None.
+
+        Returns:
+            tuple - (name, ott_id) where name is None for unnamed "mrca"
+                nodes and ott_id is None if there isn't one.
+        """
+        if label is None or label.startswith("mrcaott"):
+            return None, None
+        ott_id = InducedTreeCache.ott_id_of(label)
+        if ott_id is None:
+            return label, None
+        return (label[:-len("ott%d" % ott_id)].rstrip() or None), ott_id
+
+    def text_label(self, label):
+        """Plain text label "Genus species (Common name)" or taxon name."""
+        name, ott_id = self.split_label(label)
+        species = self.species_by_ott_id.get(ott_id)
+        if species is not None:
+            common_name = self.trees.trees[species].get("common_name")
+            return species + " (" + common_name + ")" if common_name else species
+        return name
+
+    def ascii(self, tree):
+        """Render tree as ASCII art, one line per node.
+
+        Arguments:
+            tree (Phylogeny) - tree to render.
+
+        Returns:
+            str - rendered tree.
+        """
+        lines = []
+        stack = [(0, "", "", "")]  # (node, prefix, connector, child_prefix)
+        while stack:
+            node, prefix, connector, child_prefix = stack.pop()
+            text = self.text_label(tree.label(node))
+            if text is None:
+                text = "" if tree.is_tip(node) else "+"
+            lines.append(prefix + connector + text)
+            kids = list(tree.children(node))
+            for j in range(len(kids) - 1, -1, -1):
+                last = j == len(kids) - 1
+                stack.append((kids[j], child_prefix, "`-- " if last else "|-- ",
+                              child_prefix + ("    " if last else "|   ")))
+        return "\n".join(lines) + "\n"
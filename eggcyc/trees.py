@@ -1,26 +1,77 @@
 #!/usr/bin/env python3
 """Eggcyclopedia of Wood tree data handling class."""
-import csv
-import gzip
+import copy
+from datetime import datetime, timezone
 import json
 import logging
-import re
+import os
 import sys
 
 from opentree import OT
 import pygbif
 
+from .cache import ResponseCache
+from .lookup import LookupEngine
+from .snapshot import JsonSnapshot
+from .species import Species
+from .usda import UsdaIndex
+
 
 class Trees():
-    """Set of trees of interest."""
+    """Set of trees of interest.
+
+    The data for each species in self.trees is a Species record, except when
+    loaded read-only from a snapshot where it is a plain dict. Both have the
+    same keys and values as the JSON files.
+    """
+
+    # Fields filled by each lookup stage, indexed by the field name used for
+    # provenance and refresh selectors
+    LOOKUP_FIELDS = {
+        "common_name": ("common_name",),
+        "ott_id": ("ott_id",),
+        "gbif_id": ("gbif_id", "gbif_classification"),
+    }
+    FIELD_ALIASES = {"gbif": "gbif_id", "gbif_classification": "gbif_id"}
 
-    def __init__(self, filename=None):
-        """Initialize Trees object."""
+    def __init__(self, filename=None, lookup_engine=None, max_age=None, refresh=None, response_cache=None,
+                 gbif_backbone=None):
+        """Initialize Trees object.
+
+        Arguments:
+            filename (str) - JSON file of tree data to load, optional.
+            lookup_engine (LookupEngine) - engine used to run web service
+                lookups, a default one is created if None.
+            max_age (timedelta) - looked up data older than this is fetched
+                again, None to keep data indefinitely.
+            refresh (list) - selectors for data to fetch again regardless of
+                age. Each selector is a field name (e.g. "ott_id"), a species
+                name, or "species:field".
+            response_cache (ResponseCache) - cache for web service responses,
+                None to not cache.
+            gbif_backbone (GbifBackbone) - local GBIF backbone index to use
+                instead of the GBIF API, None to use the API.
+        """
         self.trees = {}
+        self.taxa = {}  # intern table of classification taxa shared by species
+        self.lookup_engine = lookup_engine if lookup_engine is not None else LookupEngine()
+        self.max_age = max_age
+        self.response_cache = response_cache if response_cache is not None else ResponseCache(filename=None)
+        self.gbif_backbone = gbif_backbone
+        self.refresh = []
+        for selector in (refresh or []):
+            species, _, field = selector.rpartition(":")
+            if species == "" and field not in self.LOOKUP_FIELDS and field not in self.FIELD_ALIASES:
+                species, field = field, ""
+            field = self.FIELD_ALIASES.get(field, field)
+            if field and field not in self.LOOKUP_FIELDS:
+                logging.error("Bad refresh selector %s, field must be one of %s", selector, ", ".join(self.LOOKUP_FIELDS))
+                sys.exit(1)
+            self.refresh.append((species or None, field or None))
         if filename is not None:
             self.load_tree_list(filename)
 
-    def load_tree_list(self, filename="trees_processed.json"):
+    def load_tree_list(self, filename="trees_processed.json", snapshot=False):
         """Load list of trees that we are generating pages for.
 
         By default it loads the set of processed tree data but the
@@ -30,14 +81,21 @@ class Trees():
         Arguments:
             filename (str) - filename of JSON file in local directory that
                 has tree data.
+            snapshot (bool) - if True then load via a read-only JsonSnapshot
+                of the file which is much faster to open and decodes each
+                species on first access. Use only where the data will not be
+                modified.
 
         Returns:
-            dict - dictionary of tree that is indexed by species name. The is a
+            dict - dictionary of Species indexed by species name. The is a
                 reference to self.trees and likely only used then the Trees
                 object is not persisted.
         """
-        with open(filename, "r", encoding="utf-8") as fh:
-            self.trees = json.load(fh)
+        if snapshot:
+            self.trees = JsonSnapshot(filename)
+        else:
+            with open(filename, "r", encoding="utf-8") as fh:
+                self.trees = {name: Species.from_json(data, taxa=self.taxa) for name, data in json.load(fh).items()}
         logging.info("Read %d trees from %s", len(self.trees), filename)
         return self.trees
 
@@ -52,7 +110,51 @@ class Trees():
         """
         print(f"Writing tree data to {filename}")
         with open(filename, "w", encoding="utf-8") as fh:
-            json.dump(self.trees, fh, indent=2, sort_keys=True)
+            json.dump(self.to_json(), fh, indent=2, sort_keys=True)
+
+    def to_json(self):
+        """JSON shape of all tree data.
+
+        Returns:
+            dict - new dict of species data dicts indexed by species name.
+        """
+        return {name: dict(data) for name, data in self.trees.items()}
+
+    def load_store(self, store):
+        """Load trees from a SpeciesStore instead of a JSON file.
+
+        Arguments:
+            store (SpeciesStore) - the store to load from.
+
+        Returns:
+            dict - reference to self.trees.
+        """
+        self.trees = {name: Species.from_json(data, dirty=False, taxa=self.taxa) for name, data in store.load_all().items()}
+        logging.info("Read %d trees from %s", len(self.trees), store.filename)
+        return self.trees
+
+    def write_store(self, store):
+        """Write trees to a SpeciesStore, only changed species are written.
+
+        A species is written if it is not a Species record or its dirty
+        flag is set, and species in the store but not in self.trees are
+        removed. Only the names in the store are read.
+
+        Arguments:
+            store (SpeciesStore) - the store to write to.
+
+        Returns:
+            int - number of species added, changed or removed.
+        """
+        print(f"Writing tree data to {store.filename}")
+        changed = {name: dict(data) for name, data in self.trees.items()
+                   if not isinstance(data, Species) or data.dirty}
+        removed = set(store.names()).difference(self.trees)
+        num_changed = store.commit(changed, removed)
+        for name in changed:
+            if isinstance(self.trees[name], Species):
+                self.trees[name].dirty = False
+        return num_changed
 
     def expand_crosses(self):
         """Expand tree to include species for crosses.
@@ -71,7 +173,7 @@ class Trees():
                     if parent not in self.trees[species]:
                         to_add.append(parent)
         for species in to_add:
-            self.trees[species] = {}
+            self.trees[species] = Species()
 
     def merge_data_from(self, trees_processed):
         """Merge in data from past processing.
@@ -92,79 +194,226 @@ class Trees():
                 for key in trees_processed.trees[species]:
                     if key not in self.trees[species]:
                         self.trees[species][key] = trees_processed.trees[species][key]
-                self.trees[species] = trees_processed.trees[species]
+                # Copy so that later lookups don't also modify trees_processed
+                self.trees[species] = copy.deepcopy(trees_processed.trees[species])
+
+    def needs_lookup(self, species, field):
+        """True if field for species should be looked up.
+
+        A lookup is needed if any of the data for the field is missing, if
+        the field or species is selected by self.refresh, or if self.max_age
+        is set and the data has no fetched_at provenance or is older.
+
+        Arguments:
+            species (str) - the species name.
+            field (str) - field name, a key of LOOKUP_FIELDS.
+        """
+        data = self.trees[species]
+        if any(key not in data for key in self.LOOKUP_FIELDS[field]):
+            return True
+        if self.is_refreshed(species, field):
+            return True
+        if self.max_age is None:
+            return False
+        fetched_at = data.get("provenance", {}).get(field, {}).get("fetched_at")
+        if fetched_at is None:
+            return True
+        return datetime.now(timezone.utc) - datetime.fromisoformat(fetched_at) > self.max_age
+
+    def is_refreshed(self, species, field):
+        """True if field for species is selected by self.refresh.
+
+        Arguments:
+            species (str) - the species name.
+            field (str) - field name, a key of LOOKUP_FIELDS.
+        """
+        for (sel_species, sel_field) in self.refresh:
+            if sel_species in (None, species) and sel_field in (None, field):
+                return True
+        return False
+
+    def cache_options(self, species_list, field):
+        """Response cache fetch() options for looking up field.
+
+        Cached responses must follow the same rules as needs_lookup() so
+        data selected by self.refresh is always fetched again, and cached
+        responses older than self.max_age are not used.
 
-    def lookup_common_names(self):
+        Arguments:
+            species_list (list) - names of the species covered by the call.
+            field (str) - field name, a key of LOOKUP_FIELDS.
+
+        Returns:
+            dict - keyword arguments for ResponseCache.fetch().
+        """
+        return {"force": any(self.is_refreshed(species, field) for species in species_list),
+                "max_age": self.max_age.total_seconds() if self.max_age is not None else None}
+
+    def record_provenance(self, species, field, source, fetched=None):
+        """Record where and when the data for a field was fetched.
+
+        Arguments:
+            species (str) - the species name.
+            field (str) - field name, a key of LOOKUP_FIELDS.
+            source (str) - description of the data source.
+            fetched (float) - time the data was fetched from source in
+                seconds since the epoch, None for now.
+        """
+        fetched_at = datetime.now(timezone.utc) if fetched is None else datetime.fromtimestamp(fetched, timezone.utc)
+        # Assign a new dict so that a Species record is marked dirty
+        provenance = dict(self.trees[species].get("provenance", {}))
+        provenance[field] = {"source": source,
+                             "fetched_at": fetched_at.isoformat(timespec="seconds")}
+        self.trees[species]["provenance"] = provenance
+
+    def lookup_common_names(self, usda_db="usda_db_2024-12-02.csv.gz"):
         """Use USDA database to lookup the common names for all tress.
 
         Will add common_name key to dict for each tree. If tress_processed is
-        passed in then will data from there if present.
+        passed in then will data from there if present. Common names without
+        USDA provenance are taken to be set in the config and never replaced.
+
+        Arguments:
+            usda_db (str) - gzipped CSV file of the USDA plants database. A
+                compiled index is built alongside it on first use, see
+                UsdaIndex.
         """
-        common_names = {}
-        with gzip.open("usda_db_2024-12-02.csv.gz", "rt") as fh:
-            for row in csv.reader(fh):
-                # Ignore lines with secondary code
-                if row[1] not in ("", "MADO4"):
-                    continue
-                # Ignore lines not matching capitalized word (genus) then lowercase word (species)
-                m = re.match(r"""([A-Z][a-z]+\s[a-z]+)\b""", row[2])
-                if m:
-                    species = m.group(1)
-                    if species not in common_names:
-                        common_name = row[3].capitalize()
-                        common_names[species] = common_name
-        # Now lookup all trees
+        usda = None
         for species in self.trees:
             if "common_name" in self.trees[species]:
-                # Don"t do a lookup of the config already has a
-                # common name defined
+                source = self.trees[species].get("provenance", {}).get("common_name", {}).get("source")
+                if source is None or not source.startswith("usda"):
+                    # Don"t do a lookup of the config already has a
+                    # common name defined
+                    continue
+                if not self.needs_lookup(species, "common_name"):
+                    continue
+            if usda is None:
+                usda = UsdaIndex(usda_db)
+            resolved = usda.resolve(species)
+            if resolved is None:
+                logging.warning("Species %s not found in USDA database", species)
                 continue
-            if species in common_names:
-                if common_names[species] == "":
-                    logging.warning("No common name for %s in USDA database", species)
-                else:
-                    self.trees[species]["common_name"] = common_names[species]
+            symbol, accepted_name, common_name = resolved
+            if accepted_name != usda.normalize_name(species):
+                logging.info("Species %s resolved to %s (%s) in USDA database", species, accepted_name, symbol)
+            if common_name == "":
+                logging.warning("No common name for %s in USDA database", species)
             else:
-                logging.warning("Species %s not found in USDA database", species)
+                self.trees[species]["common_name"] = common_name
+                self.record_provenance(species, "common_name", "usda:" + os.path.basename(usda_db))
+        if usda is not None:
+            usda.close()
 
-    def lookup_ott_ids(self):
+    def lookup_ott_ids(self, batch_size=250):
         """Lookup Open Tree of Life Taxonomy ids.
 
         Open Tree of Life Taxonomy (OTT from now on).
 
         Adds data to the "ott_id" attribute for each species in the trees dict that
-        does not already have the attribute.
+        does not already have the attribute, or where needs_lookup() says it
+        should be refreshed. Names are sent to the TNRS match
+        service in batches of batch_size, the batches are run concurrently by
+        self.lookup_engine and the results merged in species order.
+
+        Arguments:
+            batch_size (int) - maximum number of names in each TNRS request.
         """
-        # Now go through and lookup ids
+        to_look_up = []
         for species in self.trees:
-            if "ott_id" in self.trees[species]:
+            if not self.needs_lookup(species, "ott_id"):
                 continue
             if "skip" in self.trees[species] or "cross_between" in self.trees[species]:
                 # FIXME: How to handle crosses (e.g. Common lime)
                 continue
-            # Look it up
-            try:
-                m = OT.tnrs_match([species])
-                id = m.response_dict['results'][0]['matches'][0]['taxon']['ott_id']
+            to_look_up.append(species)
+        batches = [tuple(to_look_up[i:i + batch_size]) for i in range(0, len(to_look_up), batch_size)]
+
+        def lookup(names):
+            return self.response_cache.fetch_with_time(
+                "opentree:tnrs_match", {"names": list(names)},
+                lambda: OT.tnrs_match(list(names)).response_dict,
+                **self.cache_options(names, "ott_id"))
+
+        results = self.lookup_engine.run(batches, lookup, host="api.opentreeoflife.org")
+        for batch, result in results.items():
+            if isinstance(result, Exception):
+                logging.warning("Failed lookup for %s (%s)", ", ".join(batch), str(result))
+                continue
+            response, fetched = result
+            matches = {r["name"]: r["matches"] for r in response["results"]}
+            for species in batch:
+                if species not in matches or len(matches[species]) == 0:
+                    logging.warning("Failed lookup for %s (no TNRS match)", species)
+                    continue
+                match = matches[species][0]
+                if len(matches[species]) > 1:
+                    logging.warning("Ambiguous lookup for %s, using first of %d matches (%s)", species,
+                                    len(matches[species]), ", ".join(m["taxon"]["unique_name"] for m in matches[species]))
+                elif match.get("is_approximate_match"):
+                    logging.warning("Approximate lookup for %s matched %s", species, match["matched_name"])
+                id = match["taxon"]["ott_id"]
                 print("ott_id for %s is %d" % (species, id))
                 self.trees[species]["ott_id"] = id
-            except Exception as e:  # pylint: disable=broad-exception-caught
-                logging.warning("Failed lookup for %s (%s)", species, str(e))
+                self.record_provenance(species, "ott_id", "opentree:tnrs_match", fetched)
 
     def lookup_gbif_ids(self):
         """Lookup GBIF ids for any entries that don't have them.
 
-        Uses the Opentree lookup from ott_id to GBIF id.
+        Entries that already have gbif_id and gbif_classification are skipped
+        unless needs_lookup() says they should be refreshed. If
+        self.gbif_backbone is set then names are matched locally, otherwise
+        the GBIF name_backbone API is used with lookups run concurrently by
+        self.lookup_engine and the results merged in species order.
         """
-        for species in self.trees:
-            gbif = pygbif.species.name_backbone(scientificName=species, taxonRank="SPECIES", strict=True)
+        def lookup(species):
+            params = {"scientificName": species, "taxonRank": "SPECIES", "strict": True}
+            return self.response_cache.fetch_with_time(
+                "gbif:name_backbone", params,
+                lambda: pygbif.species.name_backbone(**params),
+                **self.cache_options([species], "gbif_id"))
+
+        to_look_up = [species for species in self.trees if self.needs_lookup(species, "gbif_id")]
+        if self.gbif_backbone is not None:
+            source = "gbif:backbone"
+            results = {species: (self.gbif_backbone.match(species), None) for species in to_look_up}
+        else:
+            source = "gbif:name_backbone"
+            results = self.lookup_engine.run(to_look_up, lookup, host="api.gbif.org")
+        for species, gbif in results.items():
+            if isinstance(gbif, Exception):
+                logging.warning("GBIF lookup for %s failed: %s", species, str(gbif))
+                continue
+            gbif, fetched = gbif
             if "usage" not in gbif:
                 logging.warning("GBIF lookup for %s failed: %s", species, str(gbif))
                 continue
             if gbif["diagnostics"]["matchType"] != "EXACT":
                 logging.warning("GBIF lookup for %s not EXACT: %s", species, str(gbif))
             self.trees[species]["gbif_id"] = int(gbif["usage"]["key"])
-            self.trees[species]["gbif_classification"] = gbif["classification"]
+            self.trees[species].set_classification(gbif["classification"], self.taxa)
+            self.record_provenance(species, "gbif_id", source, fetched)
+
+    def classification(self, species):
+        """GBIF classification of species as (rank, name, key) tuples.
+
+        Uses the interned tuples of a Species record directly, so is much
+        cheaper than building the gbif_classification list of dicts when
+        looping over all species.
+
+        Arguments:
+            species (str) - the species name.
+
+        Returns:
+            tuple - of (rank, name, key) tuples from highest rank, None if
+                there is no classification.
+        """
+        data = self.trees[species]
+        if isinstance(data, Species):
+            return getattr(data, "classification", None)
+        if "gbif_classification" not in data:
+            return None
+        return tuple((r["rank"], r["name"], r["key"]) for r in data["gbif_classification"])
 
     def extract_ott_ids(self):
         """Extract list of defined OTT ids.
@@ -0,0 +1,192 @@
+"""Eggcyclopedia of Wood USDA plants database index."""
+
+import csv
+import gzip
+import re
+
+from .files import file_sha256, open_sqlite_index
+
+
+class UsdaIndex():
+    """Persistent SQLite index of the USDA plants database.
+
+    The USDA database is distributed as a gzipped CSV file which is slow to
+    scan in full. This class compiles it once into an SQLite file keyed by
+    "Genus species" name so that lookups only read the rows needed. The
+    index records the SHA-256 hash of the source CSV and is rebuilt only
+    when that changes.
+
+    Names are indexed from both accepted rows and synonym rows (those with
+    a "Synonym Symbol") and point to the accepted "Symbol", so that synonyms
+    and hybrid names resolve to the common name of the accepted taxon. The
+    accepted name is kept in full without authors, including any variety,
+    subspecies or form.
+
+    Example:
+    >>> usda = UsdaIndex("usda_db_2024-12-02.csv.gz")
+    >>> usda.common_name("Quercus rubra")
+    'Northern red oak'
+    """
+
+    SCHEMA_VERSION = "3"
+
+    def __init__(self, csv_filename="usda_db_2024-12-02.csv.gz", index_filename=None):
+        """Initialize UsdaIndex object, building the index if necessary.
+
+        Arguments:
+            csv_filename (str) - gzipped CSV file of USDA plants database.
+            index_filename (str) - SQLite index file, defaults to the
+                csv_filename with the ".csv.gz" replaced by ".sqlite".
+        """
+        self.csv_filename = csv_filename
+        if index_filename is None:
+            index_filename = re.sub(r"""(\.csv)?(\.gz)?$""", "", csv_filename) + ".sqlite"
+        self.index_filename = index_filename
+        self.db = None
+        self.open()
+
+    def open(self):
+        """Open the index, rebuilding it if missing or out of date."""
+        fingerprint = "%s %s" % (self.SCHEMA_VERSION, file_sha256(self.csv_filename))
+        self.db = open_sqlite_index(self.index_filename, fingerprint, self.build,
+                                    description="USDA index of " + self.csv_filename)
+
+    def build(self, db):
+        """Build the index tables from the source CSV file.
+
+        Arguments:
+            db (sqlite3.Connection) - new index database, see
+                open_sqlite_index().
+        """
+        db.execute("CREATE TABLE symbols (symbol TEXT PRIMARY KEY, name TEXT, common_name TEXT)")
+        db.execute("CREATE TABLE names (name TEXT PRIMARY KEY, symbol TEXT)")
+        symbols = {}
+        names = {}  # name -> (priority, symbol)
+        with gzip.open(self.csv_filename, "rt", encoding="utf-8") as fh:
+            reader = csv.reader(fh)
+            next(reader)  # skip header
+            for row in reader:
+                symbol, synonym_symbol, full_name, common_name = row[0:4]
+                name, infraspecific = self.parse_name(full_name)
+                if synonym_symbol == "":
+                    # Accepted name, the only rows that carry common names
+                    accepted_name = name + " " + infraspecific if name and infraspecific else name
+                    symbols[symbol] = (symbol, accepted_name or full_name, common_name.capitalize())
+                if name is None:
+                    continue
+                # Where a name appears more than once prefer accepted names
+                # over synonyms, and species over infraspecific taxa. Ties go
+                # to the first row.
+                priority = (2 if synonym_symbol else 0) + (1 if infraspecific else 0)
+                if name not in names or priority < names[name][0]:
+                    names[name] = (priority, symbol)
+        db.executemany("INSERT INTO symbols VALUES (?, ?, ?)", symbols.values())
+        db.executemany("INSERT INTO names VALUES (?, ?)",
+                       ((name, symbol) for name, (priority, symbol) in names.items()))
+
+    @staticmethod
+    def normalize_name(name):
+        """Normalize hybrid markers in a scientific name.
+
+        Hybrids may be written with "×" or a standalone "x" before the
+        epithet, or with "×" attached to it. The normalized form has "×"
+        attached to the epithet as in the USDA database. An "x" at the start
+        of a genus or epithet is not a hybrid marker.
+
+        Arguments:
+            name (str) - scientific name.
+
+        Returns:
+            str - normalized name.
+
+        Example:
+        >>> UsdaIndex.normalize_name("Tilia x europaea")
+        'Tilia ×europaea'
+        >>> UsdaIndex.normalize_name("× Achnella caduca")
+        '×Achnella caduca'
+        >>> UsdaIndex.normalize_name("Arbutus xalapensis")
+        'Arbutus xalapensis'
+        """
+        name = re.sub(r"""(^|\s)(?:[x×]\s+|×)(?=[A-Za-z])""", r"""\1×""", name.strip())
+        # Unnamed hybrids between two species keep the spaced form
+        return re.sub(r"""^(\S+ [a-z-]+) ×(?=[a-z])""", r"""\1 × """, name)
+
+    @classmethod
+    def parse_name(cls, full_name):
+        """Extract the name used for lookups from a USDA scientific name.
+
+        Arguments:
+            full_name (str) - "Scientific Name with Author" field.
+
+        Returns:
+            tuple - (name, infraspecific) where name is "Genus species",
+                "Genus ×species", "×Genus species" or "Genus species1 ×
+                species2" for an unnamed hybrid; or None if the full name is
+                not at species level or below. infraspecific is the rank and
+                epithet, e.g. "var. negundo", if the full name is of a
+                variety, subspecies or form, else "".
+
+        Example:
+        >>> UsdaIndex.parse_name("Acer negundo L. var. negundo")
+        ('Acer negundo', 'var. negundo')
+        """
+        m = re.match(r"""(×?[A-Z][a-z]+) (×\s?)?([a-z][a-z-]*)\b( × ([a-z][a-z-]*)\b)?""", full_name)
+        if not m:
+            return None, ""
+        if m.group(5):
+            name = "%s %s × %s" % (m.group(1), m.group(3), m.group(5))
+        else:
+            name = "%s %s%s" % (m.group(1), "×" if m.group(2) else "", m.group(3))
+        rest = full_name[m.end():]
+        # "f. ex" is an author "filius" followed by "ex", not a form
+        parts = re.finditer(r"""\b(?:notho)?(?:var|ssp|subsp|f)\.\s(?!ex\b)[a-z][a-z-]*""", rest)
+        infraspecific = " ".join(part.group(0) for part in parts)
+        return name, infraspecific
+
+    def resolve(self, name):
+        """Resolve a name, which may be a synonym, to the accepted taxon.
+
+        Arguments:
+            name (str) - scientific name, accepted or synonym, "Genus
+                species" with optional hybrid marker.
+
+        Returns:
+            tuple or None - (symbol, accepted_name, common_name) for the
+                accepted taxon, or None if the name is not in the database.
+                accepted_name includes any infraspecific rank and epithet,
+                e.g. "Acer negundo var. negundo".
+        """
+        name = self.normalize_name(name)
+        candidates = [name]
+        if "×" in name:
+            candidates.append(re.sub(r"""×\s*""", "", name))
+        for candidate in candidates:
+            row = self.db.execute(
+                "SELECT s.symbol, s.name, s.common_name FROM names n JOIN symbols s ON n.symbol = s.symbol "
+                "WHERE n.name = ?", (candidate,)).fetchone()
+            if row is not None:
+                return tuple(row)
+        return None
+
+    def common_name(self, species):
+        """Common name for species.
+
+        Synonyms are resolved to their accepted name so that the common name
+        of the accepted taxon is returned.
+
+        Arguments:
+            species (str) - the "Genus species" name.
+
+        Returns:
+            str or None - the common name, which will be the empty string
+                if the species is in the database without a common name, or
+                None if the species is not in the database.
+        """
+        resolved = self.resolve(species)
+        return None if resolved is None else resolved[2]
+
+    def close(self):
+        """Close the index database."""
+        if self.db is not None:
+            self.db.close()
+            self.db = None
@@ -0,0 +1,80 @@
+"""Eggcyclopedia of Wood polling file watcher."""
+
+import logging
+import os
+import time
+
+
+class FileWatcher():
+    """Watch files and directory trees for changes by polling.
+
+    Polls the size and modification time of every file, which needs no
+    extra dependencies and is quick for a tree the size of the website
+    source.
+
+    Example:
+    >>> watcher = FileWatcher(["src", "trees_processed.json"])
+    >>> watcher.wait()
+    {'src/about.md'}
+    """
+
+    def __init__(self, paths, interval=0.25):
+        """Initialize FileWatcher object and take the first snapshot.
+
+        Arguments:
+            paths (list) - files and directories to watch, directories are
+                watched recursively. Paths that don't exist are watched for
+                being created.
+            interval (float) - seconds between polls.
+        """
+        self.paths = paths
+        self.interval = interval
+        self.state = self.snapshot()
+
+    def snapshot(self):
+        """Size and modification time of all watched files.
+
+        Returns:
+            dict - (size, mtime_ns) indexed by file name.
+        """
+        state = {}
+        for path in self.paths:
+            if os.path.isdir(path):
+                for root, _, files in os.walk(path):
+                    for file in files:
+                        filename = os.path.join(root, file)
+                        try:
+                            stat = os.stat(filename)
+                        except FileNotFoundError:
+                            continue
+                        state[filename] = (stat.st_size, stat.st_mtime_ns)
+            elif os.path.exists(path):
+                stat = os.stat(path)
+                state[path] = (stat.st_size, stat.st_mtime_ns)
+        return state
+
+    def changes(self):
+        """Files added, changed or removed since the last call.
+
+        Returns:
+            set - of file names, empty if nothing changed.
+        """
+        state = self.snapshot()
+        changed = set(state.keys() ^ self.state.keys())
+        changed.update(filename for filename in state.keys() & self.state.keys()
+                       if state[filename] != self.state[filename])
+        self.state = state
+        return changed
+
+    def wait(self):
+        """Wait until something changes.
+
+        Returns:
+            set - of file names that changed.
+        """
+        while True:
+            time.sleep(self.interval)
+            changed = self.changes()
+            if changed:
+                logging.info("Changed: %s", ", ".join(sorted(changed)))
+                return changed
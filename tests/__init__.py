@@ -0,0 +1 @@
+"""Eggcyclopedia of Wood tests."""
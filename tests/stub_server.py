@@ -0,0 +1,138 @@
+"""Local stub web service for testing lookups offline."""
+
+import functools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import threading
+import time
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Handler that replies with the next scripted response for the path."""
+
+    def __init__(self, *args, stub_server=None, **kwargs):
+        """Initialize StubHandler, stub_server provides the responses."""
+        self.stub_server = stub_server
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        """Reply to GET."""
+        self.reply(None)
+
+    def do_POST(self):
+        """Reply to POST, recording the request body."""
+        length = int(self.headers.get("Content-Length", 0))
+        self.reply(self.rfile.read(length).decode("utf-8"))
+
+    def reply(self, body):
+        """Send the next response for self.path after its delay."""
+        status, content, delay = self.stub_server.begin(self.command, self.path, body)
+        try:
+            if delay:
+                time.sleep(delay)
+            if not isinstance(content, str):
+                content = json.dumps(content)
+            data = content.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client timed out
+        finally:
+            self.stub_server.end()
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Log requests at debug level rather than to stderr."""
+        logging.debug("%s - %s", self.address_string(), format % args)
+
+
+class StubServer():
+    """Local web server with scripted responses, run in a background thread.
+
+    Responses for each path are a list of (status, content, delay) tuples
+    used in turn for successive requests, the last one being repeated.
+    content is sent as is if a str, else as JSON, after delay seconds.
+    Requests are recorded, as is the greatest number handled at once.
+
+    Example:
+    >>> with StubServer() as server:
+    ...     server.add("/flaky", (503, {}, 0), (200, {"ok": True}, 0))
+    ...     requests.get(server.url + "/flaky").status_code
+    503
+    """
+
+    def __init__(self, default=(404, {"error": "not found"}, 0)):
+        """Initialize StubServer object.
+
+        Arguments:
+            default (tuple) - (status, content, delay) for paths without
+                responses.
+        """
+        self.default = default
+        self.responses = {}
+        self.requests = []  # (method, path, body) tuples
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        self.httpd = None
+
+    def add(self, path, *responses):
+        """Add (status, content, delay) responses for path."""
+        with self._lock:
+            self.responses.setdefault(path, []).extend(responses)
+
+    def begin(self, method, path, body):
+        """Record a request and return the response to send."""
+        with self._lock:
+            self.requests.append((method, path, body))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            responses = self.responses.get(path)
+            if not responses:
+                return self.default
+            return responses.pop(0) if len(responses) > 1 else responses[0]
+
+    def end(self):
+        """Record the end of a request."""
+        with self._lock:
+            self.active -= 1
+
+    def requests_for(self, path):
+        """Requests made to path."""
+        return [r for r in self.requests if r[1] == path]
+
+    @property
+    def url(self):
+        """Base URL of the server."""
+        return "http://%s:%d" % self.httpd.server_address[:2]
+
+    @property
+    def host(self):
+        """Host and port of the server."""
+        return "%s:%d" % self.httpd.server_address[:2]
+
+    def start(self):
+        """Start serving on a free port in a daemon thread."""
+        handler = functools.partial(StubHandler, stub_server=self)
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        """Stop serving."""
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def __enter__(self):
+        """Start server for with statement."""
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        """Stop server at end of with statement."""
+        self.stop()
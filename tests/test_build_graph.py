@@ -0,0 +1,62 @@
+"""Tests for eggcyc.build_graph."""
+
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from eggcyc import build_graph
+from eggcyc.build_graph import BuildGraph
+
+
+class TestBuildGraph(unittest.TestCase):
+    """Tests for BuildGraph."""
+
+    def setUp(self):
+        """Temporary directory with an input file last modified an hour ago."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.graph_filename = os.path.join(self.tmp_dir.name, "build_graph.json")
+        self.src = os.path.join(self.tmp_dir.name, "photo.jpg")
+        self.dst = os.path.join(self.tmp_dir.name, "page.html")
+        self.write(self.src, b"egg", time.time() - 3600)
+        self.write(self.dst, b"page", time.time() - 3600)
+
+    def tearDown(self):
+        """Remove temporary directory."""
+        self.tmp_dir.cleanup()
+
+    @staticmethod
+    def write(filename, content, mtime):
+        """Write content to filename and set its modification time."""
+        with open(filename, "wb") as fh:
+            fh.write(content)
+        os.utime(filename, (mtime, mtime))
+
+    def build(self):
+        """Check and record dst as one build, returns (is_current, number of files hashed)."""
+        graph = BuildGraph(self.graph_filename)
+        with mock.patch.object(build_graph, "file_sha256", wraps=build_graph.file_sha256) as file_sha256:
+            current = graph.is_current(self.dst, [self.src], {"title": "Egg"})
+            graph.record(self.dst, [self.src], {"title": "Egg"})
+            graph.update_stat(self.dst)
+            graph.write()
+        return current, file_sha256.call_count
+
+    def test_unchanged_not_hashed(self):
+        """Inputs with unchanged stat are not read again in later builds."""
+        self.assertEqual(self.build(), (False, 1))
+        self.assertEqual(self.build(), (True, 0))
+
+    def test_changed_hashed(self):
+        """Inputs with changed size or mtime are hashed again."""
+        self.build()
+        self.write(self.src, b"EGG", time.time() - 1800)
+        self.assertEqual(self.build(), (False, 1))
+        self.assertEqual(self.build(), (True, 0))
+
+    def test_recently_modified_hashed(self):
+        """Inputs modified in the last few seconds are always hashed."""
+        self.write(self.src, b"egg", time.time())
+        self.build()
+        self.assertEqual(self.build(), (True, 1))
@@ -0,0 +1,45 @@
+"""Tests for build_website.CachingEnvironment."""
+
+import os
+import tempfile
+import unittest
+
+from liquid import Mode
+
+from build_website import CachingEnvironment
+
+
+class TestCachingEnvironment(unittest.TestCase):
+    """Tests for CachingEnvironment."""
+
+    def setUp(self):
+        """Template cache in a temporary directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp_dir.name, "template_cache")
+
+    def tearDown(self):
+        """Remove temporary directory."""
+        self.tmp_dir.cleanup()
+
+    def test_cached(self):
+        """A parsed template is cached and reused by a new environment."""
+        env = CachingEnvironment(cache_dir=self.cache_dir)
+        self.assertEqual(env.from_string("{{ egg | upcase }}").render(egg="oak"), "OAK")
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        env = CachingEnvironment(cache_dir=self.cache_dir)
+        self.assertEqual(env.from_string("{{ egg | upcase }}").render(egg="ash"), "ASH")
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_config_in_key(self):
+        """Environments with different parse settings don't share cached templates."""
+        env = CachingEnvironment(cache_dir=self.cache_dir)
+        digest = env.config_digest()
+        env.from_string("{{ egg }}")
+        for other in (CachingEnvironment(cache_dir=self.cache_dir, tolerance=Mode.LAX),
+                      CachingEnvironment(cache_dir=self.cache_dir, statement_start_string="[[",
+                                         statement_end_string="]]")):
+            self.assertNotEqual(other.config_digest(), digest)
+        env.add_filter("shout", lambda s: s.upper() + "!")
+        self.assertNotEqual(env.config_digest(), digest)
+        env.from_string("{{ egg }}")
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
@@ -0,0 +1,148 @@
+"""Tests for eggcyc.cache."""
+
+from datetime import datetime, timedelta
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from eggcyc.cache import CacheMissError, ResponseCache
+from eggcyc.lookup import LookupEngine
+from eggcyc.species import Species
+from eggcyc.trees import Trees
+
+
+class TestResponseCache(unittest.TestCase):
+    """Tests for ResponseCache."""
+
+    def setUp(self):
+        """Cache file in a temporary directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp_dir.name, "cache.sqlite")
+        self.calls = []
+
+    def tearDown(self):
+        """Remove temporary directory."""
+        self.tmp_dir.cleanup()
+
+    def call(self, value):
+        """Function for fetch() that records calls."""
+        def fn():
+            self.calls.append(value)
+            return value
+        return fn
+
+    def test_hit_and_miss(self):
+        """A second fetch is answered from the cache, also after reopening."""
+        cache = ResponseCache(self.filename)
+        self.assertEqual(cache.fetch("svc", {"q": 1}, self.call("a")), "a")
+        self.assertEqual(cache.fetch("svc", {"q": 1}, self.call("b")), "a")
+        self.assertEqual(cache.fetch("svc", {"q": 2}, self.call("c")), "c")
+        self.assertEqual(cache.stats(), "1 cache hits, 2 cache misses")
+        cache.close()
+        cache = ResponseCache(self.filename)
+        self.assertEqual(cache.fetch("svc", {"q": 1}, self.call("d")), "a")
+        self.assertEqual(self.calls, ["a", "c"])
+        cache.close()
+
+    def test_ttl(self):
+        """Entries older than ttl are fetched again."""
+        cache = ResponseCache(self.filename, ttl=60)
+        cache.put("svc", {"q": 1}, "old", fetched=time.time() - 120)
+        cache.put("svc", {"q": 2}, "new", fetched=time.time() - 30)
+        self.assertEqual(cache.fetch("svc", {"q": 1}, self.call("a")), "a")
+        self.assertEqual(cache.fetch("svc", {"q": 2}, self.call("b")), "new")
+        cache.close()
+
+    def test_max_age_and_force(self):
+        """A shorter max_age or force fetch again for one call."""
+        cache = ResponseCache(self.filename, ttl=3600)
+        fetched = time.time() - 120
+        cache.put("svc", {"q": 1}, "old", fetched=fetched)
+        self.assertEqual(cache.fetch_with_time("svc", {"q": 1}, self.call("a"), max_age=600), ("old", fetched))
+        self.assertEqual(cache.fetch("svc", {"q": 1}, self.call("b"), max_age=60), "b")
+        self.assertEqual(cache.fetch("svc", {"q": 1}, self.call("c"), force=True), "c")
+        self.assertEqual(cache.fetch("svc", {"q": 1}, self.call("d")), "c")
+        self.assertEqual(self.calls, ["b", "c"])
+        cache.close()
+
+    def test_eviction(self):
+        """Least recently used entries are evicted beyond max_bytes."""
+        cache = ResponseCache(self.filename, max_bytes=25)
+        cache.put("svc", {"q": 1}, "x" * 8)
+        time.sleep(0.01)
+        cache.put("svc", {"q": 2}, "y" * 8)
+        time.sleep(0.01)
+        cache.get("svc", {"q": 1})  # q=1 now more recently used than q=2
+        time.sleep(0.01)
+        cache.put("svc", {"q": 3}, "z" * 8)
+        self.assertTrue(cache.get("svc", {"q": 1})[0])
+        self.assertFalse(cache.get("svc", {"q": 2})[0])
+        self.assertTrue(cache.get("svc", {"q": 3})[0])
+        cache.close()
+
+    def test_offline(self):
+        """Offline serves entries regardless of age and counts misses."""
+        cache = ResponseCache(self.filename, ttl=60)
+        cache.put("svc", {"q": 1}, "old", fetched=time.time() - 120)
+        cache.close()
+        cache = ResponseCache(self.filename, ttl=60, offline=True)
+        self.assertEqual(cache.fetch("svc", {"q": 1}, self.call("a"), force=True), "old")
+        with self.assertRaises(CacheMissError):
+            cache.fetch("svc", {"q": 2}, self.call("b"))
+        self.assertEqual(cache.stats(), "1 cache hits, 1 cache misses")
+        self.assertEqual(self.calls, [])
+        cache.close()
+
+    def test_no_file(self):
+        """With no file nothing is cached."""
+        cache = ResponseCache(filename=None)
+        cache.fetch("svc", {"q": 1}, self.call("a"))
+        cache.fetch("svc", {"q": 1}, self.call("b"))
+        self.assertEqual(self.calls, ["a", "b"])
+
+
+class TestTreesRefresh(unittest.TestCase):
+    """Tests that Trees lookups apply refresh rules to cached responses."""
+
+    GBIF = {"usage": {"key": 3189866}, "diagnostics": {"matchType": "EXACT"},
+            "classification": [{"rank": "SPECIES", "name": "Acer negundo", "key": "3189866"}]}
+
+    def setUp(self):
+        """Cache in a temporary directory with a response fetched an hour ago."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(os.path.join(self.tmp_dir.name, "cache.sqlite"))
+        self.fetched = time.time() - 3600
+        self.cache.put("gbif:name_backbone",
+                       {"scientificName": "Acer negundo", "taxonRank": "SPECIES", "strict": True},
+                       self.GBIF, fetched=self.fetched)
+
+    def tearDown(self):
+        """Close cache and remove temporary directory."""
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    def lookup(self, **kwargs):
+        """Run lookup_gbif_ids() for Acer negundo, returns (trees, number of calls)."""
+        trees = Trees(lookup_engine=LookupEngine(max_workers=1), response_cache=self.cache, **kwargs)
+        trees.trees = {"Acer negundo": Species()}
+        with mock.patch("pygbif.species.name_backbone", return_value=self.GBIF) as name_backbone:
+            trees.lookup_gbif_ids()
+        return trees, name_backbone.call_count
+
+    def test_cached_provenance(self):
+        """A cached response records the time it was originally fetched."""
+        trees, calls = self.lookup()
+        self.assertEqual(calls, 0)
+        fetched_at = trees.trees["Acer negundo"]["provenance"]["gbif_id"]["fetched_at"]
+        self.assertAlmostEqual(datetime.fromisoformat(fetched_at).timestamp(), self.fetched, delta=1)
+
+    def test_refresh(self):
+        """A refreshed species is fetched again."""
+        self.assertEqual(self.lookup(refresh=["Acer negundo:gbif_id"])[1], 1)
+
+    def test_max_age(self):
+        """A cached response older than max_age is fetched again."""
+        self.assertEqual(self.lookup(max_age=timedelta(minutes=10))[1], 1)
+        self.assertEqual(self.lookup(max_age=timedelta(minutes=10))[1], 0)
@@ -0,0 +1,115 @@
+"""Tests for eggcyc.dated_tree run against a local stub server."""
+
+import json
+import os
+import tempfile
+import unittest
+
+from eggcyc.cache import ResponseCache
+from eggcyc.dated_tree import DatedTree, DatedTreeError, DatedTreeTable
+
+from .stub_server import StubServer
+
+PATH = "/v4/dates/dated_tree"
+OAKS_NEWICK = ("((((((ott791115:9.834022)mrcaott316110ott791115:2.744552)mrcaott316110ott494536:2.744552)"
+               "mrcaott137331ott316110:3.721832)mrcaott137331ott3930379:2.971260)mrcaott137331ott538292:157.983780,"
+               "(ott403375:21.858711)mrcaott403375ott470257:158.141296)mrcaott137331ott403375:1.000000;")
+
+
+class TestDatedTree(unittest.TestCase):
+    """Tests for DatedTree client."""
+
+    def setUp(self):
+        """Start stub server."""
+        self.server = StubServer()
+        self.server.start()
+
+    def tearDown(self):
+        """Stop stub server."""
+        self.server.stop()
+
+    def client(self, response_cache=None, **kwargs):
+        """DatedTree client for the stub server, not caching by default."""
+        if response_cache is None:
+            response_cache = ResponseCache(filename=None)
+        return DatedTree(api_endpoint=self.server.host, scheme="http", response_cache=response_cache, **kwargs)
+
+    def test_dated_tree(self):
+        """Request data and response parsing."""
+        self.server.add(PATH, (200, {"dated_trees_newick_list": [OAKS_NEWICK, "(a:1)b;"]}, 0))
+        newick = self.client().dated_tree(ott_ids=["ott791115", "ott403375"], max_age=180)
+        self.assertEqual(newick, OAKS_NEWICK)
+        (method, _, body) = self.server.requests[0]
+        self.assertEqual(method, "POST")
+        self.assertEqual(json.loads(body), {"node_ids": ["ott791115", "ott403375"], "max_age": "180"})
+
+    def test_chunking(self):
+        """Large lists of ids are sent in chunks, one tree per chunk."""
+        self.server.add(PATH, *[(200, {"dated_trees_newick_list": ["(ott%d:1)r;" % i]}, 0) for i in range(3)])
+        client = self.client(chunk_size=2)
+        ids = ["ott1", "ott2", "ott3", "ott4", "ott5"]
+        self.assertEqual(client.dated_trees(ott_ids=ids), ["(ott0:1)r;", "(ott1:1)r;", "(ott2:1)r;"])
+        self.assertEqual([json.loads(body)["node_ids"] for (_, _, body) in self.server.requests],
+                         [["ott1", "ott2"], ["ott3", "ott4"], ["ott5"]])
+        with self.assertRaises(DatedTreeError):
+            client.dated_tree(ott_ids=ids)
+
+    def test_errors(self):
+        """Timeouts, bad JSON, HTTP errors and empty results raise DatedTreeError."""
+        for response in ((200, {"dated_trees_newick_list": []}, 1.0),
+                         (200, "<html>not JSON</html>", 0),
+                         (500, {"error": "oops"}, 0),
+                         (200, {"dated_trees_newick_list": []}, 0)):
+            with self.subTest(response=response):
+                self.server.responses = {PATH: [response]}
+                with self.assertRaises(DatedTreeError):
+                    self.client(timeout=0.3).dated_tree(ott_ids=["ott1"])
+
+    def test_cache(self):
+        """Responses are cached, failures are not."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = ResponseCache(os.path.join(tmp_dir, "cache.sqlite"))
+            client = self.client(response_cache=cache)
+            self.server.add(PATH, (500, {}, 0), (200, {"dated_trees_newick_list": ["(ott1:1)r;"]}, 0))
+            with self.assertRaises(DatedTreeError):
+                client.dated_tree(ott_ids=["ott1"])
+            self.assertEqual(client.dated_tree(ott_ids=["ott1"]), "(ott1:1)r;")
+            self.assertEqual(client.dated_tree(ott_ids=["ott1"]), "(ott1:1)r;")
+            self.assertEqual(len(self.server.requests), 2)
+            client.close()
+
+    def test_no_cache_by_default(self):
+        """No cache file is created unless a ResponseCache is given."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cwd = os.getcwd()
+            os.chdir(tmp_dir)
+            try:
+                DatedTree().close()
+            finally:
+                os.chdir(cwd)
+            self.assertEqual(os.listdir(tmp_dir), [])
+
+    def test_dated_tree_tables(self):
+        """Dated trees are parsed into tables with divergence ages."""
+        self.server.add(PATH, (200, {"dated_trees_newick_list": [OAKS_NEWICK]}, 0))
+        tables = self.client().dated_tree_tables(ott_ids=["ott791115", "ott403375"])
+        self.assertEqual(len(tables), 1)
+        self.assertAlmostEqual(tables[0].divergence_age("ott791115", "ott403375"), 180.0, places=4)
+
+
+class TestDatedTreeTable(unittest.TestCase):
+    """Tests for DatedTreeTable."""
+
+    def test_ages(self):
+        """Ages are the greatest distance to a tip below."""
+        table = DatedTreeTable.from_newick("((ott1:2,ott2:2)mrcaott1ott2:3,ott3:4)root;")
+        self.assertEqual(table.age(table.find("ott1")), 0.0)
+        self.assertEqual(table.age(table.find("mrcaott1ott2")), 2.0)
+        self.assertEqual(table.age(table.find("root")), 5.0)
+
+    def test_divergence_age(self):
+        """Divergence age is the age of the most recent common ancestor."""
+        table = DatedTreeTable.from_newick("((ott1:2,ott2:2)mrcaott1ott2:3,ott3:4)root;")
+        self.assertEqual(table.divergence_age("ott1", "ott2"), 2.0)
+        self.assertEqual(table.divergence_age("ott1", "ott3"), 5.0)
+        self.assertIsNone(table.divergence_age("ott1", "ott9"))
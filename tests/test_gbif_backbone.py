@@ -0,0 +1,76 @@
+"""Tests for eggcyc.gbif_backbone using the fixture dump."""
+
+import os
+import tempfile
+import unittest
+
+from eggcyc.gbif_backbone import GbifBackbone
+
+DUMP_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "gbif_backbone")
+
+
+class TestGbifBackbone(unittest.TestCase):
+    """Tests for GbifBackbone."""
+
+    def setUp(self):
+        """Import fixture dump into a temporary index."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.index_filename = os.path.join(self.tmp_dir.name, "backbone.sqlite")
+        self.backbone = GbifBackbone(DUMP_DIR, index_filename=self.index_filename)
+
+    def tearDown(self):
+        """Close index and remove temporary directory."""
+        self.backbone.close()
+        self.tmp_dir.cleanup()
+
+    def test_match_accepted(self):
+        """Canonical name matches accepted taxon with classification."""
+        gbif = self.backbone.match("Acer negundo")
+        self.assertEqual(gbif["usage"]["key"], "3189866")
+        self.assertEqual(gbif["diagnostics"]["matchType"], "EXACT")
+        self.assertEqual(gbif["diagnostics"]["status"], "ACCEPTED")
+        self.assertEqual([(r["rank"], r["name"], r["key"]) for r in gbif["classification"]],
+                         [("KINGDOM", "Plantae", "6"),
+                          ("PHYLUM", "Tracheophyta", "7707728"),
+                          ("CLASS", "Magnoliopsida", "220"),
+                          ("ORDER", "Sapindales", "933"),
+                          ("FAMILY", "Sapindaceae", "6657"),
+                          ("GENUS", "Acer", "3189834"),
+                          ("SPECIES", "Acer negundo", "3189866")])
+
+    def test_match_synonym(self):
+        """Synonym is resolved to the accepted taxon."""
+        gbif = self.backbone.match("Negundo aceroides")
+        self.assertEqual(gbif["usage"]["key"], "3189866")
+        self.assertEqual(gbif["usage"]["canonicalName"], "Acer negundo")
+        self.assertEqual(gbif["diagnostics"]["status"], "SYNONYM")
+        self.assertEqual(gbif["diagnostics"]["matchedSynonym"], "Negundo aceroides")
+        self.assertEqual(gbif["classification"][-1]["name"], "Acer negundo")
+
+    def test_match_authorship(self):
+        """Name with authorship picks that taxon, without prefers accepted."""
+        self.assertEqual(self.backbone.match("Quercus rubra Du Roi")["usage"]["key"], "8265417")
+        gbif = self.backbone.match("Quercus rubra")
+        self.assertEqual(gbif["usage"]["key"], "2880539")
+        self.assertNotIn("note", gbif["diagnostics"])
+
+    def test_match_rank_and_none(self):
+        """Match is restricted to rank, and no match has matchType NONE."""
+        self.assertEqual(self.backbone.match("Acer")["diagnostics"]["matchType"], "NONE")
+        self.assertEqual(self.backbone.match("Acer", rank="GENUS")["usage"]["key"], "3189834")
+        self.assertEqual(self.backbone.match("Acer rubrum"), {"diagnostics": {"matchType": "NONE"}})
+
+    def test_vernacular_name(self):
+        """English vernacular names match en and eng, other languages don't."""
+        self.assertEqual(self.backbone.vernacular_name(3189834), "maple")
+        self.assertEqual(self.backbone.vernacular_name(3189866), "box elder")
+        self.assertEqual(self.backbone.vernacular_name(3189834, language="de"), "Ahorn")
+        self.assertIsNone(self.backbone.vernacular_name(933))
+
+    def test_index_reused(self):
+        """Index is reused while the dump is unchanged."""
+        self.backbone.close()
+        mtime = os.stat(self.index_filename).st_mtime_ns
+        self.backbone = GbifBackbone(DUMP_DIR, index_filename=self.index_filename)
+        self.assertEqual(os.stat(self.index_filename).st_mtime_ns, mtime)
+        self.assertEqual(self.backbone.vernacular_name(2880539), "northern red oak")
@@ -0,0 +1,58 @@
+"""Tests for eggcyc.induced_tree."""
+
+import os
+import tempfile
+import unittest
+
+from eggcyc.induced_tree import InducedTreeCache
+from eggcyc.phylogeny import Phylogeny
+
+NEWICK = ("((Quercus_rubra_ott791115:1,Quercus_kelloggii_ott403375:1)mrcaott403375ott791115:2,"
+          "Acer_negundo_ott948925:3)Eudicots_ott431495;")
+
+
+class TestInducedTreeCache(unittest.TestCase):
+    """Tests for InducedTreeCache."""
+
+    def setUp(self):
+        """Cache file in a temporary directory with one tree."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp_dir.name, "induced_tree_cache.json")
+        InducedTreeCache(self.filename).put("opentree15.1", [948925, 791115, 403375], NEWICK)
+        self.cache = InducedTreeCache(self.filename)
+
+    def tearDown(self):
+        """Remove temporary directory."""
+        self.tmp_dir.cleanup()
+
+    def test_exact_hit(self):
+        """The same set of ids in any order gets the cached tree."""
+        self.assertEqual(self.cache.get("opentree15.1", [791115, 403375, 948925]), NEWICK)
+
+    def test_subset_pruned(self):
+        """A subset of the ids is answered by pruning the cached tree."""
+        newick = self.cache.get("opentree15.1", [791115, 948925])
+        tree = Phylogeny.from_newick(newick)
+        self.assertEqual(sorted(tree.label(node) for node in range(len(tree)) if tree.is_tip(node)),
+                         ["Acer negundo ott948925", "Quercus rubra ott791115"])
+        self.assertEqual(tree.branch_length(tree.find("Quercus rubra ott791115")), 3.0)
+
+    def test_not_cached(self):
+        """A superset of the ids or a new synthesis version is not cached."""
+        self.assertIsNone(self.cache.get("opentree15.1", [791115, 403375, 948925, 1]))
+        self.assertIsNone(self.cache.get("opentree16.0", [791115, 403375, 948925]))
+
+    def test_max_entries(self):
+        """Putting a tree for a new synthesis keeps the most recent entries."""
+        cache = InducedTreeCache(self.filename, max_entries=1)
+        cache.put("opentree16.0", [791115], "Quercus_rubra_ott791115;")
+        cache = InducedTreeCache(self.filename)
+        self.assertEqual([entry["synth_id"] for entry in cache.entries], ["opentree16.0"])
+        self.assertIsNone(cache.get("opentree15.1", [791115]))
+
+    def test_ott_id_of(self):
+        """OTT ids are taken from name_and_id labels but not mrca labels."""
+        self.assertEqual(InducedTreeCache.ott_id_of("Quercus rubra ott791115"), 791115)
+        self.assertIsNone(InducedTreeCache.ott_id_of("mrcaott403375ott791115"))
+        self.assertIsNone(InducedTreeCache.ott_id_of("Quercus"))
+        self.assertIsNone(InducedTreeCache.ott_id_of(None))
@@ -0,0 +1,95 @@
+"""Tests for eggcyc.lookup run against a local stub server."""
+
+import time
+import unittest
+
+import requests
+
+from eggcyc.lookup import LookupEngine, RateLimiter
+
+from .stub_server import StubServer
+
+
+class TestLookupEngine(unittest.TestCase):
+    """Tests for LookupEngine and RateLimiter."""
+
+    def setUp(self):
+        """Start stub server."""
+        self.server = StubServer()
+        self.server.start()
+
+    def tearDown(self):
+        """Stop stub server."""
+        self.server.stop()
+
+    def get(self, item):
+        """Lookup function that gets /item from the stub server."""
+        response = requests.get(self.server.url + "/" + item, timeout=5)
+        response.raise_for_status()
+        return response.json()
+
+    def test_concurrency_limit(self):
+        """Lookups run concurrently up to max_workers."""
+        for i in range(8):
+            self.server.add("/%d" % i, (200, {"n": i}, 0.2))
+        engine = LookupEngine(max_workers=4, rate_limiter=RateLimiter(default_rate=None))
+        start = time.monotonic()
+        results = engine.run([str(i) for i in range(8)], self.get, host=self.server.host)
+        self.assertLess(time.monotonic() - start, 1.2)
+        self.assertEqual(self.server.max_active, 4)
+        self.assertEqual(results, {str(i): {"n": i} for i in range(8)})
+
+    def test_merge_order(self):
+        """Results are in item order whatever order lookups finish in."""
+        items = ["a", "b", "c", "d"]
+        for i, item in enumerate(items):
+            self.server.add("/" + item, (200, [item], 0.4 - 0.1 * i))
+        engine = LookupEngine(max_workers=4, rate_limiter=RateLimiter(default_rate=None))
+        results = engine.run(items, self.get, host=self.server.host)
+        self.assertEqual(list(results), items)
+        self.assertEqual(list(results.values()), [[item] for item in items])
+
+    def test_retry_transient(self):
+        """429 and 5xx responses are retried with backoff."""
+        self.server.add("/flaky", (429, {}, 0), (503, {}, 0), (200, {"ok": True}, 0))
+        engine = LookupEngine(max_workers=1, rate_limiter=RateLimiter(default_rate=None), retries=3, backoff=0.1)
+        start = time.monotonic()
+        results = engine.run(["flaky"], self.get, host=self.server.host)
+        self.assertEqual(results, {"flaky": {"ok": True}})
+        self.assertEqual(len(self.server.requests_for("/flaky")), 3)
+        self.assertGreaterEqual(time.monotonic() - start, 0.3)  # 0.1 + 0.2 backoff
+
+    def test_retries_exhausted(self):
+        """The last exception is returned when all attempts fail."""
+        self.server.add("/down", (500, {}, 0))
+        engine = LookupEngine(max_workers=1, rate_limiter=RateLimiter(default_rate=None), retries=2, backoff=0.01)
+        results = engine.run(["down"], self.get, host=self.server.host)
+        self.assertIsInstance(results["down"], requests.exceptions.HTTPError)
+        self.assertEqual(len(self.server.requests_for("/down")), 3)
+
+    def test_no_retry_permanent(self):
+        """Other errors are not retried and don't affect other items."""
+        self.server.add("/good", (200, ["good"], 0))
+        engine = LookupEngine(max_workers=2, rate_limiter=RateLimiter(default_rate=None), backoff=0.01)
+        results = engine.run(["missing", "good"], self.get, host=self.server.host)
+        self.assertIsInstance(results["missing"], requests.exceptions.HTTPError)
+        self.assertEqual(results["good"], ["good"])
+        self.assertEqual(len(self.server.requests_for("/missing")), 1)
+
+    def test_rate_limit(self):
+        """Calls to one host are spaced by the rate limit."""
+        for i in range(5):
+            self.server.add("/%d" % i, (200, i, 0))
+        engine = LookupEngine(max_workers=5, rate_limiter=RateLimiter(rates={self.server.host: 20.0}))
+        start = time.monotonic()
+        engine.run([str(i) for i in range(5)], self.get, host=self.server.host)
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)  # 4 gaps of 0.05s
+
+    def test_rate_limit_per_host(self):
+        """Hosts are rate limited independently."""
+        limiter = RateLimiter(rates={"slow": 1.0}, default_rate=None)
+        limiter.wait("slow")
+        start = time.monotonic()
+        limiter.wait("fast")
+        limiter.wait("fast")
+        self.assertLess(time.monotonic() - start, 0.5)
@@ -0,0 +1,73 @@
+"""Tests for eggcyc.phylogeny."""
+
+import unittest
+
+from eggcyc.phylogeny import Phylogeny
+
+
+class TestPhylogeny(unittest.TestCase):
+    """Tests for Phylogeny."""
+
+    def labels(self, tree):
+        """Labels of all nodes in pre-order."""
+        return [tree.label(node) for node in range(len(tree))]
+
+    def test_newick_round_trip(self):
+        """Quoted, underscore and plain labels survive a round trip."""
+        for newick in ("((A:1.0,B:2.0)C:3.0,D:4.0)E;",
+                       "(Acer_negundo,'Quercus_rubra ott791115','it''s (odd): [x]')root;",
+                       "((,),);"):
+            with self.subTest(newick=newick):
+                self.assertEqual(Phylogeny.from_newick(newick).to_newick(), newick)
+
+    def test_newick_labels(self):
+        """Underscores in unquoted labels are spaces, quoted labels are taken as is."""
+        tree = Phylogeny.from_newick("(Acer_negundo:1,'Quercus_rubra':2,'it''s':3)'a b';")
+        self.assertEqual(self.labels(tree), ["a b", "Acer negundo", "Quercus_rubra", "it's"])
+        self.assertEqual(tree.to_newick(), "(Acer_negundo:1.0,'Quercus_rubra':2.0,'it''s':3.0)a_b;")
+
+    def test_newick_comments_and_whitespace(self):
+        """Comments and whitespace between tokens are skipped."""
+        tree = Phylogeny.from_newick("( A [tip]:1 ,\n B:2[&&NHX:x=1] ) C [root];")
+        self.assertEqual(self.labels(tree), ["C", "A", "B"])
+        self.assertEqual([tree.branch_length(node) for node in range(3)], [None, 1.0, 2.0])
+
+    def test_newick_errors(self):
+        """Malformed strings raise ValueError."""
+        for newick in ("(A,B));", "((A,B);", "(A:x,B);", "(A[,B);", "('A,B);", "A,B;"):
+            with self.subTest(newick=newick):
+                with self.assertRaises(ValueError):
+                    Phylogeny.from_newick(newick)
+
+    def test_deep_tree(self):
+        """Trees much deeper than the recursion limit are parsed and written."""
+        depth = 20000
+        newick = "(" * depth + "A:1.0" + "):1.0" * depth + ";"
+        tree = Phylogeny.from_newick(newick)
+        self.assertEqual(len(tree), depth + 1)
+        self.assertEqual(tree.levels()[tree.find("A")], depth)
+        self.assertEqual(tree.heights()[0], depth)
+        self.assertEqual(tree.to_newick(), newick)
+
+    def test_mrca_and_subtree(self):
+        """Most recent common ancestor and subtree copy."""
+        tree = Phylogeny.from_newick("((A:1,B:2)C:3,D:4)E;")
+        self.assertEqual(tree.label(tree.mrca([tree.find("A"), tree.find("B")])), "C")
+        self.assertEqual(tree.label(tree.mrca([tree.find("A"), tree.find("D")])), "E")
+        self.assertEqual(tree.subtree(tree.find("C")).to_newick(), "(A:1.0,B:2.0)C:3.0;")
+
+    def test_prune_merges_branch_lengths(self):
+        """Nodes left with one child are removed and their branch lengths added to the child."""
+        tree = Phylogeny.from_newick("(((A:1,B:2)C:3,D:4)E:5,F:6)G;")
+        pruned = tree.prune([tree.find("A"), tree.find("F")])
+        self.assertEqual(pruned.to_newick(), "(A:9.0,F:6.0)G;")
+        pruned = tree.prune(iter([tree.find("A"), tree.find("D"), tree.find("F")]))
+        self.assertEqual(pruned.to_newick(), "((A:4.0,D:4.0)E:5.0,F:6.0)G;")
+
+    def test_prune_keeps_original_single_child(self):
+        """Nodes with a single child in the original tree, and kept nodes, are not removed."""
+        tree = Phylogeny.from_newick("(((A:1)C:3,B:2)E:5,F:6)G;")
+        self.assertEqual(tree.prune([tree.find("A"), tree.find("F")]).to_newick(),
+                         "((A:1.0)C:8.0,F:6.0)G;")
+        self.assertEqual(tree.prune([tree.find("E"), tree.find("A"), tree.find("F")]).to_newick(),
+                         "(((A:1.0)C:3.0)E:5.0,F:6.0)G;")
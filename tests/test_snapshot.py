@@ -0,0 +1,79 @@
+"""Tests for eggcyc.snapshot."""
+
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from eggcyc import snapshot
+from eggcyc.snapshot import JsonSnapshot
+
+
+class TestJsonSnapshot(unittest.TestCase):
+    """Tests for JsonSnapshot."""
+
+    def setUp(self):
+        """JSON file in a temporary directory last modified an hour ago."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.json_filename = os.path.join(self.tmp_dir.name, "data.json")
+        self.write({"Acer negundo": {"common_name": "Boxelder"}, "Quercus rubra": {"ott_id": 791115}},
+                   time.time() - 3600)
+
+    def tearDown(self):
+        """Remove temporary directory."""
+        self.tmp_dir.cleanup()
+
+    def write(self, data, mtime):
+        """Write data to the JSON file and set its modification time."""
+        with open(self.json_filename, "w", encoding="utf-8") as fh:
+            json.dump(data, fh)
+        os.utime(self.json_filename, (mtime, mtime))
+
+    def open(self):
+        """Open snapshot, returns (snapshot, number of compiles, number of files hashed)."""
+        with mock.patch.object(JsonSnapshot, "compile", autospec=True, side_effect=JsonSnapshot.compile) as compile_, \
+                mock.patch.object(snapshot, "file_sha256", wraps=snapshot.file_sha256) as file_sha256:
+            snap = JsonSnapshot(self.json_filename)
+        return snap, compile_.call_count, file_sha256.call_count
+
+    def test_mapping(self):
+        """Entries are read from the snapshot in the order of the JSON file."""
+        snap = self.open()[0]
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir.name, "data.snapshot")))
+        self.assertEqual(list(snap), ["Acer negundo", "Quercus rubra"])
+        self.assertEqual(snap["Acer negundo"], {"common_name": "Boxelder"})
+        self.assertIs(snap["Acer negundo"], snap["Acer negundo"])
+        self.assertIn("Quercus rubra", snap)
+        self.assertNotIn("Acer rubrum", snap)
+
+    def test_unchanged_not_read(self):
+        """With unchanged stat the JSON file is neither hashed nor compiled again."""
+        self.assertEqual(self.open()[1:], (1, 0))
+        self.assertEqual(self.open()[1:], (0, 0))
+
+    def test_changed_invalidates(self):
+        """Changed content, even of the same size, compiles the snapshot again."""
+        self.open()
+        self.write({"Acer negundo": {"common_name": "Boxelderz"}, "Quercus rubra": {"ott_id": 791115}},
+                   time.time() - 1800)
+        snap, compiles, _ = self.open()
+        self.assertEqual(compiles, 1)
+        self.assertEqual(snap["Acer negundo"], {"common_name": "Boxelderz"})
+        self.assertEqual(self.open()[1:], (0, 0))
+
+    def test_touched_uses_hash(self):
+        """Unchanged content with a new mtime is checked by hash, not compiled again."""
+        self.open()
+        os.utime(self.json_filename, (time.time() - 1800, time.time() - 1800))
+        snap, compiles, hashes = self.open()
+        self.assertEqual((compiles, hashes), (0, 1))
+        self.assertEqual(snap["Quercus rubra"], {"ott_id": 791115})
+        self.assertEqual(self.open()[1:], (0, 0))
+
+    def test_recently_modified_hashed(self):
+        """The stat of a JSON file modified in the last few seconds isn't trusted."""
+        os.utime(self.json_filename, (time.time(), time.time()))
+        self.assertEqual(self.open()[1:], (1, 0))
+        self.assertEqual(self.open()[1:], (0, 1))
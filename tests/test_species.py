@@ -0,0 +1,66 @@
+"""Tests for eggcyc.species."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from eggcyc.species import Species
+from eggcyc.trees import Trees
+
+PROCESSED = os.path.join(os.path.dirname(os.path.dirname(__file__)), "trees_processed.json")
+
+
+class TestSpecies(unittest.TestCase):
+    """Tests for Species."""
+
+    CLASSIFICATION = [{"key": "7", "name": "Testaceae", "rank": "FAMILY"},
+                      {"key": "8", "name": "Testus", "rank": "GENUS"}]
+
+    def test_mapping(self):
+        """Species reads and writes like its JSON shape, tracking changes."""
+        sp = Species.from_json({"common_name": "Boxelder", "gbif_classification": self.CLASSIFICATION,
+                                "note": "x"}, dirty=False)
+        self.assertEqual(sp.to_json(), {"common_name": "Boxelder", "gbif_classification": self.CLASSIFICATION,
+                                        "note": "x"})
+        self.assertFalse(sp.dirty)
+        del sp["note"]
+        self.assertTrue(sp.dirty)
+        self.assertNotIn("note", sp)
+        with self.assertRaises(KeyError):
+            sp["ott_id"]  # pylint: disable=pointless-statement
+
+    def test_taxa_shared(self):
+        """Species with the same taxon share it only through the same intern table."""
+        taxa = {}
+        a = Species.from_json({"gbif_classification": self.CLASSIFICATION}, taxa=taxa)
+        b = Species.from_json({"gbif_classification": self.CLASSIFICATION}, taxa=taxa)
+        c = Species.from_json({"gbif_classification": self.CLASSIFICATION})
+        self.assertIs(a.classification[0], b.classification[0])
+        self.assertIsNot(a.classification[0], c.classification[0])
+        self.assertEqual(a.classification, c.classification)
+        self.assertEqual(len(taxa), 2)
+
+    def test_trees_taxa(self):
+        """Species loaded into a Trees object share taxa through its own intern table."""
+        trees = Trees()
+        trees.load_tree_list(PROCESSED)
+        kingdoms = set(id(trees.classification(species)[0]) for species in trees.trees
+                       if trees.classification(species) is not None)
+        self.assertEqual(len(kingdoms), 1)
+        self.assertIn(("KINGDOM", "Plantae", "6"), trees.taxa)
+        self.assertEqual(Trees().taxa, {})
+
+    def test_round_trip(self):
+        """Loading and writing trees_processed.json, directly or via a snapshot, is byte-identical."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "trees_processed.json")
+            shutil.copyfile(PROCESSED, filename)
+            for snapshot in (False, True, True):
+                with self.subTest(snapshot=snapshot):
+                    trees = Trees()
+                    trees.load_tree_list(filename, snapshot=snapshot)
+                    out = os.path.join(tmp_dir, "out.json")
+                    trees.write_tree_list(out)
+                    with open(PROCESSED, "rb") as fh1, open(out, "rb") as fh2:
+                        self.assertEqual(fh1.read(), fh2.read())
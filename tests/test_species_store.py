@@ -0,0 +1,68 @@
+"""Tests for eggcyc.species_store."""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from eggcyc.species import Species
+from eggcyc.species_store import SpeciesStore
+from eggcyc.trees import Trees
+
+
+class TestSpeciesStore(unittest.TestCase):
+    """Tests for SpeciesStore and Trees.write_store()."""
+
+    def setUp(self):
+        """Store in a temporary directory with two species."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = SpeciesStore(os.path.join(self.tmp_dir.name, "trees_processed.sqlite"))
+        self.store.commit({"Acer negundo": {"common_name": "Boxelder", "ott_id": 948925},
+                           "Quercus rubra": {"common_name": "Northern red oak"}})
+
+    def tearDown(self):
+        """Close store and remove temporary directory."""
+        self.store.close()
+        self.tmp_dir.cleanup()
+
+    def test_get(self):
+        """Single records are read by name."""
+        self.assertEqual(self.store.get("Acer negundo"), {"common_name": "Boxelder", "ott_id": 948925})
+        self.assertIsNone(self.store.get("Acer rubrum"))
+        self.assertEqual(self.store.names(), ["Acer negundo", "Quercus rubra"])
+        self.assertEqual(len(self.store), 2)
+
+    def test_commit(self):
+        """Only the changed and removed species given are written."""
+        self.assertEqual(self.store.commit({"Acer rubrum": {"common_name": "Red maple"}}, ["Quercus rubra"]), 2)
+        self.assertEqual(self.store.names(), ["Acer negundo", "Acer rubrum"])
+
+    def test_write_store_dirty_only(self):
+        """Trees.write_store() writes only changed species."""
+        trees = Trees()
+        trees.load_store(self.store)
+        trees.trees["Acer negundo"]["ott_id"] = 1
+        trees.record_provenance("Quercus rubra", "ott_id", "test")
+        with mock.patch.object(SpeciesStore, "serialize", wraps=SpeciesStore.serialize) as serialize:
+            self.assertEqual(trees.write_store(self.store), 2)
+            self.assertEqual(serialize.call_count, 2)
+            self.assertEqual(trees.write_store(self.store), 0)
+        self.assertEqual(self.store.get("Acer negundo")["ott_id"], 1)
+        self.assertEqual(self.store.get("Quercus rubra")["provenance"]["ott_id"]["source"], "test")
+
+    def test_write_store_added_removed(self):
+        """New species are written and species no longer present removed."""
+        trees = Trees()
+        trees.load_store(self.store)
+        del trees.trees["Quercus rubra"]
+        trees.trees["Acer rubrum"] = Species.from_json({"common_name": "Red maple"})
+        self.assertEqual(trees.write_store(self.store), 2)
+        self.assertEqual(self.store.names(), ["Acer negundo", "Acer rubrum"])
+
+    def test_export_json(self):
+        """Export is in the same format as Trees.write_tree_list()."""
+        filename = os.path.join(self.tmp_dir.name, "trees_processed.json")
+        self.store.export_json(filename)
+        with open(filename, "r", encoding="utf-8") as fh:
+            self.assertEqual(json.load(fh), self.store.load_all())
@@ -0,0 +1,53 @@
+"""Tests for eggcyc.tree_render."""
+
+import unittest
+
+from eggcyc.phylogeny import Phylogeny
+from eggcyc.species import Species
+from eggcyc.tree_render import TreeRenderer
+from eggcyc.trees import Trees
+
+NEWICK = ("((Quercus_rubra_ott791115:1,Quercus_kelloggii_ott403375:1)mrcaott403375ott791115:2,"
+          "Acer_negundo_ott948925:3)Eudicots_ott431495;")
+
+
+class TestTreeRenderer(unittest.TestCase):
+    """Tests for TreeRenderer."""
+
+    def setUp(self):
+        """Renderer for two species with OTT ids, one with a common name."""
+        trees = Trees()
+        trees.trees = {"Quercus rubra": Species.from_json({"ott_id": 791115, "common_name": "Northern red oak"}),
+                       "Acer negundo": Species.from_json({"ott_id": 948925})}
+        self.renderer = TreeRenderer(trees)
+
+    def test_split_label(self):
+        """name_and_id labels are split into name and ott_id."""
+        self.assertEqual(self.renderer.split_label("Quercus rubra ott791115"), ("Quercus rubra", 791115))
+        self.assertEqual(self.renderer.split_label("ott791115"), (None, 791115))
+        self.assertEqual(self.renderer.split_label("mrcaott403375ott791115"), (None, None))
+        self.assertEqual(self.renderer.split_label("Eudicots"), ("Eudicots", None))
+        self.assertEqual(self.renderer.split_label(None), (None, None))
+
+    def test_text_label(self):
+        """Our species get species and common name, others the taxon name."""
+        self.assertEqual(self.renderer.text_label("Quercus rubra ott791115"), "Quercus rubra (Northern red oak)")
+        self.assertEqual(self.renderer.text_label("Acer negundo ott948925"), "Acer negundo")
+        self.assertEqual(self.renderer.text_label("Quercus kelloggii ott403375"), "Quercus kelloggii")
+
+    def test_ascii(self):
+        """One line per node, unnamed internal nodes shown as +."""
+        self.assertEqual(self.renderer.ascii(Phylogeny.from_newick(NEWICK)),
+                         "Eudicots\n"
+                         "|-- +\n"
+                         "|   |-- Quercus rubra (Northern red oak)\n"
+                         "|   `-- Quercus kelloggii\n"
+                         "`-- Acer negundo\n")
+
+    def test_deep_tree(self):
+        """Trees deeper than the recursion limit are rendered."""
+        depth = 5000
+        tree = Phylogeny.from_newick("(" * depth + "Quercus_rubra_ott791115" + ")" * depth + ";")
+        lines = self.renderer.ascii(tree).splitlines()
+        self.assertEqual(len(lines), depth + 1)
+        self.assertEqual(lines[-1], "    " * (depth - 1) + "`-- Quercus rubra (Northern red oak)")
@@ -0,0 +1,58 @@
+"""Tests for eggcyc.usda."""
+
+import csv
+import gzip
+import os
+import tempfile
+import unittest
+
+from eggcyc.usda import UsdaIndex
+
+ROWS = [
+    ("Symbol", "Synonym Symbol", "Scientific Name with Author", "Common Name", "Family"),
+    ("ACNE2", "", "Acer negundo L.", "boxelder", "Aceraceae"),
+    ("ACNEN", "", "Acer negundo L. var. negundo", "boxelder", "Aceraceae"),
+    ("ACNEN", "NEAC", "Negundo aceroides (L.) Moench", "", ""),
+    ("ACCA32", "", "×Achnella caduca (Beal) Barkworth", "Mandan ricegrass", "Poaceae"),
+    ("SASEC", "", "Salix ×sepulcralis Simonk. nothovar. chrysocoma (Dode) Meikle", "golden weeping willow",
+     "Salicaceae"),
+    ("TIEU9", "", "Tilia ×europaea L.", "common linden", "Tiliaceae"),
+    ("QUAL3", "", "Quercus alba L. f. ex Kunth", "white oak", "Fagaceae"),
+]
+
+
+class TestUsdaIndex(unittest.TestCase):
+    """Tests for UsdaIndex."""
+
+    def setUp(self):
+        """Index of a small gzipped CSV in a temporary directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        csv_filename = os.path.join(self.tmp_dir.name, "usda.csv.gz")
+        with gzip.open(csv_filename, "wt", encoding="utf-8", newline="") as fh:
+            csv.writer(fh, quoting=csv.QUOTE_ALL).writerows(ROWS)
+        self.usda = UsdaIndex(csv_filename)
+
+    def tearDown(self):
+        """Close index and remove temporary directory."""
+        self.usda.close()
+        self.tmp_dir.cleanup()
+
+    def test_resolve(self):
+        """Accepted names are kept in full without authors."""
+        self.assertEqual(self.usda.resolve("Acer negundo"), ("ACNE2", "Acer negundo", "Boxelder"))
+        self.assertEqual(self.usda.resolve("Negundo aceroides"), ("ACNEN", "Acer negundo var. negundo", "Boxelder"))
+        self.assertEqual(self.usda.resolve("Salix x sepulcralis"),
+                         ("SASEC", "Salix ×sepulcralis nothovar. chrysocoma", "Golden weeping willow"))
+        self.assertEqual(self.usda.resolve("Quercus alba"), ("QUAL3", "Quercus alba", "White oak"))
+        self.assertIsNone(self.usda.resolve("Acer rubrum"))
+
+    def test_hybrids(self):
+        """Hybrid markers are normalized before lookup."""
+        self.assertEqual(self.usda.common_name("× Achnella caduca"), "Mandan ricegrass")
+        self.assertEqual(self.usda.common_name("Tilia x europaea"), "Common linden")
+
+    def test_parse_name(self):
+        """Lookup name and infraspecific rank and epithet."""
+        self.assertEqual(UsdaIndex.parse_name("Acer negundo L. var. negundo"), ("Acer negundo", "var. negundo"))
+        self.assertEqual(UsdaIndex.parse_name("Quercus alba L. f. ex Kunth"), ("Quercus alba", ""))
+        self.assertEqual(UsdaIndex.parse_name("×Achnella Barkworth"), (None, ""))
@@ -7,70 +7,29 @@ ott_id for Quercus kelloggii is 403375
 Dates:
 https://github.com/McTavishLab/jupyter_OpenTree_tutorials/blob/master/notebooks/DEMO_DatedTree.ipynb
 
-Library for Newick format strings: https://gitlab.mpcdf.mpg.de/dlce-eva/python-newick
+The client is eggcyc.dated_tree.DatedTree, see there for the API details.
 """
-import logging
-import json
-import requests
+from eggcyc.cache import ResponseCache
+from eggcyc.dated_tree import DatedTree, DatedTreeTable
 
-import newick
 
+def main():
+    """Show the dated tree for two oaks.
 
-class DatedTree():
-    """Synthetic tree of life with dated nodes.
-
-    Uses the OpenTree Chronosynth API as desceibed at
-    <https://github.com/OpenTreeOfLife/chronosynth/wiki/Draft-API-docs>.
-
-    Example call from command line:
-    >>> curl -X POST https://dates.opentreeoflife.org/v4/dates/dated_tree -d '{"node_ids":["ott791115", "ott403375"], "max_age":"180"}' | jsonpp
-    {
-        "dated_trees_newick_list": [
-            "((((((ott791115:9.834022)mrcaott316110ott791115:2.744552)mrcaott316110ott494536:2.744552)mrcaott137331ott316110:3.721832)mrcaott137331ott3930379:2.971260)mrcaott137331ott538292:157.983780,(ott403375:21.858711)mrcaott403375ott470257:158.141296)mrcaott137331ott403375:1.000000;"
-        ],
-        "topology_sources": [
-            "ot_2304@tree2",
-            "ot_1393@tree8"
-        ],
-        "date_sources": [
-            "ot_2304@tree7",
-            "ot_1393@tree8",
-            "ot_2304@tree6",
-            "ot_1957@tree1"
-        ],
-        "tar_file_download": "dates.opentreeoflife.org/v4/dates/download_dates_tar/chrono_out_02_03_2026_18_24_22.tar.gz"
-    }
+    Uses dated_tree() rather than dated_trees() so that both oaks are sure
+    to be in the same tree, divergence ages are not available between
+    taxa in different chunks. The response is cached in lookup_cache.sqlite.
     """
-
-    def __init__(self, api_endpoint="dates.opentreeoflife.org", api_version="v4"):
-        """Initialize DatedTree."""
-        self._api_endpoint = api_endpoint
-        self._api_version = api_version
-        self._api_service = "dates"
-
-    def _make_url(self, method):
-        """URL for this method."""
-        return ("https://%s/%s/%s/%s" % (self._api_endpoint, self._api_version, self._api_service, method))
-
-    def dated_tree(self, ott_ids=None, max_age=180):
-        """Dated tree for the given ids."""
-        d = {"node_ids": ott_ids, "max_age": str(max_age)}
-        data_str = json.dumps(d)
-        logging.debug("dated_tree call data: %s", data_str)
-        try:
-            ret = requests.post(self._make_url(method="dated_tree"), data=data_str, timeout=10)
-        except requests.exceptions.Timeout:
-            logging.error("Request timed out.")
-        except requests.exceptions.RequestException as e:
-            logging.error("Call error occurred: %s", str(e))
-        dret = json.loads(ret.text)
-        return dret["dated_trees_newick_list"][0]
-
-
-dated_tree = DatedTree().dated_tree(ott_ids=["ott791115", "ott403375"])
-print(dated_tree)
-trees = newick.loads(dated_tree)
-for node in trees[0].walk():
-    age = node.length
-    for desc in node.descendants:
-        print(f"{node} {age} --> {desc}")
+    client = DatedTree(response_cache=ResponseCache())
+    dated_tree = client.dated_tree(ott_ids=["ott791115", "ott403375"])
+    client.close()
+    print(dated_tree)
+    table = DatedTreeTable.from_newick(dated_tree)
+    for node in range(1, len(table)):
+        parent = table.parent[node]
+        print(f"{table.label(parent)} {table.ages[parent]} --> {table.label(node)} {table.ages[node]}")
+    print("Divergence age: %f" % table.divergence_age("ott791115", "ott403375"))
+
+
+if __name__ == "__main__":
+    main()
@@ -11,14 +11,16 @@ Examples:
 https://github.com/snacktavish/OpenTree_SSB2020/blob/master/notebooks/DEMO_OpenTree.ipynb
 """
 import argparse
-from contextlib import redirect_stdout
-import io
+from datetime import timedelta
 import logging
-import re
+import os
+import sys
 
 from opentree import OT
 
-from eggcyc import Trees, Classifications
+from eggcyc import (CacheMissError, Classifications, GbifBackbone, InducedTreeCache, LookupEngine,
+                    Phylogeny, RateLimiter, ResponseCache, SpeciesStore, Trees, TreeRenderer)
+from eggcyc.files import atomic_write
 
 
 def parse_args():
@@ -35,54 +37,153 @@ def parse_args():
                         help="generate tree")
     parser.add_argument("--classification", "-c", action="store_true",
                         help="generate classification table")
+    parser.add_argument("--retry-missing-names", action="store_true",
+                        help="with --classification, look up again higher taxa previously found to have no "
+                             "common name, not using cached responses")
+    parser.add_argument("--max-age", type=float, default=None,
+                        help="with --lookup, fetch again any looked up data older than this many days")
+    parser.add_argument("--refresh", "-r", action="append", default=[],
+                        help="with --lookup, fetch again data for a field (common_name, ott_id, gbif_id), "
+                             "a species, or species:field (repeatable)")
+    parser.add_argument("--cache", default="lookup_cache.sqlite",
+                        help="file to cache web service responses in, empty to not cache")
+    parser.add_argument("--cache-ttl", type=float, default=30.0,
+                        help="days before cached web service responses are fetched again")
+    parser.add_argument("--cache-size", type=float, default=100.0,
+                        help="maximum size of web service response cache in MB")
+    parser.add_argument("--offline", action="store_true",
+                        help="use only cached web service responses, failing if not cached")
+    parser.add_argument("--gbif-backbone", default=None,
+                        help="directory with GBIF backbone dump (Taxon.tsv, VernacularName.tsv) to use "
+                             "instead of GBIF API lookups")
+    parser.add_argument("--store", default=None,
+                        help="SQLite species store to use for processed data instead of trees_processed.json "
+                             "(created from trees_processed.json if it doesn't exist)")
+    parser.add_argument("--export-json", action="store_true",
+                        help="with --store, export the store to trees_processed.json (done automatically "
+                             "when a lookup changes the store)")
+    parser.add_argument("--workers", "-w", type=int, default=8,
+                        help="maximum number of concurrent web service lookups")
+    parser.add_argument("--rate", type=float, default=10.0,
+                        help="maximum web service calls per second to each host")
+    parser.add_argument("--retries", type=int, default=3,
+                        help="number of retries for failed web service calls")
     args = parser.parse_args()
     return args
 
 
+def load_processed(store=None):
+    """Load processed tree data from store if given, else trees_processed.json.
+
+    Arguments:
+        store (SpeciesStore) - species store, optional.
+
+    Returns:
+        Trees - processed tree data.
+    """
+    if store is None:
+        return Trees(filename="trees_processed.json")
+    trees = Trees()
+    trees.load_store(store)
+    return trees
+
+
+def induced_tree_newick(ott_ids, cache):
+    """Induced tree from the Open Tree synthetic tree for ott_ids.
+
+    The synthesis version is cached for a day so that an unchanged catalog
+    needs no calls, after that it is fetched again so that a new synthesis
+    is noticed. Trees are kept in an InducedTreeCache.
+
+    Arguments:
+        ott_ids (list) - OTT ids of the tips.
+        cache (ResponseCache) - cache for the synthesis version, in offline
+            mode no calls are made.
+
+    Returns:
+        str or None - Newick tree, None if offline and not cached.
+    """
+    induced_tree_cache = InducedTreeCache()
+    try:
+        synth_id = cache.fetch("opentree:tree_of_life_about", {},
+                               lambda: {"synth_id": OT.ws.tree_of_life_about().response_dict["synth_id"]},
+                               max_age=86400)["synth_id"]
+    except CacheMissError:
+        if not induced_tree_cache.entries:
+            logging.error("Offline and no cached induced tree")
+            return None
+        synth_id = induced_tree_cache.entries[0]["synth_id"]
+    newick = induced_tree_cache.get(synth_id, ott_ids)
+    if newick is None:
+        if cache.offline:
+            logging.error("Offline and no cached induced tree for synthesis %s", synth_id)
+            return None
+        newick = OT.synth_induced_tree(ott_ids=ott_ids, label_format="name_and_id").response_dict["newick"]
+        induced_tree_cache.put(synth_id, ott_ids, newick)
+    return newick
+
+
 def main():
     """CLI handler."""
     args = parse_args()
 
-    if args.lookup or args.lookup_all:
-        trees = Trees(filename="trees.json")
-        trees.expand_crosses()
-        if args.lookup:
-            trees_processed = Trees(filename="trees_processed.json")
-            trees.merge_data_from(trees_processed)
-        trees.lookup_common_names()
-        trees.lookup_ott_ids()
-        trees.lookup_gbif_ids()
-        if args.lookup and trees.trees == trees_processed.trees:
-            logging.info("No new data, not updating trees_processed.json")
+    engine = LookupEngine(max_workers=args.workers,
+                          rate_limiter=RateLimiter(default_rate=args.rate),
+                          retries=args.retries)
+    cache = ResponseCache(filename=args.cache or None,
+                          ttl=args.cache_ttl * 86400,
+                          max_bytes=int(args.cache_size * 1024 * 1024),
+                          offline=args.offline)
+    store = None
+    if args.store:
+        store_exists = os.path.exists(args.store)
+        store = SpeciesStore(args.store)
+        if not store_exists:
+            Trees(filename="trees_processed.json").write_store(store)
+    backbone = GbifBackbone(args.gbif_backbone) if args.gbif_backbone else None
+    try:
+        if args.lookup or args.lookup_all:
+            max_age = timedelta(days=args.max_age) if args.max_age is not None else None
+            trees = Trees(filename="trees.json", lookup_engine=engine, max_age=max_age, refresh=args.refresh,
+                          response_cache=cache, gbif_backbone=backbone)
+            trees.expand_crosses()
+            if args.lookup:
+                trees_processed = load_processed(store)
+                trees.merge_data_from(trees_processed)
+            trees.lookup_common_names()
+            trees.lookup_ott_ids()
+            trees.lookup_gbif_ids()
+            if args.lookup and trees.trees == trees_processed.trees:
+                logging.info("No new data, not updating processed data")
+            elif store is not None:
+                if trees.write_store(store) > 0:
+                    # Keep trees_processed.json, used by build_website.py, up to date
+                    store.export_json()
+            else:
+                trees.write_tree_list()
         else:
-            trees.write_tree_list()
-    else:
-        trees = Trees(filename="trees_processed.json")
-
-    if args.tree:
-        ott_ids = trees.extract_ott_ids()
-        # Get the synthetic tree from OpenTree
-        output = OT.synth_induced_tree(ott_ids=ott_ids, label_format='name_and_id')
-        # Get ASCII tree with labels "name (common name)"
-        # FIXME - How to get and ASCII tree without grabbing it from print_plot?
-        buf = io.StringIO()
-        with redirect_stdout(buf):
-            output.tree.print_plot(width=100)
-        t = buf.getvalue()
-        # Add common names by replacing ott ids
-        for species in trees.trees:
-            if "ott_id" not in trees.trees[species] or "common_name" not in trees.trees[species]:
-                continue
-            t = re.sub(" ott" + str(trees.trees[species]["ott_id"]) + r"\b", " (" + trees.trees[species]["common_name"] + ")", t)
-        logging.warning(t)
-        with open("trees_tree.txt", 'w', encoding="utf-8") as fh:
-            fh.write(t)
-        # treefile = "outfile.tree"
-        # output.tree.write(path = treefile, schema = "newick")
-
-    if args.classification:
-        Classifications().write_classifications_table(trees)
+            trees = load_processed(store)
+        if store is not None and args.export_json:
+            store.export_json()
+
+        if args.tree:
+            newick = induced_tree_newick(trees.extract_ott_ids(), cache)
+            if newick is None:
+                sys.exit(1)
+            tree = Phylogeny.from_newick(newick)
+            renderer = TreeRenderer(trees)
+            t = renderer.ascii(tree)
+            logging.warning(t)
+            atomic_write("trees_tree.txt", t)
 
+        if args.classification:
+            classifications = Classifications(response_cache=cache, gbif_backbone=backbone, lookup_engine=engine)
+            classifications.write_classifications_table(trees, retry_missing=args.retry_missing_names)
+    finally:
+        logging.info("Lookups: %s", cache.stats())
+        cache.close()
+        if store is not None:
+            store.close()
 
 if __name__ == "__main__":
     main()